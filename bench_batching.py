@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark of micro-batched synthesis: throughput and latency of concurrent requests run one
+by one against the same requests batched by the scheduler, on a small randomly initialized
+XTTS on CPU
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+
+from TTS.tts.configs.xtts_config import XttsConfig
+from TTS.tts.layers.xtts.tokenizer import VoiceBpeTokenizer
+from TTS.tts.models.xtts import Xtts
+
+from xtts_api_server.batch_inference import generate_batch
+from xtts_api_server.scheduler import InferenceScheduler, RealtimeFactor
+from xtts_api_server.tts_funcs import default_tts_settings
+
+# Configuration
+REQUESTS = 32
+ARRIVAL_RATE = 20.0 # Requests per second, exponential inter-arrival times
+BATCH_SIZE = 8
+BATCH_WINDOW = 0.01 # Seconds
+MAX_AUDIO_TOKENS = 60 # A random model rarely stops on its own, every line runs this long
+LINES = [
+    "Hello there.",
+    "I used to be an adventurer like you.",
+    "Then I took an arrow in the knee.",
+    "Let me guess, someone stole your sweetroll?",
+    "What is it?",
+    "Watch the skies, traveler.",
+]
+
+def build_model(folder):
+    # Character tokenizer and a two layer GPT, the layout of the real model at a fraction of the size
+    chars = list("abcdefghijklmnopqrstuvwxyz0123456789 .,!?'-") + ["[START]", "[STOP]", "[UNK]", "[SPACE]", "[en]"]
+    vocab = {char: index for index, char in enumerate(chars)}
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Split("", "isolated")
+    tokenizer.save(os.path.join(folder, "vocab.json"))
+
+    config = XttsConfig()
+    config.model_args.gpt_layers = 2
+    config.model_args.gpt_n_model_channels = 64
+    config.model_args.gpt_n_heads = 2
+    config.model_args.gpt_number_text_tokens = len(vocab) + 2
+    config.model_args.gpt_start_text_token = len(vocab)
+    config.model_args.gpt_stop_text_token = len(vocab) + 1
+    config.model_args.gpt_num_audio_tokens = 66
+    config.model_args.gpt_start_audio_token = 64
+    config.model_args.gpt_stop_audio_token = 65
+    config.model_args.gpt_max_audio_tokens = MAX_AUDIO_TOKENS
+    config.model_args.gpt_use_perceiver_resampler = True
+    config.model_args.decoder_input_dim = 64
+    config.model_args.gpt_code_stride_len = 1024
+    config.model_args.tokenizer_file = os.path.join(folder, "vocab.json")
+
+    torch.manual_seed(0)
+    model = Xtts.init_from_config(config)
+    model.tokenizer = VoiceBpeTokenizer(vocab_file=os.path.join(folder, "vocab.json"))
+    model.init_models()
+    # Xtts.eval sets up the GPT for inference and returns nothing
+    model.eval()
+    return model
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def run(submit, lines, arrivals):
+    """ Submits the lines at their arrival times, returns (seconds for all, latency of each). """
+    futures = []
+    finished = {}
+    start = time.monotonic()
+    for index, (line, arrival) in enumerate(zip(lines, arrivals)):
+        time.sleep(max(0.0, start + arrival - time.monotonic()))
+        submitted = time.monotonic()
+        future = submit(line)
+        future.add_done_callback(lambda _, index=index, submitted=submitted: finished.__setitem__(index, time.monotonic() - submitted))
+        futures.append(future)
+
+    for future in futures:
+        future.result()
+    return time.monotonic() - start, list(finished.values())
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else REQUESTS
+    torch.set_num_threads(max(1, os.cpu_count() // 2))
+
+    with tempfile.TemporaryDirectory() as folder:
+        model = build_model(folder)
+
+    # A few speakers, every request has its own latents
+    speakers = [(torch.randn(1, 32, 64), torch.randn(1, 512, 1)) for _ in range(4)]
+    random.seed(0)
+    lines = [(random.choice(LINES), *random.choice(speakers)) for _ in range(requests)]
+    arrivals = []
+    arrival = 0.0
+    for _ in range(requests):
+        arrival += random.expovariate(ARRIVAL_RATE)
+        arrivals.append(arrival)
+
+    def serial(line):
+        text, gpt_cond_latent, speaker_embedding = line
+        return model.inference(text, "en", gpt_cond_latent, speaker_embedding, **{**default_tts_settings, "enable_text_splitting": False})["wav"]
+
+    def batched(lines):
+        return generate_batch(model, [(text, "en", gpt_cond_latent, speaker_embedding, default_tts_settings) for text, gpt_cond_latent, speaker_embedding in lines])
+
+    # Warm up
+    serial(lines[0])
+    batched(lines[:2])
+
+    serial_scheduler = InferenceScheduler(RealtimeFactor(), max_queued=requests)
+    serial_time, serial_latencies = run(lambda line: serial_scheduler.submit("", serial, line), lines, arrivals)
+    batch_scheduler = InferenceScheduler(RealtimeFactor(), max_queued=requests, max_batch_size=BATCH_SIZE, batch_window=BATCH_WINDOW)
+    batch_time, batch_latencies = run(lambda line: batch_scheduler.submit_batch("", "tts", batched, line), lines, arrivals)
+
+    stats = batch_scheduler.stats()
+    print(f"{requests} requests at {ARRIVAL_RATE:.0f}/s, batches of up to {BATCH_SIZE} ({stats['avg_batch_size']:.1f} on average), {BATCH_WINDOW * 1e3:.0f} ms window")
+    print(f"{'':12} {'throughput':>12} {'p50':>10} {'p99':>10}")
+    for name, total, latencies in (("serial", serial_time, serial_latencies), ("batched", batch_time, batch_latencies)):
+        print(f"{name:12} {requests / total:8.2f} r/s {percentile(latencies, 0.5) * 1e3:7.0f} ms {percentile(latencies, 0.99) * 1e3:7.0f} ms")
+
+if __name__ == "__main__":
+    main()
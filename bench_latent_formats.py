@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Benchmark of latent file size and load time, legacy JSON against the binary format
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+import torch
+
+from xtts_api_server.latent_funcs import LATENT_EXTENSION, save_latents, load_latents, load_latents_json
+
+# Configuration
+SPEAKERS = 1000
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+def main():
+    speakers = int(sys.argv[1]) if len(sys.argv) > 1 else SPEAKERS
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        json_dir = os.path.join(work_dir, "json")
+        binary_dir = os.path.join(work_dir, "binary")
+        os.makedirs(json_dir)
+        os.makedirs(binary_dir)
+
+        # Same shapes as XTTS v2 produces
+        for i in range(speakers):
+            tensors = {
+                "gpt_cond_latent": torch.randn(1, 32, 1024),
+                "speaker_embedding": torch.randn(1, 512, 1)
+            }
+            with open(os.path.join(json_dir, f"speaker_{i}.json"), 'w') as json_file:
+                json.dump({name: tensor.tolist() for name, tensor in tensors.items()}, json_file)
+            save_latents(os.path.join(binary_dir, f"speaker_{i}{LATENT_EXTENSION}"), tensors, {"model_version": "v2.0.2"})
+
+        start = time.perf_counter()
+        for file in os.listdir(json_dir):
+            load_latents_json(os.path.join(json_dir, file))
+        json_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for file in os.listdir(binary_dir):
+            load_latents(os.path.join(binary_dir, file))
+        binary_elapsed = time.perf_counter() - start
+
+        print(f"{speakers} speakers")
+        print(f"JSON:   {folder_size(json_dir) / 1024 ** 2:8.1f} MB, load {json_elapsed:7.2f} s")
+        print(f"Binary: {folder_size(binary_dir) / 1024 ** 2:8.1f} MB, load {binary_elapsed:7.2f} s")
+        print(f"Load speedup: {json_elapsed / binary_elapsed:.1f}x")
+
+if __name__ == "__main__":
+    main()
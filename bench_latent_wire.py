@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the latent wire formats of /create_latents and /store_latents: request size and
+server CPU time of the JSON lists against the binary (safetensors layout) body
+"""
+
+import json
+import sys
+import time
+
+import torch
+from pydantic import BaseModel
+
+from xtts_api_server.latent_funcs import encode_latents, decode_latents
+
+# Configuration
+ROUNDS = 50
+
+# Same model as the server, importing the server would load the TTS model
+class StoreLatentsRequest(BaseModel):
+    speaker_name: str
+    language: str
+    latents: dict
+
+def cpu_time(fn, rounds):
+    start = time.process_time()
+    for _ in range(rounds):
+        result = fn()
+    return (time.process_time() - start) / rounds, result
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else ROUNDS
+
+    # Same shapes as XTTS v2 produces
+    gpt_cond_latent = torch.randn(1, 32, 1024)
+    speaker_embedding = torch.randn(1, 512, 1)
+
+    # /create_latents response, what the server does after computing the latents
+    def encode_json():
+        return json.dumps({"message": "Latents created successfully", "latents": {
+            "gpt_cond_latent": gpt_cond_latent.cpu().half().tolist(),
+            "speaker_embedding": speaker_embedding.cpu().half().tolist()
+        }}).encode("utf-8")
+
+    def encode_binary():
+        return encode_latents({"gpt_cond_latent": gpt_cond_latent, "speaker_embedding": speaker_embedding}, {"model_version": "v2.0.2"})
+
+    json_encode_time, json_response = cpu_time(encode_json, rounds)
+    binary_encode_time, binary_response = cpu_time(encode_binary, rounds)
+
+    # /store_latents request, parsing and validation up to the tensors that are written
+    json_body = json.dumps({"speaker_name": "lydia", "language": "en", "latents": json.loads(json_response)["latents"]}).encode("utf-8")
+
+    def decode_json():
+        store_req = StoreLatentsRequest(**json.loads(json_body))
+        return torch.tensor(store_req.latents["gpt_cond_latent"]), torch.tensor(store_req.latents["speaker_embedding"])
+
+    def decode_binary():
+        tensors, _ = decode_latents(binary_response)
+        return tensors["gpt_cond_latent"], tensors["speaker_embedding"]
+
+    json_decode_time, _ = cpu_time(decode_json, rounds)
+    binary_decode_time, _ = cpu_time(decode_binary, rounds)
+
+    print(f"{'':16} {'JSON':>12} {'binary':>12} {'ratio':>8}")
+    print(f"{'create size':16} {len(json_response) / 1024:9.1f} KB {len(binary_response) / 1024:9.1f} KB {len(json_response) / len(binary_response):7.1f}x")
+    print(f"{'create cpu':16} {json_encode_time * 1e3:9.2f} ms {binary_encode_time * 1e3:9.2f} ms {json_encode_time / binary_encode_time:7.1f}x")
+    print(f"{'store size':16} {len(json_body) / 1024:9.1f} KB {len(binary_response) / 1024:9.1f} KB {len(json_body) / len(binary_response):7.1f}x")
+    print(f"{'store cpu':16} {json_decode_time * 1e3:9.2f} ms {binary_decode_time * 1e3:9.2f} ms {json_decode_time / binary_decode_time:7.1f}x")
+
+if __name__ == "__main__":
+    main()
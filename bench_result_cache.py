@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the result cache index: hit latency should stay flat as the cache grows
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from xtts_api_server.cache_funcs import AudioCache, make_cache_key
+
+# Configuration
+SIZES = [10, 1000, 100000, 1000000]
+LOOKUPS = 10000
+
+def make_params(i):
+    return {
+        'text': f"Line number {i}, spoken by a guard.",
+        'speaker': "femalenord",
+        'language': "en",
+        'accent': "en",
+        'tts_settings': {"temperature": 0.75, "speed": 1},
+        'model_version': "v2.0.2"
+    }
+
+def bench_size(size, work_dir):
+    """Fill a fresh cache with `size` entries and time `LOOKUPS` hits"""
+    result_file = os.path.join(work_dir, "result.wav")
+    with open(result_file, 'wb') as f:
+        f.write(b"\0" * 44)
+
+    cache = AudioCache(os.path.join(work_dir, f"cache_{size}"), max_bytes=1024 ** 4)
+
+    insert_start = time.perf_counter()
+    for i in range(size):
+        params = make_params(i)
+        cache.put(make_cache_key(params), params, result_file)
+    insert_elapsed = time.perf_counter() - insert_start
+
+    # Keys are computed up front so only the lookup itself is timed
+    keys = [make_cache_key(make_params(i * 7919 % size)) for i in range(LOOKUPS)]
+    lookup_start = time.perf_counter()
+    for key in keys:
+        assert cache.get(key) is not None
+    lookup_elapsed = time.perf_counter() - lookup_start
+
+    print(f"{size:>9} entries | insert {insert_elapsed / size * 1e6:8.2f} us/entry | hit {lookup_elapsed / LOOKUPS * 1e6:8.2f} us/lookup")
+
+def main():
+    sizes = [int(s) for s in sys.argv[1:]] or SIZES
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            bench_size(size, work_dir)
+
+if __name__ == "__main__":
+    main()
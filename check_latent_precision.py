@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Quality check of the latent precisions: synthesizes the same line with fp32, fp16 and int8
+latents of a speaker and compares the audio against the fp32 output
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+
+import torch
+import torchaudio
+
+from TTS.tts.configs.xtts_config import XttsConfig
+from TTS.tts.models.xtts import Xtts
+
+from xtts_api_server.latent_funcs import LATENT_PRECISIONS, latents_nbytes, quantize_tensor, dequantize_tensor
+
+# Configuration
+TEXT = "I used to be an adventurer like you, then I took an arrow in the knee."
+LIBRARY_SIZE = 5000 # Voices the memory figures are given for
+
+def load_model(model_folder, version, device):
+    # Same as TTSWrapper.load_local_model
+    config = XttsConfig()
+    config.load_json(str(Path(model_folder) / version / "config.json"))
+    model = Xtts.init_from_config(config)
+    model.load_checkpoint(config, checkpoint_dir=str(Path(model_folder) / version))
+    return model.to(device)
+
+def synthesize(model, text, language, gpt_cond_latent, speaker_embedding):
+    # Greedy decoding, differences come from the latents and not from sampling
+    out = model.inference(text, language, gpt_cond_latent, speaker_embedding, do_sample=False, enable_text_splitting=True)
+    return torch.as_tensor(out["wav"]).float().cpu()
+
+def log_mel(wav, mel):
+    return torch.log10(mel(wav).clamp(min=1e-5)) * 10
+
+def main():
+    parser = ArgumentParser(description="Compare synthesis with quantized latents against fp32 latents.")
+    parser.add_argument("wav_file", nargs="+", help="Reference audio of the speaker")
+    parser.add_argument("-mf", "--model-folder", default="xtts_models/")
+    parser.add_argument("-v", "--version", default="v2.0.2")
+    parser.add_argument("-d", "--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("-l", "--language", default="en")
+    parser.add_argument("-t", "--text", default=TEXT)
+    args = parser.parse_args()
+
+    model = load_model(args.model_folder, args.version, args.device)
+    latents = model.get_conditioning_latents(args.wav_file if len(args.wav_file) > 1 else args.wav_file[0])
+    mel = torchaudio.transforms.MelSpectrogram(sample_rate=24000, n_fft=1024, hop_length=256, n_mels=80)
+
+    reference = None
+    print(f"{'precision':10} {'bytes':>8} {'latent err':>11} {'mel L1 dB':>10} {'speaker sim':>12} {'length':>8} {f'{LIBRARY_SIZE} voices':>14}")
+    for precision in LATENT_PRECISIONS:
+        compact = [quantize_tensor(tensor, precision) for tensor in latents]
+        restored = [dequantize_tensor(data, scale).to(args.device) for data, scale in compact]
+        latent_error = max(((tensor - original).norm() / original.norm()).item() for tensor, original in zip(restored, latents))
+
+        wav = synthesize(model, args.text, args.language, *restored)
+        if reference is None:
+            reference = wav
+        # Compared over the common length, a different length shows up in its own column
+        length = min(wav.shape[0], reference.shape[0])
+        mel_error = (log_mel(wav[:length], mel) - log_mel(reference[:length], mel)).abs().mean().item()
+        similarity = torch.nn.functional.cosine_similarity(
+            model.get_speaker_embedding(wav.unsqueeze(0), 24000).flatten(),
+            model.get_speaker_embedding(reference.unsqueeze(0), 24000).flatten(), dim=0).item()
+
+        nbytes = latents_nbytes(compact)
+        print(f"{precision:10} {nbytes:8d} {latent_error:11.2e} {mel_error:10.3f} {similarity:12.4f} {wav.shape[0] / 24000:7.2f}s {nbytes * LIBRARY_SIZE / 1024 ** 2:11.1f} MB")
+
+if __name__ == "__main__":
+    main()
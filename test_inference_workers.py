@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Test of synthesis on more than one inference worker: two requests for different speakers run
+at the same time must each get the audio they get when run alone. Runs a small randomly
+initialized XTTS on CPU, see bench_batching.py
+"""
+
+import os
+import tempfile
+
+import torch
+import torchaudio
+
+from bench_batching import build_model
+from xtts_api_server.scheduler import InferenceScheduler
+from xtts_api_server.tts_funcs import TTSWrapper
+
+LINES = [("guard", "Watch the skies, traveler."), ("merchant", "Let me guess, someone stole your sweetroll?")]
+
+def test_two_workers_match_serial():
+    with tempfile.TemporaryDirectory() as folder:
+        tts = TTSWrapper(output_folder=os.path.join(folder, "output"), speaker_folder=os.path.join(folder, "speakers"),
+                         latent_speaker_folder=os.path.join(folder, "latents"), model_folder=os.path.join(folder, "models"),
+                         device="cpu", enable_cache_results=False)
+        tts.model = build_model(folder)
+        torch.manual_seed(1)
+        for speaker_name, _ in LINES:
+            tts.store_latents(speaker_name, "en", torch.randn(1, 32, 64), torch.randn(1, 512, 1))
+        # top_k 1 makes the sampling deterministic, the outputs can be compared
+        params = tts.synthesis_params(top_k=1, enable_text_splitting=False)
+
+        def synthesize(scheduler, run):
+            futures = [scheduler.submit(text, tts.process_tts_to_file, text, speaker_name, "en", file_name_or_path=f"{run}_{speaker_name}.wav", params=params)
+                       for speaker_name, text in LINES]
+            return [torchaudio.load(future.result(timeout=600))[0] for future in futures]
+
+        expected = synthesize(InferenceScheduler(tts.realtime_factor, workers=1), "serial")
+        concurrent = synthesize(InferenceScheduler(tts.realtime_factor, workers=2), "concurrent")
+        for (speaker_name, _), wav, expected_wav in zip(LINES, concurrent, expected):
+            assert torch.equal(wav, expected_wav), f"{speaker_name} sounds different when synthesized next to another request"
+
+if __name__ == "__main__":
+    test_two_workers_match_serial()
+    print("ok")
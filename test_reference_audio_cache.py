@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Test of the reference audio cache: latents computed from a cached reference file, cold and
+warm, must match Xtts.get_conditioning_latents on the same file. Runs a small randomly
+initialized XTTS on CPU, see bench_batching.py
+"""
+
+import math
+import os
+import tempfile
+
+import torch
+import torchaudio
+
+from bench_batching import build_model
+from xtts_api_server.tts_funcs import TTSWrapper
+
+def make_reference(file_path, seconds=8, sample_rate=24000):
+    # A few tones and some noise, long enough for more than one gpt conditioning chunk
+    torch.manual_seed(1)
+    t = torch.arange(seconds * sample_rate) / sample_rate
+    wav = sum(0.2 * torch.sin(2 * math.pi * frequency * t) for frequency in (180, 440, 1250)) + 0.05 * torch.randn_like(t)
+    torchaudio.save(file_path, wav.unsqueeze(0), sample_rate)
+
+def test_cached_latents_match_model():
+    with tempfile.TemporaryDirectory() as folder:
+        model = build_model(folder)
+        tts = TTSWrapper(output_folder=os.path.join(folder, "output"), speaker_folder=os.path.join(folder, "speakers"),
+                         latent_speaker_folder=os.path.join(folder, "latents"), model_folder=os.path.join(folder, "models"),
+                         device="cpu", enable_cache_results=False)
+        tts.model = model
+        reference = os.path.join(folder, "reference.wav")
+        make_reference(reference)
+
+        expected_gpt, expected_speaker = model.get_conditioning_latents(audio_path=reference)
+        for attempt in ("miss", "hit"):
+            [(gpt_cond_latent, speaker_embedding)] = tts.get_conditioning_latents_batch([tts.prepare_reference_audio(reference)])
+            assert torch.allclose(gpt_cond_latent, expected_gpt, rtol=1e-6, atol=1e-6), f"gpt latents differ on a cache {attempt}"
+            assert torch.allclose(speaker_embedding, expected_speaker, rtol=1e-6, atol=1e-6), f"speaker embedding differs on a cache {attempt}"
+        assert tts.reference_audio.misses == 1 and tts.reference_audio.hits == 1
+
+if __name__ == "__main__":
+    test_cached_latents_match_model()
+    print("ok")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Test of shared streams: a generation shared by identical /tts_stream requests runs as long as
+one of them listens, and stops once all went away, also those that never read a chunk
+"""
+
+import asyncio
+import gc
+
+from xtts_api_server.single_flight import SingleFlight
+
+def make_source(events):
+    """ A start function for SingleFlight.stream, an endless stream that records when it is closed. """
+    def start():
+        async def chunks():
+            try:
+                while True:
+                    await asyncio.sleep(0.01)
+                    yield b"chunk"
+            finally:
+                events.append("closed")
+        return chunks()
+    return start
+
+async def dropped_unread():
+    flight = SingleFlight()
+    events = []
+    follower = flight.stream("key", make_source(events))
+    task = flight.streams["key"]["task"]
+    await asyncio.sleep(0.05)
+
+    # The response never started, the follower is dropped without being iterated
+    del follower
+    gc.collect()
+    await asyncio.sleep(0.05)
+    assert task.cancelled(), "the generation kept running for nobody"
+    assert events == ["closed"]
+    assert not flight.streams
+
+async def closed_unread_with_listener_left():
+    flight = SingleFlight()
+    events = []
+    first = flight.stream("key", make_source(events))
+    second = flight.stream("key", make_source(events))
+    assert await second.__anext__() == b"chunk"
+
+    # Closing a follower that was never read leaves the generation to the one still listening
+    await first.aclose()
+    await asyncio.sleep(0.05)
+    assert not flight.streams["key"]["task"].done()
+    assert await second.__anext__() == b"chunk"
+
+    await second.aclose()
+    await asyncio.sleep(0.05)
+    assert events == ["closed"] and not flight.streams
+
+def test_dropped_unread_follower_stops_generation():
+    asyncio.run(dropped_unread())
+
+def test_closed_unread_follower_keeps_shared_generation():
+    asyncio.run(closed_unread_with_listener_left())
+
+if __name__ == "__main__":
+    test_dropped_unread_follower_stops_generation()
+    test_closed_unread_follower_keeps_shared_generation()
+    print("ok")
@@ -65,7 +65,7 @@ def ask_questions_and_create_config():
     port = prompt_user_input("Port to bind", "This is the port on which the server will listen.", "8020")
     device = prompt_user_input("Device (cpu/cuda)", "Choose 'cuda' for GPU usage or 'cpu' for CPU. Note: Using CUDA will consume up to 3 GB of GPU VRAM.", "cuda")
     speaker_folder = prompt_user_input("Speaker folder", "Folder containing speaker samples.", "speakers/")
-    latent_speaker_folder = prompt_user_input("Latent speaker folder", "Folder containing latent speaker JSON data.", "latent_speaker_folder/")
+    latent_speaker_folder = prompt_user_input("Latent speaker folder", "Folder containing latent speaker data.", "latent_speaker_folder/")
     output = prompt_user_input("Output folder", "Folder where generated audio will be saved.", "output/")
     model_folder = prompt_user_input("Model folder", "Folder where models for XTTS will be stored.", "xtts_models/")
     version = prompt_user_input("Model version", "Specify which version of XTTS to use.", "v2.0.2")
@@ -123,13 +123,28 @@ def main():
     parser.add_argument("-p", "--port", type=int, help="Port to bind")
     parser.add_argument("-d", "--device", help="Device that will be used (cpu/cuda)")
     parser.add_argument("-sf", "--speaker-folder", help="The folder where you get the samples for tts")
-    parser.add_argument("-lsf", "--latent-speaker-folder", help="The folder where you get the latent in json format")
+    parser.add_argument("-lsf", "--latent-speaker-folder", help="The folder where the speaker latents are stored")
     parser.add_argument("-o", "--output", help="Output folder")
     parser.add_argument("-mf", "--model-folder", help="The place where models for XTTS will be stored.")
     parser.add_argument("-v", "--version", help="You can specify which version of xtts to use or specify your own model")
     parser.add_argument("--listen", action='store_true', help="Allow server to listen externally.")
     parser.add_argument("--lowvram", action='store_true', help="Enable low vram mode")
     parser.add_argument("--deepspeed", action='store_true', help="Enable DeepSpeed mode")
+    parser.add_argument("--use-cache", action='store_true', help="Enables caching of results, repeated requests are served from the cache")
+    parser.add_argument("--cache-max-size", type=int, help="Disk budget of the results cache in megabytes")
+    parser.add_argument("--cache-policy", choices=["lru", "lfu"], help="Eviction policy of the results cache")
+    parser.add_argument("--sentence-cache", action='store_true', help="Cache audio per sentence and reuse it in new lines that contain the same sentences")
+    parser.add_argument("--cache-memory-size", type=int, help="Size of the in-memory tier of the results cache in megabytes")
+    parser.add_argument("--latent-cache-size", type=int, help="Memory budget for resident speaker latents in megabytes, per device")
+    parser.add_argument("--gpt-cond-len", type=int, help="Seconds of reference audio used for the gpt latents (default 6)")
+    parser.add_argument("--max-ref-length", type=int, help="Seconds used of each reference file (default 30)")
+    parser.add_argument("--reference-trim-db", type=int, help="Trim silence quieter than this many dB below the peak from reference audio, off by default")
+    parser.add_argument("--inference-workers", type=int, help="Threads running synthesis (default 1)")
+    parser.add_argument("--queue-size", type=int, help="Synthesis requests that can wait for a worker, more are answered with 429 (default 32)")
+    parser.add_argument("--batch-size", type=int, help="Synthesis requests that arrive together are run as one batch of up to this many (default 1, no batching)")
+    parser.add_argument("--batch-window", type=float, help="Milliseconds a worker waits for more requests to batch with (default 10)")
+    parser.add_argument("--speaker-poll-interval", type=float, help="Seconds between checks of the speaker, latent and model folders for changes (default 2, 0 disables it)")
+    parser.add_argument("--latent-precision", choices=["fp32", "fp16", "int8"], help="Precision of stored and resident speaker latents, int8 fits about 4 times more voices than fp32")
     args = parser.parse_args()
 
     # Load config.ini
@@ -151,6 +166,21 @@ def main():
     listen = args.listen or (config.getboolean('DEFAULT', 'Listen', fallback=False) if config else False)
     lowvram = args.lowvram or (config.getboolean('DEFAULT', 'LowVRAM', fallback=False) if config else False)
     deepspeed = args.deepspeed or (config.getboolean('DEFAULT', 'DeepSpeed', fallback=False) if config else False)
+    use_cache = args.use_cache or (config.getboolean('DEFAULT', 'UseCache', fallback=False) if config else False)
+    cache_max_size = get_value_from_sources(args.cache_max_size, config.getint('DEFAULT', 'CacheMaxSize', fallback=None) if config else None, 2048)
+    sentence_cache = args.sentence_cache or (config.getboolean('DEFAULT', 'SentenceCache', fallback=False) if config else False)
+    cache_memory_size = get_value_from_sources(args.cache_memory_size, config.getint('DEFAULT', 'CacheMemorySize', fallback=None) if config else None, 256)
+    latent_cache_size = get_value_from_sources(args.latent_cache_size, config.getint('DEFAULT', 'LatentCacheSize', fallback=None) if config else None, 512)
+    latent_precision = get_value_from_sources(args.latent_precision, config.get('DEFAULT', 'LatentPrecision', fallback=None) if config else None, "fp16")
+    gpt_cond_len = get_value_from_sources(args.gpt_cond_len, config.getint('DEFAULT', 'GptCondLen', fallback=None) if config else None, 6)
+    max_ref_length = get_value_from_sources(args.max_ref_length, config.getint('DEFAULT', 'MaxRefLength', fallback=None) if config else None, 30)
+    reference_trim_db = get_value_from_sources(args.reference_trim_db, config.getint('DEFAULT', 'ReferenceTrimDb', fallback=None) if config else None, None)
+    inference_workers = get_value_from_sources(args.inference_workers, config.getint('DEFAULT', 'InferenceWorkers', fallback=None) if config else None, 1)
+    queue_size = get_value_from_sources(args.queue_size, config.getint('DEFAULT', 'QueueSize', fallback=None) if config else None, 32)
+    batch_size = get_value_from_sources(args.batch_size, config.getint('DEFAULT', 'BatchSize', fallback=None) if config else None, 1)
+    batch_window = get_value_from_sources(args.batch_window, config.getfloat('DEFAULT', 'BatchWindow', fallback=None) if config else None, 10.0)
+    speaker_poll_interval = get_value_from_sources(args.speaker_poll_interval, config.getfloat('DEFAULT', 'SpeakerPollInterval', fallback=None) if config else None, 2.0)
+    cache_policy = get_value_from_sources(args.cache_policy, config.get('DEFAULT', 'CachePolicy', fallback=None) if config else None, "lru")
 
     # Set environment variables based on the final values
     os.environ["LISTEN"] = str(listen).lower()
@@ -165,6 +195,21 @@ def main():
     os.environ['MODEL_VERSION'] = version
     os.environ['DEEPSPEED'] = str(deepspeed).lower()
     os.environ['LOWVRAM_MODE'] = str(lowvram).lower()
+    os.environ['USE_CACHE'] = str(use_cache).lower()
+    os.environ['CACHE_MAX_SIZE'] = str(cache_max_size)
+    os.environ['CACHE_POLICY'] = cache_policy
+    os.environ['CACHE_MEMORY_SIZE'] = str(cache_memory_size)
+    os.environ['SENTENCE_CACHE'] = str(sentence_cache).lower()
+    os.environ['LATENT_CACHE_SIZE'] = str(latent_cache_size)
+    os.environ['LATENT_PRECISION'] = latent_precision
+    os.environ['GPT_COND_LEN'] = str(gpt_cond_len)
+    os.environ['MAX_REF_LENGTH'] = str(max_ref_length)
+    os.environ['SPEAKER_POLL_INTERVAL'] = str(speaker_poll_interval)
+    os.environ['INFERENCE_WORKERS'] = str(inference_workers)
+    os.environ['QUEUE_SIZE'] = str(queue_size)
+    os.environ['BATCH_SIZE'] = str(batch_size)
+    os.environ['BATCH_WINDOW_MS'] = str(batch_window)
+    os.environ['REFERENCE_TRIM_DB'] = '' if reference_trim_db is None else str(reference_trim_db)
 
     # Run the uvicorn server
     from xtts_api_server.server import app
@@ -0,0 +1,136 @@
+import torch
+import torch.nn.functional as F
+from transformers import LogitsProcessor, LogitsProcessorList
+
+from TTS.tts.layers.xtts.tokenizer import split_sentence
+
+SAMPLING_SETTINGS = ("temperature", "length_penalty", "repetition_penalty", "top_k", "top_p")
+
+def split_text(model, text, language, enable_text_splitting):
+    """ Sentences of a text, split the way Xtts.inference splits it. """
+    language = language.split("-")[0]  # remove the country code
+    if enable_text_splitting:
+        return split_sentence(text, language, model.tokenizer.char_limits[language])
+    return [text]
+
+class RowSampling(LogitsProcessor):
+    """
+    Repetition penalty, temperature, top-k and top-p with a value per row of the batch, in the
+    order generate applies its own processors, for rows with different settings.
+    """
+
+    def __init__(self, settings, do_sample):
+        self.repetition_penalty = torch.tensor([row["repetition_penalty"] for row in settings]).unsqueeze(1)
+        self.temperature = torch.tensor([row["temperature"] for row in settings]).unsqueeze(1)
+        self.top_k = torch.tensor([row["top_k"] for row in settings]).unsqueeze(1)
+        self.top_p = torch.tensor([row["top_p"] for row in settings]).unsqueeze(1)
+        self.do_sample = do_sample
+
+    def __call__(self, input_ids, scores):
+        # As RepetitionPenaltyLogitsProcessor
+        penalty = self.repetition_penalty.to(scores)
+        score = torch.gather(scores, 1, input_ids)
+        score = torch.where(score < 0, score * penalty, score / penalty)
+        scores = scores.scatter(1, input_ids, score)
+        if not self.do_sample:
+            return scores
+
+        # As TemperatureLogitsWarper, TopKLogitsWarper and TopPLogitsWarper
+        scores = scores / self.temperature.to(scores)
+        top_k = self.top_k.to(scores.device).clamp(max=scores.shape[-1])
+        kth_largest = torch.sort(scores, descending=True).values.gather(1, top_k - 1)
+        scores = scores.masked_fill(scores < kth_largest, -float("inf"))
+
+        sorted_logits, sorted_indices = torch.sort(scores, descending=False)
+        cumulative_probs = sorted_logits.softmax(dim=-1).cumsum(dim=-1)
+        sorted_indices_to_remove = cumulative_probs <= (1 - self.top_p.to(scores))
+        sorted_indices_to_remove[..., -1:] = False # Keeps at least one token
+        indices_to_remove = sorted_indices_to_remove.scatter(1, sorted_indices, sorted_indices_to_remove)
+        return scores.masked_fill(indices_to_remove, -float("inf"))
+
+@torch.inference_mode()
+def generate_batch(model, rows, do_sample=True):
+    """
+    Xtts.inference for several sentences at once, returns the waveform of every row.
+
+    `rows` are (sentence, language, gpt_cond_latent, speaker_embedding, tts_settings), each
+    with its own latents and settings (the keyword arguments of Xtts.inference). The
+    autoregressive GPT stage runs as one batch: the prefixes (conditioning latents and text)
+    are left-padded to the same length and masked, so every row starts generating audio codes
+    at the same position. The transformer has no absolute positions, the padding does not
+    change what a row attends to. Each row is cut at its stop token and turned into audio on
+    its own, as Xtts.inference does.
+    """
+    gpt = model.gpt
+    device = model.device
+
+    # Settings shared by all rows go to generate itself, different ones are applied per row
+    sampling = [{name: settings[name] for name in SAMPLING_SETTINGS} for *_, settings in rows]
+    if all(row == sampling[0] for row in sampling):
+        generate_settings = {**sampling[0], "logits_processor": None}
+    else:
+        # Neutral values keep generate from adding its own processors, length_penalty only matters for beam search
+        generate_settings = {"temperature": 1.0, "length_penalty": 1.0, "repetition_penalty": 1.0, "top_k": 0, "top_p": 1.0,
+                             "logits_processor": LogitsProcessorList([RowSampling(sampling, do_sample)])}
+
+    text_tokens = []
+    prefixes = []
+    for sentence, language, gpt_cond_latent, _, _ in rows:
+        tokens = torch.IntTensor(model.tokenizer.encode(sentence.strip().lower(), lang=language.split("-")[0])).unsqueeze(0).to(device)
+        assert tokens.shape[-1] < model.args.gpt_max_text_tokens, " ❗ XTTS can only generate text with a maximum of 400 tokens."
+        text_tokens.append(tokens)
+        # Same as GPT.compute_embeddings
+        text_inputs = F.pad(F.pad(tokens, (0, 1), value=gpt.stop_text_token), (1, 0), value=gpt.start_text_token)
+        text_emb = gpt.text_embedding(text_inputs) + gpt.text_pos_embedding(text_inputs)
+        prefixes.append(torch.cat([gpt_cond_latent.to(device), text_emb], dim=1))
+
+    prefix_len = max(prefix.shape[1] for prefix in prefixes)
+    prefix_emb = prefixes[0].new_zeros(len(rows), prefix_len, prefixes[0].shape[-1])
+    # +1 for the start_audio_token
+    attention_mask = torch.zeros(len(rows), prefix_len + 1, dtype=torch.long, device=device)
+    for index, prefix in enumerate(prefixes):
+        prefix_emb[index, prefix_len - prefix.shape[1]:] = prefix[0]
+        attention_mask[index, prefix_len - prefix.shape[1]:] = 1
+    gpt.gpt_inference.store_prefix_emb(prefix_emb)
+
+    gpt_inputs = torch.full((len(rows), prefix_len + 1), fill_value=1, dtype=torch.long, device=device)
+    gpt_inputs[:, -1] = gpt.start_audio_token
+    codes = gpt.gpt_inference.generate(
+        gpt_inputs,
+        bos_token_id=gpt.start_audio_token,
+        pad_token_id=gpt.stop_audio_token,
+        eos_token_id=gpt.stop_audio_token,
+        max_length=gpt.max_gen_mel_tokens + gpt_inputs.shape[-1],
+        attention_mask=attention_mask,
+        do_sample=do_sample,
+        num_return_sequences=1,
+        num_beams=1,
+        output_attentions=False,
+        **generate_settings,
+    )[:, gpt_inputs.shape[1]:]
+
+    wavs = []
+    for (_, _, gpt_cond_latent, speaker_embedding, settings), tokens, row_codes in zip(rows, text_tokens, codes):
+        # Up to and including the first stop token, what a generation of its own returns
+        stops = (row_codes == gpt.stop_audio_token).nonzero()
+        if len(stops):
+            row_codes = row_codes[: stops[0, 0] + 1]
+        row_codes = row_codes.unsqueeze(0)
+
+        gpt_cond_latent = gpt_cond_latent.to(device)
+        expected_output_len = torch.tensor([row_codes.shape[-1] * gpt.code_stride_len], device=device)
+        text_len = torch.tensor([tokens.shape[-1]], device=device)
+        gpt_latents = gpt(
+            tokens,
+            text_len,
+            row_codes,
+            expected_output_len,
+            cond_latents=gpt_cond_latent,
+            return_attentions=False,
+            return_latent=True,
+        )
+        length_scale = 1.0 / max(settings.get("speed", 1.0), 0.05)
+        if length_scale != 1.0:
+            gpt_latents = F.interpolate(gpt_latents.transpose(1, 2), scale_factor=length_scale, mode="linear").transpose(1, 2)
+        wavs.append(model.hifigan_decoder(gpt_latents, g=speaker_embedding.to(device)).cpu().squeeze())
+    return wavs
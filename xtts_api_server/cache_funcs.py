@@ -0,0 +1,407 @@
+# cache_funcs.py
+
+from loguru import logger
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+cache_policies = ["lru", "lfu"]
+
+
+def make_cache_key(params):
+    """ Returns a stable hash of the canonical request parameters. """
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """
+    Persistent cache of generated audio keyed by the hash of the canonical request.
+
+    Files live in sharded hash-prefix directories (`ab/cd/abcd...wav`) and are indexed in a
+    SQLite database next to them, so the cache survives restarts. The index is mirrored in
+    memory for constant time lookups. When the total size goes over `max_bytes`, entries are
+    evicted by least recent (lru) or least frequent (lfu) use.
+    """
+
+    def __init__(self, cache_folder, max_bytes=2 * 1024 ** 3, policy="lru"):
+        if policy not in cache_policies:
+            raise ValueError(f"Cache policy must be one of {cache_policies}")
+
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.policy = policy
+
+        self.index = {}  # key -> (file_path, size)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.pending_access = {}  # key -> (last_access, hits) not yet written to the index
+        self.last_flush = time.time()
+        self.lock = threading.RLock()
+
+        os.makedirs(cache_folder, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_folder, "index.sqlite3"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                file_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                params TEXT
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_hits ON entries (hits, last_access)")
+        self.db.commit()
+
+        self.load_index()
+        self.evict()
+
+    def load_index(self):
+        missing = []
+        for key, file_path, size in self.db.execute("SELECT key, file_path, size FROM entries"):
+            if os.path.exists(file_path):
+                self.index[key] = (file_path, size)
+                self.total_bytes += size
+            else:
+                missing.append((key,))
+
+        # Rows whose files were removed by hand, or lost in a crash before the rename
+        if missing:
+            self.db.executemany("DELETE FROM entries WHERE key = ?", missing)
+            self.db.commit()
+
+        # Leftovers of writes that never completed
+        for root, dirs, files in os.walk(self.cache_folder):
+            for file in files:
+                if file.endswith(".tmp.wav"):
+                    os.unlink(os.path.join(root, file))
+
+        logger.info(f"Audio cache loaded: {len(self.index)} entries, {self.total_bytes / 1024 ** 2:.1f} MB, dropped {len(missing)} missing files.")
+
+    def path_for(self, key):
+        return os.path.join(self.cache_folder, key[:2], key[2:4], f"{key}.wav")
+
+    def temp_path(self, key):
+        """ A unique path in the entry's shard, for generating straight into the cache. """
+        shard = os.path.dirname(self.path_for(key))
+        os.makedirs(shard, exist_ok=True)
+        # Keep the .wav extension, torchaudio picks the format from it
+        return os.path.join(shard, f"{key}.{uuid.uuid4().hex}.tmp.wav")
+
+    def get(self, key, record_miss=True):
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                self.misses += record_miss
+                return None
+
+            file_path, size = entry
+            if not os.path.exists(file_path):
+                self._remove(key)
+                self.db.commit()
+                self.misses += record_miss
+                return None
+
+            self.hits += 1
+            # Access statistics only matter for eviction, they are written in batches
+            now = time.time()
+            self.pending_access[key] = (now, self.pending_access.get(key, (0, 0))[1] + 1)
+            if now - self.last_flush > 10:
+                self.flush_access()
+            return file_path
+
+    def flush_access(self):
+        with self.lock:
+            self.last_flush = time.time()
+            if not self.pending_access:
+                return
+            self.db.executemany(
+                "UPDATE entries SET last_access = ?, hits = hits + ? WHERE key = ?",
+                [(last_access, hits, key) for key, (last_access, hits) in self.pending_access.items()])
+            self.db.commit()
+            self.pending_access.clear()
+
+    def put(self, key, params, source_path, move=False):
+        """
+        Stores `source_path` under `key` and returns the cached path.
+
+        The file is first written to a temporary name in the shard and then renamed, so a
+        reader never sees a partially written file.
+        """
+        file_path = self.path_for(key)
+        if move and os.path.dirname(os.path.abspath(source_path)) == os.path.dirname(os.path.abspath(file_path)):
+            temp_path = source_path
+        else:
+            temp_path = self.temp_path(key)
+            if move:
+                shutil.move(source_path, temp_path)
+            else:
+                shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, file_path)
+
+        size = os.path.getsize(file_path)
+        now = time.time()
+        with self.lock:
+            if key in self.index:
+                self.total_bytes -= self.index[key][1]
+            self.index[key] = (file_path, size)
+            self.total_bytes += size
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries (key, file_path, size, created, last_access, hits, params) VALUES (?, ?, ?, ?, ?, 0, ?)",
+                (key, file_path, size, now, now, json.dumps(params, ensure_ascii=False)))
+            self.db.commit()
+            self.evict(keep=key)
+        return file_path
+
+    def _remove(self, key):
+        file_path, size = self.index.pop(key)
+        self.pending_access.pop(key, None)
+        self.total_bytes -= size
+        self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        try:
+            os.unlink(file_path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self, max_bytes=None, keys=None, keep=None):
+        """
+        Removes the given keys, or evicts by policy until the cache fits in `max_bytes`.
+        Returns the number of entries removed.
+        """
+        with self.lock:
+            self.flush_access()
+            removed = 0
+            if keys is not None:
+                for key in keys:
+                    if key in self.index:
+                        self._remove(key)
+                        removed += 1
+            else:
+                budget = self.max_bytes if max_bytes is None else max_bytes
+                order = "last_access" if self.policy == "lru" else "hits, last_access"
+                while self.total_bytes > budget:
+                    victims = [row[0] for row in self.db.execute(
+                        f"SELECT key FROM entries ORDER BY {order} LIMIT 64") if row[0] != keep]
+                    if not victims:
+                        break
+                    for key in victims:
+                        if self.total_bytes <= budget:
+                            break
+                        if key in self.index:
+                            self._remove(key)
+                            removed += 1
+                        else:
+                            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.db.commit()
+            self.evictions += removed
+            if removed:
+                logger.info(f"Evicted {removed} entries from the audio cache.")
+            return removed
+
+    def entries(self, offset=0, limit=100):
+        with self.lock:
+            self.flush_access()
+            rows = self.db.execute(
+                "SELECT key, file_path, size, created, last_access, hits, params FROM entries ORDER BY last_access DESC LIMIT ? OFFSET ?",
+                (limit, offset)).fetchall()
+        return [{
+            'key': key,
+            'file_path': file_path,
+            'size': size,
+            'created': created,
+            'last_access': last_access,
+            'hits': hits,
+            'params': json.loads(params) if params else None
+        } for key, file_path, size, created, last_access, hits, params in rows]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.index),
+                'total_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'policy': self.policy,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
+    def __len__(self):
+        return len(self.index)
+
+
+class HotCache:
+    """
+    Bounded in-memory tier in front of AudioCache, holding encoded WAV bytes.
+
+    Entries are promoted here when they are hit on disk and evicted least recently used
+    once the total size goes over `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> wav bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            audio = self.entries.get(key)
+            if audio is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return audio
+
+    def put(self, key, audio):
+        # An entry bigger than the whole tier would only flush everything else out
+        if len(audio) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= len(self.entries.pop(key))
+            self.entries[key] = audio
+            self.total_bytes += len(audio)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+                self.evictions += 1
+
+    def remove(self, keys=None):
+        """ Drops the given keys, or everything when no keys are given. """
+        with self.lock:
+            if keys is None:
+                self.entries.clear()
+                self.total_bytes = 0
+                return
+            for key in keys:
+                if key in self.entries:
+                    self.total_bytes -= len(self.entries.pop(key))
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'total_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
+
+class ReferenceAudioCache:
+    """
+    Preprocessed reference audio, keyed by the content hash of the source file and the
+    preprocessing settings.
+
+    Latents are computed from the same reference files again and again: on rebuilds, for other
+    languages, after a settings change. Each file is decoded, resampled, cut and trimmed once by
+    the `preprocess` function handed to `get`, then kept as float32 samples in `<key>.npz` along
+    with the time that took, which every later hit adds to `seconds_saved`. The samples are
+    stored as they are, latents from a cached file match the ones from the file itself.
+    """
+
+    def __init__(self, cache_folder, settings):
+        self.cache_folder = cache_folder
+        self.settings = settings
+        self.hashes = {}  # path -> {"size", "mtime_ns", "sha256"}, files are hashed again only when they change
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self.lock = threading.Lock()
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def key_for(self, sha256):
+        return make_cache_key({"sha256": sha256, **self.settings})
+
+    def file_key(self, file_path):
+        stat = os.stat(file_path)
+        path = os.path.abspath(file_path)
+        known = self.hashes.get(path)
+        if known is None or known["size"] != stat.st_size or known["mtime_ns"] != stat.st_mtime_ns:
+            digest = hashlib.sha256()
+            with open(file_path, "rb") as source_file:
+                for block in iter(lambda: source_file.read(1024 * 1024), b""):
+                    digest.update(block)
+            known = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+            self.hashes[path] = known
+        return self.key_for(known["sha256"])
+
+    def get(self, file_path, preprocess):
+        """ Samples of a reference file as a float32 array, from the cache or from `preprocess(file_path)`. """
+        key = self.file_key(file_path)
+        cache_path = os.path.join(self.cache_folder, f"{key}.npz")
+        start = time.perf_counter()
+        try:
+            with np.load(cache_path) as cached:
+                samples = cached["audio"]
+                decode_seconds = float(cached["decode_seconds"])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Cached reference audio {cache_path} is damaged ({e}), it will be decoded again.")
+        else:
+            # Entries of older versions hold 16-bit samples, those are decoded again at full precision
+            if samples.dtype == np.float32:
+                with self.lock:
+                    self.hits += 1
+                    self.seconds_saved += max(0.0, decode_seconds - (time.perf_counter() - start))
+                return samples
+
+        samples = preprocess(file_path)
+        decode_seconds = time.perf_counter() - start
+        samples = np.ascontiguousarray(samples, dtype=np.float32)
+        temp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as cache_file:
+            np.savez(cache_file, audio=samples, decode_seconds=np.float64(decode_seconds))
+        os.replace(temp_path, cache_path)
+        with self.lock:
+            self.misses += 1
+        return samples
+
+    def prune(self, keep):
+        """ Removes the entries whose keys are not in `keep`, returns how many. """
+        removed = 0
+        for file_name in os.listdir(self.cache_folder):
+            key, extension = os.path.splitext(file_name)
+            if extension == ".npz" and key not in keep:
+                os.unlink(os.path.join(self.cache_folder, file_name))
+                removed += 1
+        return removed
+
+    def stats(self):
+        files = [entry for entry in os.scandir(self.cache_folder) if entry.name.endswith(".npz")]
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(files),
+                'total_bytes': sum(entry.stat().st_size for entry in files),
+                'settings': dict(self.settings),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'seconds_saved': round(self.seconds_saved, 3)
+            }
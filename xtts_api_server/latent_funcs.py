@@ -0,0 +1,847 @@
+# latent_funcs.py
+
+import torch
+import numpy as np
+
+from loguru import logger
+import hashlib
+import io
+import json
+import mmap
+import os
+import shutil
+import struct
+import tarfile
+import threading
+import uuid
+from collections import OrderedDict
+
+# Latents are written in the safetensors layout: an 8 byte little-endian header size, a JSON
+# header with dtype, shape and data offsets of every tensor, then the raw tensor data.
+# Files can be read with the safetensors library but do not need it.
+LATENT_EXTENSION = ".safetensors"
+LATENT_FORMAT_VERSION = "1"
+
+numpy_dtypes = {
+    "F32": np.dtype("<f4"),
+    "F16": np.dtype("<f2"),
+    "I8": np.dtype("i1"),
+}
+dtype_names = {dtype: name for name, dtype in numpy_dtypes.items()}
+
+
+def encode_latents(tensors, metadata=None, dtype="F16"):
+    """
+    Serializes a dict of tensors to bytes.
+
+    Floating point tensors are stored as `dtype`, or as they are when it is None. Integer
+    tensors keep their own type.
+    """
+    header = {"__metadata__": {"format_version": LATENT_FORMAT_VERSION, **(metadata or {})}}
+    buffers = []
+    offset = 0
+    for name, tensor in tensors.items():
+        array = tensor.detach().cpu().numpy() if isinstance(tensor, torch.Tensor) else np.asarray(tensor)
+        if array.dtype.kind == "f" and dtype is not None:
+            array = array.astype(numpy_dtypes[dtype])
+        array = np.ascontiguousarray(array)
+        data = array.tobytes()
+        header[name] = {
+            "dtype": dtype_names[array.dtype],
+            "shape": list(array.shape),
+            "data_offsets": [offset, offset + len(data)]
+        }
+        buffers.append(data)
+        offset += len(data)
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    # Pad the header so the data starts 8 byte aligned
+    header_bytes += b" " * (-len(header_bytes) % 8)
+    return struct.pack("<Q", len(header_bytes)) + header_bytes + b"".join(buffers)
+
+
+def decode_header(buffer):
+    """ Returns the header dict and the offset where tensor data starts. """
+    (header_size,) = struct.unpack_from("<Q", buffer, 0)
+    header = json.loads(bytes(buffer[8:8 + header_size]).decode("utf-8"))
+    return header, 8 + header_size
+
+
+def decode_latents(buffer):
+    """ Parses bytes produced by `encode_latents`, returns (tensors, metadata). """
+    header, data_start = decode_header(buffer)
+    metadata = header.pop("__metadata__", {})
+    tensors = {}
+    for name, info in header.items():
+        begin, end = info["data_offsets"]
+        array = np.frombuffer(buffer, dtype=numpy_dtypes[info["dtype"]], count=(end - begin) // numpy_dtypes[info["dtype"]].itemsize, offset=data_start + begin)
+        tensors[name] = torch.from_numpy(array.reshape(info["shape"]).copy())
+    return tensors, metadata
+
+
+def save_latents(file_path, tensors, metadata=None, dtype="F16"):
+    """ Writes the tensors atomically, readers never see a half written file. """
+    # A temp file of its own, concurrent writes of the same latents must not share one
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, "wb") as latent_file:
+            latent_file.write(encode_latents(tensors, metadata, dtype))
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def load_latents(file_path):
+    with open(file_path, "rb") as latent_file:
+        return decode_latents(latent_file.read())
+
+
+def load_latents_metadata(file_path):
+    """ Reads only the header metadata of a latent file, not the tensors. """
+    with open(file_path, "rb") as latent_file:
+        (header_size,) = struct.unpack("<Q", latent_file.read(8))
+        header = json.loads(latent_file.read(header_size).decode("utf-8"))
+    return header.get("__metadata__", {})
+
+
+# Precisions latents are kept in, on disk and in memory. int8 stores one fp32 scale per channel
+# (the last dimension, the 1024 features of gpt_cond_latent) next to the tensor as "<name>.scale".
+LATENT_PRECISIONS = ("fp32", "fp16", "int8")
+SCALE_SUFFIX = ".scale"
+
+
+def quantize_tensor(tensor, precision):
+    """ Compact form of a float tensor, returns (data, scale), scale is None unless int8. """
+    if precision == "fp32":
+        return tensor.float(), None
+    if precision == "fp16":
+        return tensor.half(), None
+    if precision != "int8":
+        raise ValueError(f"Unknown latent precision '{precision}'")
+    tensor = tensor.float()
+    # Symmetric, the largest magnitude of every channel maps to 127
+    reduce_dims = tuple(range(tensor.dim() - 1))
+    amax = tensor.abs().amax(dim=reduce_dims, keepdim=True) if reduce_dims else tensor.abs()
+    scale = (amax / 127).clamp(min=torch.finfo(torch.float32).tiny)
+    return torch.round(tensor / scale).clamp(-127, 127).to(torch.int8), scale
+
+
+def dequantize_tensor(data, scale=None, dtype=torch.float32):
+    if scale is None:
+        return data.to(dtype)
+    return (data.to(torch.float32) * scale.to(data.device, torch.float32)).to(dtype)
+
+
+def quantize_latents(tensors, precision):
+    """ Stored form of a dict of latent tensors, int8 adds a "<name>.scale" tensor per tensor. """
+    stored = {}
+    for name, tensor in tensors.items():
+        data, scale = quantize_tensor(tensor, precision)
+        stored[name] = data
+        if scale is not None:
+            stored[name + SCALE_SUFFIX] = scale
+    return stored
+
+
+def dequantize_latents(tensors, dtype=torch.float32):
+    """ Float tensors from any stored form, the inverse of `quantize_latents`. """
+    return {
+        name: dequantize_tensor(tensor, tensors.get(name + SCALE_SUFFIX), dtype)
+        for name, tensor in tensors.items() if not name.endswith(SCALE_SUFFIX)
+    }
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as source_file:
+        for block in iter(lambda: source_file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def reference_fingerprint(audio_paths, model_version, known_hashes=None, settings=None):
+    """
+    Fingerprint of the reference files latents are made from, returns (fingerprint, sources).
+
+    `sources` lists the name, size and content hash of every file. Only the hashes, in file name
+    order (the order the audio is concatenated in), and the model version make up the
+    fingerprint. The same WAVs give the same fingerprint in every language and under any
+    speaker name, and touching or copying a file does not make its latents stale.
+
+    `known_hashes` ({path: {"size", "mtime_ns", "sha256"}}) lets files whose size and mtime did not
+    change skip hashing, it is updated in place with the files seen. `settings` are conditioning
+    settings that differ from the model defaults, changing them makes the latents stale.
+    """
+    known_hashes = {} if known_hashes is None else known_hashes
+    sources = []
+    for file_path in sorted(audio_paths):
+        stat = os.stat(file_path)
+        key = os.path.abspath(file_path)
+        known = known_hashes.get(key)
+        if known is None or known["size"] != stat.st_size or known["mtime_ns"] != stat.st_mtime_ns:
+            known = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(file_path)}
+            known_hashes[key] = known
+        sources.append({"file": os.path.basename(file_path), "size": stat.st_size, "sha256": known["sha256"]})
+
+    fingerprinted = {"model_version": str(model_version), "files": [source["sha256"] for source in sources]}
+    if settings:
+        fingerprinted["settings"] = settings
+    canonical = json.dumps(fingerprinted, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest(), sources
+
+
+def link_latents(source_path, file_path):
+    """
+    Makes `file_path` a hard link of `source_path`, a copy where links are not supported.
+    Replacing either file later gives it its own data, links never change after the fact.
+    """
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        try:
+            os.link(source_path, temp_path)
+        except OSError:
+            shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def load_latents_json(file_path):
+    """ Reader for the legacy format, nested float lists in JSON. """
+    with open(file_path, "r") as json_file:
+        data = json.load(json_file)
+    return {name: torch.tensor(value) for name, value in data.items()}, {}
+
+
+class _ArchiveSink:
+    """ Write-only file object for tarfile, collects the compressed output so it can be streamed. """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_latents_archive(files, manifest=None):
+    """
+    Yields a tar.gz of `files` ([(archive_name, file_path)]) chunk by chunk, it is never built in
+    memory. Files that are hard links of each other, latents shared across languages, are stored
+    once and linked in the archive. `manifest` is added as manifest.json at the end.
+    """
+    sink = _ArchiveSink()
+    seen = {}  # (device, inode) -> archive name
+    with tarfile.open(fileobj=sink, mode="w|gz") as archive:
+        for archive_name, file_path in files:
+            try:
+                with open(file_path, "rb") as latent_file:
+                    stat = os.fstat(latent_file.fileno())
+                    data = latent_file.read()
+            except FileNotFoundError:
+                # Removed since it was listed
+                continue
+
+            info = tarfile.TarInfo(archive_name)
+            info.mtime = int(stat.st_mtime)
+            inode = (stat.st_dev, stat.st_ino)
+            if inode in seen and stat.st_nlink > 1:
+                info.type = tarfile.LNKTYPE
+                info.linkname = seen[inode]
+                archive.addfile(info)
+            else:
+                seen[inode] = archive_name
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+
+        if manifest is not None:
+            data = json.dumps(manifest, indent=2).encode("utf-8")
+            info = tarfile.TarInfo("manifest.json")
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    yield sink.drain()
+
+
+def read_latents_archive(archive_file):
+    """
+    Yields (language_code, speaker_name, tensors, metadata) for every latent file of an archive
+    made by `stream_latents_archive`. `archive_file` must be seekable. Raises ValueError for
+    anything that is not a valid latent file, the caller decides what to do with what was read.
+    """
+    try:
+        archive = tarfile.open(fileobj=archive_file, mode="r:*")
+    except tarfile.TarError as e:
+        raise ValueError(f"not a tar archive ({e})")
+
+    with archive:
+        for member in archive:
+            if member.name == "manifest.json" or member.isdir():
+                continue
+            if not (member.isfile() or member.islnk()):
+                raise ValueError(f"{member.name} is not a regular file")
+
+            parts = member.name.split("/")
+            speaker_name, extension = os.path.splitext(parts[-1])
+            if len(parts) != 2 or not speaker_name or speaker_name.startswith(".") or extension not in (LATENT_EXTENSION, ".json"):
+                raise ValueError(f"{member.name} is not a <language>/<speaker>{LATENT_EXTENSION} file")
+
+            try:
+                data = archive.extractfile(member).read()
+                if extension == ".json":
+                    tensors, metadata = {name: torch.tensor(value) for name, value in json.loads(data).items()}, {}
+                else:
+                    tensors, metadata = decode_latents(data)
+            except Exception as e:
+                raise ValueError(f"{member.name} could not be read ({e})")
+
+            for name in ("gpt_cond_latent", "speaker_embedding"):
+                if name not in tensors or tensors[name].dim() != 3:
+                    raise ValueError(f"{member.name} has no valid {name}")
+            yield parts[0].lower(), speaker_name.lower(), tensors, metadata
+
+
+PACK_MAGIC = b"XLPACK1\n"
+PACK_FOOTER_MAGIC = b"XLPACKIX"
+PACK_FOOTER = struct.Struct("<QQ8s")  # index offset, index size, magic
+PACK_ALIGNMENT = 64
+PACK_COMPACT_BYTES = 16 * 1024 ** 2  # Dead space tolerated, beyond it a pack that is half dead is compacted
+
+
+class LatentPack:
+    """
+    All latents of one language in a single memory-mapped file.
+
+    The file is append-only: tensor data is appended, followed by a JSON index with the offset,
+    dtype and shape of every tensor and a fixed-size footer pointing at that index. Adding or
+    replacing a speaker appends the new data and a new index, the old bytes become dead space.
+    Once more than half the file is dead it is compacted, rewritten without the dead space.
+    Reads are zero-copy tensor views into the mapping, so nothing is loaded until a speaker is
+    first used.
+
+    The pack is derived from the per-speaker latent files, which stay the source of truth: when
+    the pack is missing or damaged it is rebuilt from them.
+    """
+
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        self.index = {}  # speaker name -> {"tensors": {...}, "source": {...}, "metadata": {...}}
+        self.dead_bytes = 0
+        self.mapping = None
+        self.lock = threading.Lock()
+
+        if os.path.exists(pack_path):
+            try:
+                self._read_index()
+            except (ValueError, OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Latent pack {pack_path} is damaged ({e}), it will be rebuilt.")
+                os.unlink(pack_path)
+                self.index = {}
+                self.dead_bytes = 0
+
+    def _read_index(self):
+        with open(self.pack_path, "rb") as pack_file:
+            if pack_file.read(len(PACK_MAGIC)) != PACK_MAGIC:
+                raise ValueError("not a latent pack")
+            pack_file.seek(-PACK_FOOTER.size, os.SEEK_END)
+            index_offset, index_size, magic = PACK_FOOTER.unpack(pack_file.read(PACK_FOOTER.size))
+            if magic != PACK_FOOTER_MAGIC:
+                raise ValueError("missing footer")
+            pack_file.seek(index_offset)
+            index = json.loads(pack_file.read(index_size).decode("utf-8"))
+        self.index = index["speakers"]
+        self.dead_bytes = index["dead_bytes"]
+        self._map()
+
+    def _map(self):
+        # Views handed out earlier keep the previous mapping alive, it is never closed explicitly
+        with open(self.pack_path, "rb") as pack_file:
+            # ACCESS_COPY gives writable pages without touching the file, torch wants writable arrays
+            self.mapping = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def names(self):
+        return list(self.index)
+
+    def get(self, name):
+        """ Returns (tensors, metadata) as views into the pack, or None. """
+        with self.lock:
+            entry = self.index.get(name)
+            mapping = self.mapping
+        if entry is None:
+            return None
+        return self._views(entry, mapping), entry.get("metadata", {})
+
+    def _views(self, entry, mapping):
+        tensors = {}
+        for tensor_name, info in entry["tensors"].items():
+            dtype = numpy_dtypes[info["dtype"]]
+            array = np.frombuffer(mapping, dtype=dtype, count=info["nbytes"] // dtype.itemsize, offset=info["offset"])
+            tensors[tensor_name] = torch.from_numpy(array.reshape(info["shape"]))
+        return tensors
+
+    def put(self, name, tensors, source=None, metadata=None):
+        self.update({name: (tensors, source, metadata)})
+
+    def fingerprints(self):
+        """ {fingerprint: name} of the speakers made from reference audio. """
+        return {entry["metadata"]["fingerprint"]: name for name, entry in self.index.items() if "fingerprint" in entry.get("metadata", {})}
+
+    def update(self, entries, removed=()):
+        """
+        Appends `entries` ({name: (tensors, source, metadata)}) and drops `removed` names in one
+        write, then remaps the file. Callers with many entries pass them together, every call
+        appends a new index.
+        """
+        with self.lock:
+            self._write(entries, removed)
+            if self._wasteful():
+                try:
+                    self._compact()
+                except OSError as e:
+                    # Windows does not replace a file that is still mapped, sync compacts it at the next start
+                    logger.warning(f"Latent pack {self.pack_path} could not be compacted now ({e}), it will be at the next start.")
+
+    def _write(self, entries, removed=()):
+        """ update, with the lock held. """
+        index = dict(self.index)
+        dead_bytes = self.dead_bytes
+        for name in removed:
+            if name in index:
+                dead_bytes += sum(info["nbytes"] for info in index.pop(name)["tensors"].values())
+
+        exists = os.path.exists(self.pack_path)
+        with open(self.pack_path, "r+b" if exists else "w+b") as pack_file:
+            if exists:
+                pack_file.seek(0, os.SEEK_END)
+                start_size = pack_file.tell()
+                # The previous index and footer are dead once a new one is written
+                pack_file.seek(-PACK_FOOTER.size, os.SEEK_END)
+                old_offset, old_size, _ = PACK_FOOTER.unpack(pack_file.read(PACK_FOOTER.size))
+                dead_bytes += old_size + PACK_FOOTER.size
+                pack_file.seek(0, os.SEEK_END)
+            else:
+                start_size = 0
+                pack_file.write(PACK_MAGIC)
+
+            try:
+                for name, (tensors, source, metadata) in entries.items():
+                    if name in index:
+                        dead_bytes += sum(info["nbytes"] for info in index[name]["tensors"].values())
+                    entry = {"tensors": {}, "source": source, "metadata": metadata or {}}
+                    # Kept in the precision of the latent file, dequantized when used
+                    for tensor_name, tensor in tensors.items():
+                        array = tensor.detach().cpu().numpy() if isinstance(tensor, torch.Tensor) else np.asarray(tensor)
+                        data = np.ascontiguousarray(array).tobytes()
+                        pack_file.write(b"\0" * (-pack_file.tell() % PACK_ALIGNMENT))
+                        entry["tensors"][tensor_name] = {
+                            "dtype": dtype_names[array.dtype],
+                            "shape": list(array.shape),
+                            "offset": pack_file.tell(),
+                            "nbytes": len(data)
+                        }
+                        pack_file.write(data)
+                    index[name] = entry
+
+                index_bytes = json.dumps({"speakers": index, "dead_bytes": dead_bytes}, separators=(",", ":")).encode("utf-8")
+                index_offset = pack_file.tell()
+                pack_file.write(index_bytes)
+                pack_file.write(PACK_FOOTER.pack(index_offset, len(index_bytes), PACK_FOOTER_MAGIC))
+                pack_file.flush()
+            except Exception:
+                # Leave the pack as it was, the old footer is still the last thing in the file
+                pack_file.truncate(start_size)
+                raise
+
+        self.index = index
+        self.dead_bytes = dead_bytes
+        self._map()
+
+    def sync(self, language_path):
+        """
+        Brings the pack in line with the latent files of a language folder. Only speakers whose
+        file changed are read again. Returns (updated, removed, unchanged) counts.
+        """
+        sources = {}
+        for file_name in os.listdir(language_path):
+            speaker_name, extension = os.path.splitext(file_name)
+            # Speakers are looked up lowercased
+            speaker_name = speaker_name.lower()
+            # The binary file wins when a legacy JSON of the same speaker is still around
+            if extension == LATENT_EXTENSION or (extension == ".json" and speaker_name not in sources):
+                stat = os.stat(os.path.join(language_path, file_name))
+                sources[speaker_name] = {"file": file_name, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+        changed = {}
+        for speaker_name, source in sources.items():
+            entry = self.index.get(speaker_name)
+            if entry is not None and entry["source"] == source:
+                continue
+            file_path = os.path.join(language_path, source["file"])
+            try:
+                if source["file"].endswith(".json"):
+                    tensors, metadata = load_latents_json(file_path)
+                else:
+                    tensors, metadata = load_latents(file_path)
+            except Exception as e:
+                logger.error(f"Failed to read latents from {file_path}: {e}")
+                continue
+            changed[speaker_name] = (tensors, source, metadata)
+
+        removed = [name for name in self.index if name not in sources]
+        unchanged = len(sources) - len(changed)
+
+        if changed or removed:
+            self.update(changed, removed)
+
+        # Dead space left by a compaction that failed while running
+        if self._wasteful():
+            self.compact()
+
+        return len(changed), len(removed), unchanged
+
+    def compact(self):
+        """ Rewrites the pack without dead space. """
+        with self.lock:
+            self._compact()
+
+    def _wasteful(self):
+        return self.dead_bytes > PACK_COMPACT_BYTES and self.dead_bytes > os.path.getsize(self.pack_path) // 2
+
+    def _compact(self):
+        # Views handed out earlier keep the old file mapped, it is unlinked but stays readable for them
+        entries = {name: ({tensor_name: tensor.clone() for tensor_name, tensor in self._views(entry, self.mapping).items()}, entry["source"], entry.get("metadata", {}))
+                   for name, entry in self.index.items()}
+        index, dead_bytes = self.index, self.dead_bytes
+        temp_path = self.pack_path + ".tmp"
+        # Unmapped unless views of it are still around
+        self.mapping = None
+        try:
+            os.replace(self.pack_path, temp_path)
+        except OSError:
+            self._map()
+            raise
+
+        self.index = {}
+        self.dead_bytes = 0
+        try:
+            self._write(entries)
+        except Exception:
+            os.replace(temp_path, self.pack_path)
+            self.index, self.dead_bytes = index, dead_bytes
+            self._map()
+            raise
+        os.unlink(temp_path)
+        logger.info(f"Compacted latent pack {self.pack_path}, {dead_bytes / 1024 ** 2:.1f} MB reclaimed")
+
+
+def latents_nbytes(latents):
+    """ Bytes of latents, plain tensors or the (data, scale) pairs the cache keeps. """
+    total = 0
+    for tensor in latents:
+        for part in (tensor if isinstance(tensor, tuple) else (tensor,)):
+            if part is not None:
+                total += part.element_size() * part.nelement()
+    return total
+
+
+def device_name(device):
+    """ Canonical name of a device, so "cuda" and "cuda:0" share one budget. """
+    device = torch.device(device)
+    if device.type == "cuda":
+        return f"cuda:{torch.cuda.current_device() if device.index is None else device.index}"
+    return device.type
+
+
+class LatentArena:
+    """
+    Latents of many speakers in one contiguous tensor per latent kind, addressed by slot.
+
+    Row `slot` of `data[i]` holds the i-th latent (gpt_cond_latent, speaker_embedding) of one
+    speaker in the storage precision, its int8 scales are in the same row of `scales[i]`. All
+    rows have the shapes of the first latents stored, see `signature`. The arena grows by
+    doubling up to `max_slots`, past it (a batch pinned more speakers than the budget holds) by a
+    quarter at a time, and freed slots are reused, so there is no per-speaker allocation. Reads
+    always copy, a slot can be reused as soon as it is released.
+    """
+
+    def __init__(self, device, compact, max_slots, pin_memory=False):
+        self.device = device
+        self.signature = self.signature_of(compact)
+        self.max_slots = max(1, max_slots)
+        self.pin_memory = pin_memory and device == "cpu"
+        self.data = [self._allocate(0, data) for data, _ in compact]
+        self.scales = [None if scale is None else self._allocate(0, scale) for _, scale in compact]
+        self.capacity = 0
+        self.free = []
+        self.slot_nbytes = latents_nbytes(compact)
+        self.full_slot_nbytes = sum(data.nelement() * 4 for data, _ in compact) # The same latents in fp32
+
+    @staticmethod
+    def signature_of(compact):
+        """ Latents with the same signature share an arena. """
+        return tuple((tuple(data.shape), data.dtype, None if scale is None else tuple(scale.shape)) for data, scale in compact)
+
+    def _allocate(self, capacity, template):
+        tensor = torch.empty((capacity, *template.shape[1:]), dtype=template.dtype, device=self.device)
+        return tensor.pin_memory() if self.pin_memory else tensor
+
+    def _grow(self):
+        if self.capacity < self.max_slots:
+            capacity = min(max(8, self.capacity * 2), self.max_slots)
+        else:
+            # Still geometric, a reallocation per new speaker would copy the whole arena every time
+            capacity = self.capacity + max(1, self.capacity // 4)
+        for tensors in (self.data, self.scales):
+            for i, old in enumerate(tensors):
+                if old is not None:
+                    tensors[i] = self._allocate(capacity, old)
+                    tensors[i][:self.capacity].copy_(old)
+        self.free.extend(reversed(range(self.capacity, capacity)))
+        self.capacity = capacity
+
+    @property
+    def used(self):
+        return self.capacity - len(self.free)
+
+    def allocate(self):
+        if not self.free:
+            self._grow()
+        return self.free.pop()
+
+    def release(self, slot):
+        self.free.append(slot)
+
+    def write(self, slot, compact):
+        """ Stores latents in the slot, returns the bytes that came from another device. """
+        moved = 0
+        for (data, scale), data_rows, scale_rows in zip(compact, self.data, self.scales):
+            for part, rows in ((data, data_rows), (scale, scale_rows)):
+                if part is not None:
+                    # Synchronous: the source can be a slot that is reused right after
+                    rows[slot].copy_(part[0])
+                    if part.device != rows.device:
+                        moved += part.element_size() * part.nelement()
+        return moved
+
+    def read(self, slot):
+        """ Compact latents of a slot, copies with the leading batch dimension of 1. """
+        return tuple(
+            (data[slot:slot + 1].clone(), None if scales is None else scales[slot:slot + 1].clone())
+            for data, scales in zip(self.data, self.scales)
+        )
+
+    def gather(self, slots):
+        """ fp32 latents of the slots stacked into a batch, one indexed read per latent kind. """
+        index = torch.as_tensor(slots, dtype=torch.long, device=self.device)
+        return tuple(
+            dequantize_tensor(data.index_select(0, index), None if scales is None else scales.index_select(0, index))
+            for data, scales in zip(self.data, self.scales)
+        )
+
+
+class LatentCache:
+    """
+    Resident latents keyed by `<speaker>_<language>`, bounded by a byte budget per device.
+
+    Every entry has a host copy, pinned when CUDA is available, and a copy per device it was
+    requested on. A lookup on a device that already holds a copy returns it as is; a copy is
+    only made when the device changes, as in lowvram mode, and then from the pinned host copy.
+    Transfers are counted, so a warm hot path shows zero of them.
+
+    Entries are loaded on demand by `TTSWrapper.get_or_create_latents` and evicted least recently
+    used once a device goes over `max_bytes`: device copies are dropped first, the whole entry
+    when the host goes over. Evicted latents are simply dropped, every entry is already
+    persisted in the latent files and packs, and is loaded again on the next use.
+
+    Copies are kept in `precision` (see LATENT_PRECISIONS) and dequantized to fp32 on the
+    device on every lookup, so a budget holds 2x (fp16) or almost 4x (int8) the speakers.
+    They live in a LatentArena per device, so the latents of several speakers are gathered
+    into a batch with one indexed read (`gather`) instead of being stacked tensor by tensor.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 ** 2, precision="fp32"):
+        if precision not in LATENT_PRECISIONS:
+            raise ValueError(f"Unknown latent precision '{precision}'")
+        self.max_bytes = max_bytes
+        self.precision = precision
+        self.entries = OrderedDict()  # key -> {device: (arena, slot)}, always with a "cpu" copy
+        self.arenas = {}  # (device, signature) -> LatentArena
+        self.device_bytes = {}  # device -> resident bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.transfers = 0
+        self.transfer_bytes = 0
+        self.pin_memory = torch.cuda.is_available()
+        self.lock = threading.RLock()
+
+    def _arena(self, device, compact):
+        signature = LatentArena.signature_of(compact)
+        arena = self.arenas.get((device, signature))
+        if arena is None:
+            arena = LatentArena(device, compact, self.max_bytes // max(1, latents_nbytes(compact)), self.pin_memory)
+            self.arenas[(device, signature)] = arena
+        return arena
+
+    def _store(self, key, device, compact, keep):
+        """ Puts a copy of compact latents on `device`, making room first. """
+        arena = self._arena(device, compact)
+        self._make_room(device, arena.slot_nbytes, keep)
+        slot = arena.allocate()
+        moved = arena.write(slot, compact)
+        if moved:
+            self.transfers += len(compact)
+            self.transfer_bytes += moved
+        self.entries[key][device] = (arena, slot)
+        self.device_bytes[device] = self.device_bytes.get(device, 0) + arena.slot_nbytes
+        return arena, slot
+
+    def _locate(self, key, device, keep):
+        """ (arena, slot) of the copy of an entry on `device`, copied from the host when missing. """
+        copies = self.entries[key]
+        location = copies.get(device)
+        if location is None:
+            arena, slot = copies["cpu"]
+            location = self._store(key, device, arena.read(slot), keep)
+        return location
+
+    def get(self, key, device=None):
+        """ Latents on `device`, or the host copy when no device is given. """
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            arena, slot = self._locate(key, "cpu" if device is None else device_name(device), {key})
+            return arena.gather([slot])
+
+    def gather(self, keys, device=None):
+        """
+        Latents of several entries stacked into one batch, (gpt_cond_latents, speaker_embeddings).
+        None when one of them is not resident or they do not share an arena (other shapes).
+        """
+        with self.lock:
+            if any(key not in self.entries for key in keys):
+                self.misses += 1
+                return None
+            device = "cpu" if device is None else device_name(device)
+            locations = []
+            for key in keys:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                locations.append(self._locate(key, device, set(keys)))
+            arenas = {id(arena) for arena, _ in locations}
+            if len(arenas) != 1:
+                return None
+            return locations[0][0].gather([slot for _, slot in locations])
+
+    def put(self, key, latents):
+        with self.lock:
+            self._drop(key)
+            self.entries[key] = {}
+            device = device_name(latents[0].device)
+            compact = tuple(quantize_tensor(tensor.detach(), self.precision) for tensor in latents)
+            self._store(key, "cpu", compact, {key})
+            if device != "cpu":
+                self._store(key, device, compact, {key})
+
+    def _release(self, device, location):
+        arena, slot = location
+        arena.release(slot)
+        self.device_bytes[device] -= arena.slot_nbytes
+
+    def _drop(self, key):
+        copies = self.entries.pop(key, None)
+        if copies is not None:
+            for device, location in copies.items():
+                self._release(device, location)
+        return copies
+
+    def pop(self, key, default=None):
+        with self.lock:
+            copies = self.entries.get(key)
+            if copies is None:
+                return default
+            arena, slot = copies["cpu"]
+            latents = arena.gather([slot])
+            self._drop(key)
+            return latents
+
+    def _make_room(self, device, nbytes, keep):
+        # Oldest entries first, only copies living on the device that goes over budget
+        for key in list(self.entries):
+            if self.device_bytes.get(device, 0) + nbytes <= self.max_bytes:
+                break
+            if key in keep or device not in self.entries[key]:
+                continue
+            if device == "cpu":
+                # Without the host copy the entry is gone
+                self._drop(key)
+            else:
+                self._release(device, self.entries[key].pop(device))
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.arenas = {}
+            self.device_bytes = {}
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            arena_bytes = {}
+            bytes_saved = 0
+            for (device, _), arena in self.arenas.items():
+                arena_bytes[device] = arena_bytes.get(device, 0) + arena.capacity * arena.slot_nbytes
+                bytes_saved += arena.used * (arena.full_slot_nbytes - arena.slot_nbytes)
+            return {
+                'entries': len(self.entries),
+                'precision': self.precision,
+                'device_bytes': dict(self.device_bytes),
+                'arena_bytes': arena_bytes,
+                'bytes_saved': bytes_saved,
+                'max_bytes_per_device': self.max_bytes,
+                'pinned_host_copies': self.pin_memory,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'transfers': self.transfers,
+                'transfer_bytes': self.transfer_bytes
+            }
+
+    # Dict style access, used to hot-load freshly stored latents
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __getitem__(self, key):
+        latents = self.get(key)
+        if latents is None:
+            raise KeyError(key)
+        return latents
+
+    def __setitem__(self, key, latents):
+        self.put(key, latents)
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,208 @@
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from loguru import logger
+
+from xtts_api_server.scheduler import QueueFullError
+
+class PriorityGate:
+    """
+    Lets background work run only while no foreground work is in progress.
+
+    Foreground work (synthesis) never waits for the background to finish its queue, it only
+    keeps new background steps from starting. With `exclusive` it also waits for the step
+    in progress, for when both cannot use the model at the same time (lowvram moves it).
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.foreground = 0
+        self.background = False
+
+    @contextmanager
+    def foreground_work(self, exclusive=False):
+        with self.condition:
+            self.foreground += 1
+            if exclusive:
+                self.condition.wait_for(lambda: not self.background)
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.foreground -= 1
+                self.condition.notify_all()
+
+    @contextmanager
+    def background_work(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.foreground == 0 and not self.background)
+            self.background = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.background = False
+                self.condition.notify_all()
+
+class LatentJobQueue:
+    """
+    Creates latents from uploaded reference audio in a background thread.
+
+    Jobs run one at a time and in order. Each step (decoding, conditioning) waits until no
+    synthesis is in progress, so cloning a voice never slows down live requests. Finished
+    latents are stored and loaded into the latents cache like /create_and_store_latents does.
+    """
+
+    def __init__(self, tts, max_queued=256, max_finished=1000):
+        self.tts = tts
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.condition = threading.Condition()
+        self.queue = deque() # Job ids waiting to run
+        self.jobs = OrderedDict() # job id -> job, queued, running and the latest finished ones
+        self.running = None
+        self.completed = 0
+        self.failed = 0
+        self.wait_seconds = 0.0 # Totals of the finished jobs, for the averages in stats
+        self.run_seconds = 0.0
+        self.worker = threading.Thread(target=self._run, name="latent-jobs", daemon=True)
+        self.worker.start()
+
+    def submit(self, speaker_name, language_code, audio_files):
+        """ Queues latent creation for a speaker from file objects, returns the job. """
+        with self.condition:
+            if len(self.queue) >= self.max_queued:
+                raise QueueFullError(f"{len(self.queue)} latent jobs are already queued")
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "speaker_name": speaker_name,
+                "language": language_code,
+                "files": len(audio_files),
+                "status": "queued",
+                "error": None,
+                "file_path": None,
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "timing": {},
+                "audio_files": audio_files,
+                "version": 0, # Bumped on every change, watchers compare it
+            }
+            self.jobs[job["job_id"]] = job
+            self.queue.append(job["job_id"])
+            self.condition.notify_all()
+        logger.info(f"Latent job {job['job_id']} queued for {speaker_name} in {language_code}, {len(self.queue)} in queue")
+        return self.status(job["job_id"])
+
+    def status(self, job_id):
+        """ Copy of a job without its audio, None when unknown or long finished. """
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            status = {key: value for key, value in job.items() if key != "audio_files"}
+            status["timing"] = dict(job["timing"])
+            if job["status"] == "queued":
+                status["position"] = self.queue.index(job_id) + 1
+            return status
+
+    def stats(self):
+        with self.condition:
+            finished = self.completed + self.failed
+            return {
+                "queued": len(self.queue),
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_seconds": round(self.wait_seconds / finished, 3) if finished else 0.0,
+                "avg_run_seconds": round(self.run_seconds / finished, 3) if finished else 0.0,
+            }
+
+    def retry_after(self):
+        """ Seconds until the running job is expected to finish and free a slot, from the average run time, at least 1. """
+        with self.condition:
+            finished = self.completed + self.failed
+            running = self.jobs.get(self.running) if self.running is not None else None
+            if running is None or not finished or running["started_at"] is None:
+                return 1
+            remaining = self.run_seconds / finished - (time.time() - running["started_at"])
+        return max(1, math.ceil(remaining))
+
+    def list_jobs(self):
+        with self.condition:
+            job_ids = list(self.jobs)
+        return [status for status in map(self.status, job_ids) if status is not None]
+
+    def _update(self, job, **changes):
+        with self.condition:
+            job.update(changes)
+            job["version"] += 1
+            self.condition.notify_all()
+
+    def _run(self):
+        # Decoding competes with synthesis for the cpu, the worker gives way to it there as well
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.queue)
+                # Stays queued while synthesis keeps the worker waiting
+                job = self.jobs[self.queue[0]]
+            self._process(job)
+            with self.condition:
+                self.running = None
+                self._forget_finished()
+
+    def _process(self, job):
+        gate = self.tts.priority_gate
+        try:
+            with gate.background_work():
+                with self.condition:
+                    self.queue.popleft()
+                    self.running = job["job_id"]
+                self._update(job, status="running", started_at=time.time())
+                timing = {"wait_seconds": round(job["started_at"] - job["submitted_at"], 3)}
+                start = time.perf_counter()
+                prepared = self.tts.prepare_reference_audio(job["audio_files"])
+            timing["decode_seconds"] = round(time.perf_counter() - start, 3)
+
+            start = time.perf_counter()
+            with gate.background_work():
+                [(gpt_cond_latent, speaker_embedding)] = self.tts.get_conditioning_latents_batch([prepared])
+            timing["conditioning_seconds"] = round(time.perf_counter() - start, 3)
+
+            start = time.perf_counter()
+            file_path = self.tts.store_latents(job["speaker_name"], job["language"], gpt_cond_latent, speaker_embedding)
+            timing["store_seconds"] = round(time.perf_counter() - start, 3)
+            changes = {"status": "done", "file_path": file_path}
+        except Exception as e:
+            logger.error(f"Latent job {job['job_id']} for {job['speaker_name']} in {job['language']} failed: {e}")
+            changes = {"status": "failed", "error": str(e)}
+
+        finished_at = time.time()
+        timing["run_seconds"] = round(finished_at - job["started_at"], 3)
+        timing["total_seconds"] = round(finished_at - job["submitted_at"], 3)
+        # The audio is not needed any more, finished jobs are kept for polling only
+        self._update(job, finished_at=finished_at, timing=timing, audio_files=None, **changes)
+
+        with self.condition:
+            if job["status"] == "done":
+                self.completed += 1
+            else:
+                self.failed += 1
+            self.wait_seconds += timing["wait_seconds"]
+            self.run_seconds += timing["run_seconds"]
+        logger.info(f"Latent job {job['job_id']} {job['status']} in {timing['run_seconds']:.2f}s after waiting {timing['wait_seconds']:.2f}s")
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job["finished_at"] is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
@@ -0,0 +1,76 @@
+from argparse import ArgumentParser
+import os
+
+from loguru import logger
+
+from xtts_api_server.latent_funcs import LATENT_EXTENSION, LATENT_PRECISIONS, save_latents, load_latents, load_latents_json, load_latents_metadata, link_latents, quantize_latents, dequantize_latents
+
+
+def migrate_latents(latent_speaker_folder, model_version, keep_json=False, precision=None):
+    """
+    Converts every legacy JSON latent file in the folder to the binary format. With `precision`,
+    binary files stored in another precision are converted to it as well.
+    """
+    migrated = 0
+    converted = 0
+    failed = 0
+    converted_inodes = {} # (device, inode) -> converted path, latents shared across languages stay shared
+    for root, dirs, files in os.walk(latent_speaker_folder):
+        for file in files:
+            file_path = os.path.join(root, file)
+            if file.endswith(LATENT_EXTENSION) and precision is not None:
+                try:
+                    stat = os.stat(file_path)
+                    inode = (stat.st_dev, stat.st_ino)
+                    if inode in converted_inodes:
+                        link_latents(converted_inodes[inode], file_path)
+                        converted += 1
+                        continue
+                    # Files without the key are from before precisions, they are all fp16
+                    if load_latents_metadata(file_path).get("precision", "fp16") == precision:
+                        continue
+                    tensors, metadata = load_latents(file_path)
+                    metadata.pop("format_version", None)
+                    save_latents(file_path, quantize_latents(dequantize_latents(tensors), precision), {**metadata, "precision": precision}, dtype=None)
+                except Exception as e:
+                    logger.error(f"Failed to convert {file_path} to {precision}: {e}")
+                    failed += 1
+                    continue
+                if stat.st_nlink > 1:
+                    converted_inodes[inode] = file_path
+                converted += 1
+                continue
+
+            if not file.endswith('.json'):
+                continue
+            json_path = file_path
+            binary_path = os.path.splitext(json_path)[0] + LATENT_EXTENSION
+            try:
+                tensors, _ = load_latents_json(json_path)
+                save_latents(binary_path, quantize_latents(tensors, precision or "fp16"), {"model_version": model_version, "precision": precision or "fp16"}, dtype=None)
+            except Exception as e:
+                logger.error(f"Failed to migrate {json_path}: {e}")
+                failed += 1
+                continue
+
+            if not keep_json:
+                os.unlink(json_path)
+            migrated += 1
+
+    logger.info(f"Migrated {migrated} latent files to {LATENT_EXTENSION}" + (f", converted {converted} to {precision}" if precision else "") + f", {failed} failed.")
+    return migrated, failed
+
+
+def main():
+    parser = ArgumentParser(description="Convert JSON latents to the binary latent format.")
+    parser.add_argument("-lsf", "--latent-speaker-folder", default="latent_speaker_folder/", help="The folder with the latents")
+    parser.add_argument("-v", "--version", default="v2.0.2", help="Model version the latents were made with, stored in the file header")
+    parser.add_argument("--keep-json", action='store_true', help="Keep the JSON files next to the converted ones")
+    parser.add_argument("--precision", choices=LATENT_PRECISIONS, help="Also convert binary latent files to this precision, as set with --latent-precision on the server")
+    args = parser.parse_args()
+
+    migrate_latents(args.latent_speaker_folder, args.version, args.keep_json, args.precision)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from loguru import logger
+
+AUDIO_SECONDS_PER_CHAR = 0.065 # Length of speech per character of text, until measured
+STREAM_END = object()
+PRIORITY_CLASSES = ("interactive", "bulk", "background") # Most urgent first
+RECENT_WAITS = 1000 # Waits kept per class, for the percentiles in stats
+
+class QueueFullError(Exception):
+    pass
+
+class RealtimeFactor:
+    """
+    Measured speed of synthesis: seconds of processing per second of audio, and seconds of
+    audio per character of text, both smoothed over the recent requests.
+    """
+
+    def __init__(self, smoothing=0.2):
+        self.lock = threading.Lock()
+        self.smoothing = smoothing
+        self.value = None # None until anything was synthesized
+        self.audio_per_char = AUDIO_SECONDS_PER_CHAR
+
+    def observe(self, chars, audio_seconds, processing_seconds):
+        if audio_seconds <= 0:
+            return
+        with self.lock:
+            rtf = processing_seconds / audio_seconds
+            self.value = rtf if self.value is None else self.value + self.smoothing * (rtf - self.value)
+            if chars > 0:
+                self.audio_per_char += self.smoothing * (audio_seconds / chars - self.audio_per_char)
+
+    def estimate(self, chars):
+        """ Expected processing seconds of a text, as fast as real time until measured. """
+        return chars * self.audio_per_char * (self.value if self.value is not None else 1.0)
+
+class InferenceScheduler:
+    """
+    Runs synthesis on dedicated worker threads, the event loop only awaits the results.
+
+    Work waits in a bounded queue. When the queue is full, submit raises QueueFullError and
+    retry_after tells when a slot is expected to free up, from the measured real-time factor
+    and the length of the texts being synthesized.
+
+    Every job has a priority class, see PRIORITY_CLASSES, and a client (API key or address).
+    Workers take the most urgent class first, and within a class serve the clients in turn,
+    so one client queueing many jobs does not hold up the others. Work of a lower class that
+    is already running gives way at its preemption points: the worker runs the waiting work
+    of a higher class there, then carries on.
+
+    Work submitted with submit_batch is micro-batched: a worker that picks up such a job
+    waits up to `batch_window` seconds for more jobs of the same batch key and class, and runs
+    up to `max_batch_size` of them with a single call.
+    """
+
+    def __init__(self, realtime_factor, workers=1, max_queued=32, max_batch_size=1, batch_window=0.01):
+        self.realtime_factor = realtime_factor
+        self.max_queued = max_queued
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.condition = threading.Condition()
+        self.queues = {priority: OrderedDict() for priority in PRIORITY_CLASSES} # class -> client -> jobs waiting, clients in turn
+        self.queued = 0
+        self.running = [] # Jobs on a worker
+        self.local = threading.local() # Job a worker thread is running
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.preemptions = 0 # Jobs that ran at a preemption point of less urgent work
+        self.wait_seconds = {priority: 0.0 for priority in PRIORITY_CLASSES} # Totals of the started jobs, for the averages in stats
+        self.started = {priority: 0 for priority in PRIORITY_CLASSES}
+        self.recent_waits = {priority: deque(maxlen=RECENT_WAITS) for priority in PRIORITY_CLASSES}
+        self.batches = 0 # Calls that ran batched jobs, and the jobs in them
+        self.batched_jobs = 0
+        self.workers = [threading.Thread(target=self._run, name=f"inference-{index}", daemon=True) for index in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, text, fn, /, *args, priority="interactive", client=None, **kwargs):
+        """
+        Queues fn(*args, **kwargs), returns a concurrent Future of its result. `text` is what it
+        synthesizes, for the estimates, `priority` one of PRIORITY_CLASSES and `client` who asked.
+        """
+        return self._submit(text, fn, args, kwargs, None, priority, client)
+
+    async def run(self, text, fn, /, *args, priority="interactive", client=None, **kwargs):
+        return await asyncio.wrap_future(self.submit(text, fn, *args, priority=priority, client=client, **kwargs))
+
+    def submit_batch(self, text, key, fn, item, priority="interactive", client=None):
+        """
+        Queues `item` for fn(items), which takes a list of items and returns one result per
+        item, an exception instance for an item that failed. Only jobs with the same `key` are
+        batched together, and fn is the one of the first job of a batch.
+        """
+        return self._submit(text, fn, (item,), {}, None, priority, client, key)
+
+    async def run_batch(self, text, key, fn, item, priority="interactive", client=None):
+        return await asyncio.wrap_future(self.submit_batch(text, key, fn, item, priority, client))
+
+    def stream(self, text, fn, /, *args, priority="interactive", client=None, **kwargs):
+        """
+        Queues fn(*args, **kwargs), which returns an iterator of chunks, and returns an async
+        iterator of those chunks. The iterator is run on a worker and stops when the consumer does.
+        """
+        chunks = asyncio.Queue()
+        cancelled = threading.Event()
+        self._submit(text, fn, args, kwargs, (asyncio.get_running_loop(), chunks, cancelled), priority, client)
+
+        async def iterate():
+            try:
+                while True:
+                    chunk = await chunks.get()
+                    if chunk is STREAM_END:
+                        return
+                    if isinstance(chunk, BaseException):
+                        raise chunk
+                    yield chunk
+            finally:
+                cancelled.set()
+        return iterate()
+
+    def preemption_point(self):
+        """
+        Called by running work where it can pause, such as between sentences. Runs the queued
+        work of a more urgent class than the current job on this worker, then returns.
+        """
+        current = getattr(self.local, "job", None)
+        if current is None:
+            return
+        rank = PRIORITY_CLASSES.index(current["priority"])
+        while True:
+            with self.condition:
+                jobs = self._next(PRIORITY_CLASSES[:rank])
+                if not jobs:
+                    return
+                self.preemptions += len(jobs)
+            logger.info(f"{current['priority'].capitalize()} job paused for {len(jobs)} {jobs[0]['priority']} job(s)")
+            self._execute(jobs)
+
+    def retry_after(self):
+        """ Seconds until the first running job is expected to finish, at least 1. """
+        now = time.monotonic()
+        with self.condition:
+            remaining = [job["estimate"] - (now - job["started_at"]) for job in self.running]
+        return max(1, math.ceil(min(remaining, default=0)))
+
+    def stats(self):
+        with self.condition:
+            classes = {}
+            for priority in PRIORITY_CLASSES:
+                started = self.started[priority]
+                waits = sorted(self.recent_waits[priority])
+                classes[priority] = {
+                    "queued": sum(len(jobs) for jobs in self.queues[priority].values()),
+                    "clients": len(self.queues[priority]),
+                    "started": started,
+                    "avg_wait_seconds": round(self.wait_seconds[priority] / started, 3) if started else 0.0,
+                    "p95_wait_seconds": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 3) if waits else 0.0,
+                    "max_wait_seconds": round(waits[-1], 3) if waits else 0.0,
+                }
+            started = sum(self.started.values())
+            return {
+                "workers": len(self.workers),
+                "queued": self.queued,
+                "running": len(self.running),
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "preemptions": self.preemptions,
+                "max_batch_size": self.max_batch_size,
+                "batches": self.batches,
+                "avg_batch_size": round(self.batched_jobs / self.batches, 3) if self.batches else 0.0,
+                "avg_wait_seconds": round(sum(self.wait_seconds.values()) / started, 3) if started else 0.0,
+                "realtime_factor": round(self.realtime_factor.value, 3) if self.realtime_factor.value is not None else None,
+                "classes": classes,
+            }
+
+    def _submit(self, text, fn, args, kwargs, sink, priority, client, batch_key=None):
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class {priority}, expected one of {', '.join(PRIORITY_CLASSES)}")
+        job = {
+            "fn": fn,
+            "args": args,
+            "kwargs": kwargs,
+            "future": Future(),
+            "sink": sink, # (loop, asyncio.Queue, cancelled) of a stream
+            "batch_key": batch_key, # Set for jobs that can run batched
+            "priority": priority,
+            "estimate": self.realtime_factor.estimate(len(text)),
+            "submitted_at": time.monotonic(),
+            "started_at": None,
+        }
+        with self.condition:
+            if self.queued >= self.max_queued:
+                self.rejected += 1
+                raise QueueFullError(f"{self.queued} requests are already queued")
+            self.queues[priority].setdefault(client, deque()).append(job)
+            self.queued += 1
+            # A worker gathering a batch waits on the same condition as the idle ones
+            self.condition.notify_all()
+        return job["future"]
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.queued)
+                jobs = self._next(PRIORITY_CLASSES)
+            self._execute(jobs)
+
+    def _next(self, priorities):
+        """
+        Takes the next jobs to run from the queues of the given classes, a batch or a single job,
+        and marks them running. Called with the condition held, returns [] when nothing is queued.
+        """
+        priority = next((priority for priority in priorities if self.queues[priority]), None)
+        if priority is None:
+            return []
+        jobs = self._take(priority, None, 1)
+        key = jobs[0]["batch_key"]
+        if key is not None:
+            if self.max_batch_size > 1:
+                self._gather(jobs)
+            self.batches += 1
+            self.batched_jobs += len(jobs)
+
+        now = time.monotonic()
+        for job in jobs:
+            job["started_at"] = now
+            self.running.append(job)
+            self.wait_seconds[priority] += now - job["submitted_at"]
+            self.recent_waits[priority].append(now - job["submitted_at"])
+            self.started[priority] += 1
+        return jobs
+
+    def _take(self, priority, key, count):
+        """ Up to `count` queued jobs of a class, with the batch key when one is given, the clients in turn. """
+        clients = self.queues[priority]
+        taken = []
+        while len(taken) < count:
+            found = False
+            for client, jobs in list(clients.items()):
+                if len(taken) >= count:
+                    break
+                job = jobs[0] if key is None else next((job for job in jobs if job["batch_key"] == key), None)
+                if job is None:
+                    continue
+                jobs.remove(job)
+                taken.append(job)
+                found = True
+                # Served, the client goes to the back of the line
+                if jobs:
+                    clients.move_to_end(client)
+                else:
+                    del clients[client]
+            if not found:
+                break
+        self.queued -= len(taken)
+        return taken
+
+    def _gather(self, jobs):
+        """ Adds queued jobs of the same batch key and class to `jobs`, waiting for more up to the batch window. Called with the condition held. """
+        priority, key = jobs[0]["priority"], jobs[0]["batch_key"]
+        deadline = time.monotonic() + self.batch_window
+        while True:
+            jobs.extend(self._take(priority, key, self.max_batch_size - len(jobs)))
+            remaining = deadline - time.monotonic()
+            if len(jobs) >= self.max_batch_size or remaining <= 0:
+                return
+            self.condition.wait(remaining)
+
+    def _execute(self, jobs):
+        # Nested when run at a preemption point, the paused job is current again afterwards
+        paused = getattr(self.local, "job", None)
+        self.local.job = jobs[0]
+        try:
+            if len(jobs) > 1:
+                outcomes = self._process_batch(jobs)
+            else:
+                outcomes = [self._process(job) for job in jobs]
+        finally:
+            self.local.job = paused
+        with self.condition:
+            for job, succeeded in zip(jobs, outcomes):
+                self.running.remove(job)
+                if succeeded:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def _process_batch(self, jobs):
+        # Jobs cancelled while queued are left out, the client is gone
+        outcomes = [True] * len(jobs)
+        live = [index for index, job in enumerate(jobs) if job["future"].set_running_or_notify_cancel()]
+        if not live:
+            return outcomes
+        try:
+            results = jobs[live[0]]["fn"]([jobs[index]["args"][0] for index in live])
+        except Exception as e:
+            logger.error(f"Inference failed: {e}")
+            results = [e] * len(live)
+        for index, result in zip(live, results):
+            if isinstance(result, Exception):
+                jobs[index]["future"].set_exception(result)
+                outcomes[index] = False
+            else:
+                jobs[index]["future"].set_result(result)
+        return outcomes
+
+    def _process(self, job):
+        future, sink = job["future"], job["sink"]
+        # Cancelled while queued, the client is gone
+        if not future.set_running_or_notify_cancel():
+            return True
+        if sink is not None and sink[2].is_set():
+            future.set_result(None)
+            return True
+        try:
+            if job["batch_key"] is not None:
+                # A batch of one
+                [result] = job["fn"]([job["args"][0]])
+                if isinstance(result, Exception):
+                    raise result
+            else:
+                result = job["fn"](*job["args"], **job["kwargs"])
+            if sink is not None:
+                self._pump(result, sink)
+            future.set_result(result)
+            return True
+        except Exception as e:
+            logger.error(f"Inference failed: {e}")
+            future.set_exception(e)
+            if sink is not None:
+                self._push(sink, e)
+            return False
+
+    def _pump(self, chunks, sink):
+        _, _, cancelled = sink
+        try:
+            for chunk in chunks:
+                self._push(sink, chunk)
+                if cancelled.is_set():
+                    break
+        finally:
+            # Lets the generator release what it holds, such as the priority gate
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+        self._push(sink, STREAM_END)
+
+    def _push(self, sink, item):
+        loop, chunks, _ = sink
+        try:
+            loop.call_soon_threadsafe(chunks.put_nowait, item)
+        except RuntimeError:
+            # The event loop is closed, nobody is listening any more
+            pass
@@ -1,9 +1,10 @@
 from TTS.api import TTS
-from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Query, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, Request, Query, File, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse,StreamingResponse
+from fastapi.responses import FileResponse,StreamingResponse,Response
+from starlette.concurrency import run_in_threadpool
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 import uvicorn
 from typing import Optional
 
@@ -18,8 +19,15 @@ from uuid import uuid4
 import tempfile
 import io
 import json
-
-from xtts_api_server.tts_funcs import TTSWrapper,supported_languages,InvalidSettingsError
+import hashlib
+import asyncio
+import torch
+
+from xtts_api_server.tts_funcs import TTSWrapper,SynthesisParams,supported_languages,InvalidSettingsError
+from xtts_api_server.latent_funcs import stream_latents_archive, encode_latents, decode_latents, dequantize_latents
+from xtts_api_server.latent_jobs import LatentJobQueue
+from xtts_api_server.scheduler import InferenceScheduler, QueueFullError
+from xtts_api_server.single_flight import SingleFlight
 from xtts_api_server.RealtimeTTS import TextToAudioStream, CoquiEngine
 from xtts_api_server.modeldownloader import check_stream2sentence_version,install_deepspeed_based_on_python_version
 import sys
@@ -42,6 +50,23 @@ MODEL_VERSION = os.getenv("MODEL_VERSION","v2.0.2")
 LOWVRAM_MODE = os.getenv("LOWVRAM_MODE") == 'true'
 DEEPSPEED = os.getenv("DEEPSPEED") == 'true'
 USE_CACHE = os.getenv("USE_CACHE") == 'true'
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "2048")) # In megabytes
+CACHE_POLICY = os.getenv("CACHE_POLICY", "lru")
+CACHE_MEMORY_SIZE = int(os.getenv("CACHE_MEMORY_SIZE", "256")) # In megabytes
+SENTENCE_CACHE = os.getenv("SENTENCE_CACHE") == 'true'
+MAX_LATENTS_UPLOAD = 16 * 1024 ** 2 # Bytes, binary /store_latents bodies
+MAX_REFERENCE_UPLOAD = 64 * 1024 ** 2 # Bytes, per reference wav uploaded for latents
+LATENT_CACHE_SIZE = int(os.getenv("LATENT_CACHE_SIZE", "512")) # In megabytes, per device
+LATENT_PRECISION = os.getenv("LATENT_PRECISION", "fp16")
+GPT_COND_LEN = int(os.getenv("GPT_COND_LEN", "6")) # Seconds of reference audio for the gpt latents
+MAX_REF_LENGTH = int(os.getenv("MAX_REF_LENGTH", "30")) # Seconds used of each reference file
+REFERENCE_TRIM_DB = int(os.getenv("REFERENCE_TRIM_DB")) if os.getenv("REFERENCE_TRIM_DB") else None
+SPEAKER_POLL_INTERVAL = float(os.getenv("SPEAKER_POLL_INTERVAL", "2")) # Seconds between checks of the speaker, latent and model folders
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1")) # Threads running synthesis
+QUEUE_SIZE = int(os.getenv("QUEUE_SIZE", "32")) # Synthesis requests waiting for a worker, more get a 429
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "1")) # Synthesis requests run together in one batch, 1 disables batching
+BATCH_WINDOW = float(os.getenv("BATCH_WINDOW_MS", "10")) / 1000 # Seconds a worker waits for a batch to fill up
+MAX_LISTING_VARIANTS = 256 # Serialized speaker listings kept, per filter combination
 
 # STREAMING VARS
 STREAM_MODE = os.getenv("STREAM_MODE") == 'true'
@@ -53,7 +78,15 @@ if(DEEPSPEED):
   
 # Create an instance of the TTSWrapper class and server
 app = FastAPI()
-XTTS = TTSWrapper(OUTPUT_FOLDER,SPEAKER_FOLDER,LATENT_SPEAKER_FOLDER,MODEL_FOLDER,LOWVRAM_MODE,MODEL_SOURCE,MODEL_VERSION,DEVICE,DEEPSPEED,USE_CACHE)
+XTTS = TTSWrapper(OUTPUT_FOLDER,SPEAKER_FOLDER,LATENT_SPEAKER_FOLDER,MODEL_FOLDER,LOWVRAM_MODE,MODEL_SOURCE,MODEL_VERSION,DEVICE,DEEPSPEED,USE_CACHE,CACHE_MAX_SIZE * 1024 ** 2,CACHE_POLICY,CACHE_MEMORY_SIZE * 1024 ** 2,SENTENCE_CACHE,LATENT_CACHE_SIZE * 1024 ** 2,LATENT_PRECISION,GPT_COND_LEN,MAX_REF_LENGTH,REFERENCE_TRIM_DB,SPEAKER_POLL_INTERVAL)
+# Latents from uploads are created in the background, after synthesis requests
+LATENT_JOBS = LatentJobQueue(XTTS)
+# Synthesis runs on its own threads, the event loop keeps serving other requests meanwhile
+SCHEDULER = InferenceScheduler(XTTS.realtime_factor, INFERENCE_WORKERS, QUEUE_SIZE, BATCH_SIZE, BATCH_WINDOW)
+# Synthesis of files and latents pauses between sentences for waiting live requests
+XTTS.preemption_point = SCHEDULER.preemption_point
+# Identical requests in flight share one generation
+SINGLE_FLIGHT = SingleFlight()
 
 # Check for old format model version
 XTTS.model_version = XTTS.check_model_version_old_format(MODEL_VERSION)
@@ -122,6 +155,68 @@ def play_stream(stream,language):
     else:
       stream.play_async()
 
+# Serialized speaker listings, (endpoint, filters) -> (registry version, body, etag, total)
+LISTING_CACHE = {}
+
+def listing_response(request, endpoint, filters, build):
+    """
+    Serves a speaker listing from its serialized form, built again only when the speaker
+    registry changed. `build` returns (content, total). Clients that send the ETag back in
+    If-None-Match get a 304 while the listing stays the same.
+    """
+    version = XTTS.speaker_registry.version
+    key = (endpoint, filters)
+    cached = LISTING_CACHE.get(key)
+    if cached is None or cached[0] != version:
+        content, total = build()
+        body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        # Taken from the content, a change on disk that leaves the listing as it was keeps the ETag
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if key not in LISTING_CACHE and len(LISTING_CACHE) >= MAX_LISTING_VARIANTS:
+            LISTING_CACHE.clear()
+        # Stored with the version read before building, a change during the build is picked up next time
+        cached = LISTING_CACHE[key] = (version, body, etag, total)
+
+    _, body, etag, total = cached
+    headers = {"ETag": etag, "X-Total-Count": str(total), "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+def queue_full(error, queue=SCHEDULER):
+    # Clients are told when a worker is expected to be free, from the measured real-time factor (or the run time of latent jobs)
+    return HTTPException(status_code=429, detail=f"Server is busy, {error}", headers={"Retry-After": str(queue.retry_after())})
+
+def request_params(request):
+    # Fixed when the request comes in, later /set_tts_settings calls do not change it while queued
+    try:
+        return XTTS.synthesis_params(**{name: getattr(request, name) for name in SynthesisParams._fields})
+    except InvalidSettingsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def read_and_remove(file_path):
+    with open(file_path, 'rb') as audio_file:
+        audio = audio_file.read()
+    os.unlink(file_path)
+    return audio
+
+def page(items, offset, limit):
+    return items[offset:] if limit is None else items[offset:offset + limit]
+
+def client_id(http_request):
+    # Fair queuing is per API key, or per address for clients without one
+    api_key = http_request.headers.get("x-api-key")
+    if api_key:
+        return "key:" + hashlib.sha1(api_key.encode("utf-8")).hexdigest()[:16]
+    return "ip:" + (http_request.client.host if http_request.client else "unknown")
+
+async def synthesize(priority, client, **request):
+    # Requests that arrive together share a batch when batching is on, streams are never batched
+    if SCHEDULER.max_batch_size > 1 and XTTS.model_source == "local":
+        return await SCHEDULER.run_batch(request["text"], "tts", XTTS.process_tts_to_file_batch, request, priority, client)
+    return await SCHEDULER.run(request["text"], XTTS.process_tts_to_file, priority=priority, client=client, **request)
+
 class OutputFolderRequest(BaseModel):
     output_folder: str
 
@@ -141,40 +236,69 @@ class TTSSettingsRequest(BaseModel):
     top_k: int
     enable_text_splitting: bool
 
-class SynthesisRequest(BaseModel):
+class SynthesisOverrides(BaseModel):
+    # Settings of this request only, the ones left out come from /set_tts_settings
+    temperature: Optional[float] = None
+    speed: Optional[float] = None
+    length_penalty: Optional[float] = None
+    repetition_penalty: Optional[float] = None
+    top_p: Optional[float] = None
+    top_k: Optional[int] = None
+    enable_text_splitting: Optional[bool] = None
+    stream_chunk_size: Optional[int] = None
+
+class SynthesisRequest(SynthesisOverrides):
     text: str
     speaker_wav: Optional[str] = None
     language: str
     accent: Optional[str] = None
     save_path: Optional[str] = None
 
-class SynthesisFileRequest(BaseModel):
+class SynthesisFileRequest(SynthesisOverrides):
     text: str
     speaker_wav: Optional[str] = None
     language: str
     file_name_or_path: str
     save_path: Optional[str] = None
 
-class TTSStreamRequest(BaseModel):
+class TTSStreamRequest(SynthesisOverrides):
     text: str
     speaker_wav: Optional[str] = None
     language: str
     save_path: Optional[str] = None
 
+class CacheEvictRequest(BaseModel):
+    keys: Optional[list[str]] = None
+    max_bytes: Optional[int] = None
+
 class StoreLatentsRequest(BaseModel):
     speaker_name: str
     language: str
     latents: dict  # Should contain 'gpt_cond_latent' and 'speaker_embedding' keys
 
 @app.get("/speakers_list")
-def get_speakers():
-    speakers = XTTS.get_speakers()
-    return speakers
+def get_speakers(request: Request, language: Optional[list[str]] = Query(None), offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1)):
+    # Speaker names per language, optionally only some languages and a page of each. X-Total-Count is the count before paging.
+    languages = tuple(sorted({code.lower() for code in language})) if language else None
+
+    def build():
+        speakers = XTTS.get_speakers()
+        selected = {code: info for code, info in speakers.items() if languages is None or code in languages}
+        total = sum(len(info['speakers']) for info in selected.values())
+        return {code: {**info, 'speakers': page(info['speakers'], offset, limit)} for code, info in selected.items()}, total
+
+    return listing_response(request, "speakers_list", (languages, offset, limit), build)
 
 @app.get("/speakers")
-def get_speakers():
-    speakers = XTTS.get_speakers_special()
-    return speakers
+def get_speakers(request: Request, language: Optional[str] = None, offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1)):
+    # SillyTavern format, with `language` the speakers of that language folder
+    language = language.lower() if language else None
+
+    def build():
+        speakers = XTTS.get_speakers_special(language)
+        return page(speakers, offset, limit), len(speakers)
+
+    return listing_response(request, "speakers", (language, offset, limit), build)
 
 @app.get("/languages")
 def get_languages():
@@ -197,6 +321,85 @@ def get_tts_settings():
     settings = {**XTTS.tts_settings,"stream_chunk_size":XTTS.stream_chunk_size}
     return settings
 
+@app.get("/cache/stats")
+def get_cache_stats():
+    if not XTTS.enable_cache_results and not XTTS.enable_sentence_cache:
+        raise HTTPException(status_code=400, detail="Caching is disabled, start the server with --use-cache or --sentence-cache")
+    stats = {}
+    if XTTS.enable_cache_results:
+        stats["memory"] = XTTS.hot_cache.stats()
+        stats["disk"] = XTTS.audio_cache.stats()
+    if XTTS.enable_sentence_cache:
+        stats["fragments"] = XTTS.get_fragment_stats()
+    return stats
+
+@app.get("/cache/entries")
+def get_cache_entries(offset: int = 0, limit: int = Query(100, le=1000)):
+    if not XTTS.enable_cache_results:
+        raise HTTPException(status_code=400, detail="Caching is disabled, start the server with --use-cache")
+    return XTTS.audio_cache.entries(offset, limit)
+
+@app.post("/cache/evict")
+def evict_cache(evict_req: CacheEvictRequest):
+    if not XTTS.enable_cache_results:
+        raise HTTPException(status_code=400, detail="Caching is disabled, start the server with --use-cache")
+    # Without keys or a size the whole cache is dropped
+    max_bytes = 0 if evict_req.keys is None and evict_req.max_bytes is None else evict_req.max_bytes
+    removed = XTTS.audio_cache.evict(max_bytes=max_bytes, keys=evict_req.keys)
+    # The memory tier only mirrors the disk tier, keep it from serving removed entries
+    XTTS.hot_cache.remove(evict_req.keys)
+    return {"message": f"Evicted {removed} entries", "stats": {"memory": XTTS.hot_cache.stats(), "disk": XTTS.audio_cache.stats()}}
+
+@app.get("/scheduler/stats")
+def get_scheduler_stats():
+    return {**SCHEDULER.stats(), "coalescing": SINGLE_FLIGHT.stats()}
+
+@app.get("/latents/stats")
+def get_latents_stats():
+    return {**XTTS.latents_cache.stats(), "reference_audio": XTTS.reference_audio.stats()}
+
+@app.post("/latents/rebuild")
+def rebuild_latents():
+    if XTTS.model_source == "api" or XTTS.model_source == "apiManual":
+        raise HTTPException(status_code=400, detail="Latents can only be rebuilt with a local model")
+    # Only speakers whose reference audio changed are computed again
+    counts = XTTS.create_latents_for_all()
+    return {"message": "Latents are up to date", **counts}
+
+@app.get("/latents/export")
+def export_latents(language: Optional[list[str]] = Query(None), since: Optional[float] = None):
+    # Streams the stored latents as a tar.gz, optionally only some languages or the ones written after `since` (unix time).
+    # The X-Exported-At header of an export is the `since` of the next delta.
+    languages = [code.lower() for code in language] if language else None
+    # Taken before listing, a file written during the export is in the next delta
+    exported_at = time.time()
+    files = XTTS.list_latent_files(languages, since)
+    manifest = {"exported_at": exported_at, "model_version": str(XTTS.model_version), "languages": languages, "since": since, "files": len(files)}
+    headers = {
+        "Content-Disposition": 'attachment; filename="latents.tar.gz"',
+        "X-Exported-At": str(exported_at)
+    }
+    return StreamingResponse(stream_latents_archive(files, manifest), media_type="application/gzip", headers=headers)
+
+@app.post("/latents/import")
+async def import_latents(request: Request):
+    # Takes an archive from /latents/export as the raw request body and applies it as one batch
+    # Spooled to disk as it arrives, a large archive is never held in memory
+    archive_file = tempfile.SpooledTemporaryFile(max_size=32 * 1024 ** 2)
+    try:
+        async for chunk in request.stream():
+            archive_file.write(chunk)
+        archive_file.seek(0)
+        imported = await run_in_threadpool(XTTS.import_latents, archive_file)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid latents archive: {e}")
+    finally:
+        archive_file.close()
+    return {
+        "message": f"Imported latents of {len(imported)} speakers",
+        "speakers": [f"{language_code}/{speaker_name}" for language_code, speaker_name in imported]
+    }
+
 @app.get("/sample/{file_name:path}")
 def get_sample(file_name: str):
     # A fix for path traversal vulenerability. 
@@ -247,7 +450,7 @@ def set_tts_settings_endpoint(tts_settings_req: TTSSettingsRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get('/tts_stream')
-async def tts_stream(request: TTSStreamRequest):
+async def tts_stream(request: TTSStreamRequest, http_request: Request):
     # Validate local model source.
     if XTTS.model_source != "local":
         raise HTTPException(status_code=400,
@@ -257,26 +460,43 @@ async def tts_stream(request: TTSStreamRequest):
         raise HTTPException(status_code=400,
                             detail="Language code sent is either unsupported or misspelled.")
             
-    async def generator():
-        chunks = XTTS.process_tts_to_file(
+    # Queued right away, a full queue is answered before the stream starts
+    try:
+        params = request_params(request)
+        # The chunk size changes the stream but not the audio, it is not part of the result key
+        key = (XTTS.get_request_key(request.text, request.speaker_wav, request.language.lower(), params=params), params.stream_chunk_size)
+        chunks = SINGLE_FLIGHT.stream(("stream", key), lambda: SCHEDULER.stream(
+            request.text,
+            XTTS.process_tts_to_file,
             text=request.text,
             speaker_name_or_path=request.speaker_wav,
             language=request.language.lower(),
             stream=True,
-        )
-        # Write file header to the output stream.
-        yield XTTS.get_wav_header()
-        async for chunk in chunks:
-            # Check if the client is still connected.
-            disconnected = await request.is_disconnected()
-            if disconnected:
-                break
-            yield chunk
+            params=params,
+            priority="interactive",
+            client=client_id(http_request),
+        ))
+    except QueueFullError as e:
+        raise queue_full(e)
+
+    async def generator():
+        try:
+            # Write file header to the output stream.
+            yield XTTS.get_wav_header()
+            async for chunk in chunks:
+                # Check if the client is still connected.
+                disconnected = await http_request.is_disconnected()
+                if disconnected:
+                    break
+                yield chunk
+        finally:
+            # Stops the generation on the worker
+            await chunks.aclose()
 
     return StreamingResponse(generator(), media_type='audio/x-wav')
 
 @app.post("/tts_to_audio/")
-async def tts_to_audio(request: SynthesisRequest, background_tasks: BackgroundTasks):
+async def tts_to_audio(request: SynthesisRequest, http_request: Request):
     if STREAM_MODE or STREAM_MODE_IMPROVE:
         try:
             global stream
@@ -320,18 +540,46 @@ async def tts_to_audio(request: SynthesisRequest, background_tasks: BackgroundTa
                 raise HTTPException(status_code=400,
                                     detail="Language code sent is either unsupported or misspelled.")
 
-            # Generate an audio file using process_tts_to_file.
-            output_file_path = XTTS.process_tts_to_file(
-                text=request.text,
-                speaker_name_or_path=request.speaker_wav,
-                language=request.language.lower(),
-                accent=request.accent,
-                file_name_or_path=request.save_path
-            )
-            
-            if not XTTS.enable_cache_results:
-                background_tasks.add_task(os.unlink, output_file_path)
-                
+            params = request_params(request)
+
+            # Repeated lines are served straight from memory without touching the disk.
+            cached_audio = await run_in_threadpool(XTTS.get_cached_audio, request.text, request.speaker_wav, request.language.lower(), request.accent, params)
+            if cached_audio is not None:
+                return Response(
+                    content=cached_audio,
+                    media_type='audio/wav',
+                    headers={"Content-Disposition": 'attachment; filename="output.wav"'},
+                    )
+
+            async def generate():
+                # Generate an audio file using process_tts_to_file, on an inference worker.
+                output_file_path = await synthesize(
+                    "interactive",
+                    client_id(http_request),
+                    text=request.text,
+                    speaker_name_or_path=request.speaker_wav,
+                    language=request.language.lower(),
+                    accent=request.accent,
+                    # Without a save path the file is removed after the response, concurrent requests must not share it
+                    file_name_or_path=request.save_path or f"tts_{uuid4().hex}.wav",
+                    params=params
+                )
+                if XTTS.enable_cache_results:
+                    return output_file_path, None
+                # Not kept, read once for every request that shares the generation
+                return None, await run_in_threadpool(read_and_remove, output_file_path)
+
+            # Identical requests in flight get the audio of the same generation
+            key = XTTS.get_request_key(request.text, request.speaker_wav, request.language.lower(), request.accent, params)
+            output_file_path, audio = await SINGLE_FLIGHT.run(("audio", key, request.save_path), generate)
+
+            if audio is not None:
+                return Response(
+                    content=audio,
+                    media_type='audio/wav',
+                    headers={"Content-Disposition": 'attachment; filename="output.wav"'},
+                    )
+
             # Return the file in the response
             return FileResponse(
                 path=output_file_path,
@@ -339,12 +587,16 @@ async def tts_to_audio(request: SynthesisRequest, background_tasks: BackgroundTa
                 filename="output.wav",
                 )
 
+        except QueueFullError as e:
+            raise queue_full(e)
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(e)
             raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.post("/tts_to_file")
-async def tts_to_file(request: SynthesisFileRequest):
+async def tts_to_file(request: SynthesisFileRequest, http_request: Request):
     try:
         if XTTS.model_source == "local":
           logger.info(f"Processing TTS to file with request: {request}")
@@ -354,33 +606,68 @@ async def tts_to_file(request: SynthesisFileRequest):
              raise HTTPException(status_code=400,
                                  detail="Language code sent is either unsupported or misspelled.")
 
-        # Now use process_tts_to_file for saving the file.
-        output_file = XTTS.process_tts_to_file(
+        # Now use process_tts_to_file for saving the file, on an inference worker.
+        # Files are made for later, live requests go first
+        params = request_params(request)
+        key = XTTS.get_request_key(request.text, request.speaker_wav, request.language.lower(), params=params)
+        output_file = await SINGLE_FLIGHT.run(("file", key, request.file_name_or_path), lambda: synthesize(
+            "bulk",
+            client_id(http_request),
             text=request.text,
             speaker_name_or_path=request.speaker_wav,
             language=request.language.lower(),
-            file_name_or_path=request.file_name_or_path  # The user-provided path to save the file is used here.
-        )
+            file_name_or_path=request.file_name_or_path,  # The user-provided path to save the file is used here.
+            params=params
+        ))
         return {"message": "The audio was successfully made and stored.", "output_path": output_file}
 
+    except QueueFullError as e:
+        raise queue_full(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
-@app.post("/create_latents")
-async def create_latents(wav_file: UploadFile = File(...)):
+async def read_reference_uploads(wav_files):
+    # Uploads are read in chunks into memory and decoded from there, no temp files
+    buffers = []
+    for wav_file in wav_files:
+        buffer = io.BytesIO()
+        while chunk := await wav_file.read(1024 * 1024):
+            buffer.write(chunk)
+            if buffer.tell() > MAX_REFERENCE_UPLOAD:
+                raise HTTPException(status_code=413, detail=f"{wav_file.filename} is too large")
+        buffer.seek(0)
+        buffers.append(buffer)
+    return buffers
+
+async def create_latents_from_uploads(wav_files, client):
+    buffers = await read_reference_uploads(wav_files)
+    # Decoding and conditioning run in worker threads, other requests are served meanwhile
     try:
-        # Create temporary file for the uploaded wav
-        temp_audio_name = next(tempfile._get_candidate_names()) + ".wav"
-        temp_audio_path = os.path.join(tempfile.gettempdir(), temp_audio_name)
+        prepared = await run_in_threadpool(XTTS.prepare_reference_audio, buffers)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Reference audio could not be used: {e}")
+    # The model is shared with synthesis, conditioning waits for an inference worker like it does
+    try:
+        [(gpt_cond_latent, speaker_embedding)] = await SCHEDULER.run("", XTTS.get_conditioning_latents_batch, [prepared], priority="background", client=client)
+    except QueueFullError as e:
+        raise queue_full(e)
+    return gpt_cond_latent, speaker_embedding
 
-        # Write uploaded file to temporary location
-        with open(temp_audio_path, "wb") as temp_file:
-            content = await wav_file.read()
-            temp_file.write(content)
+@app.post("/create_latents")
+async def create_latents(request: Request, wav_file: list[UploadFile] = File(...)):
+    try:
+        # Generate latents using XTTS model, several files make one voice
+        gpt_cond_latent, speaker_embedding = await create_latents_from_uploads(wav_file, client_id(request))
 
-        # Generate latents using XTTS model
-        gpt_cond_latent, speaker_embedding = XTTS.model.get_conditioning_latents(temp_audio_path)
+        # Binary clients get the latents in the safetensors layout of the latent files, fp16 like the JSON lists
+        if "application/octet-stream" in request.headers.get("accept", ""):
+            logger.info("Latents created successfully")
+            content = encode_latents({"gpt_cond_latent": gpt_cond_latent, "speaker_embedding": speaker_embedding},
+                                     {"model_version": str(XTTS.model_version)})
+            return Response(content=content, media_type="application/octet-stream")
 
         # Convert to lists for JSON serialization in canonical (no-squeeze) shape
         latents_data = {
@@ -388,9 +675,6 @@ async def create_latents(wav_file: UploadFile = File(...)):
             "speaker_embedding": speaker_embedding.cpu().half().tolist()
         }
 
-        # Clean up temporary file
-        os.unlink(temp_audio_path)
-
         logger.info("Latents created successfully")
 
         return {
@@ -398,65 +682,83 @@ async def create_latents(wav_file: UploadFile = File(...)):
             "latents": latents_data
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up temporary file if it exists
-        if 'temp_audio_path' in locals() and os.path.exists(temp_audio_path):
-            os.unlink(temp_audio_path)
         logger.error(f"Error creating latents: {e}")
         raise HTTPException(status_code=500, detail=f"Error creating latents: {str(e)}")
 
+def read_binary_latents(content):
+    # Latents in the safetensors layout, as /create_latents returns them to binary clients
+    try:
+        tensors = dequantize_latents(decode_latents(content)[0])
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Latents could not be decoded: {e}")
+    for key in ["gpt_cond_latent", "speaker_embedding"]:
+        if key not in tensors:
+            raise HTTPException(status_code=400, detail=f"Missing required key '{key}' in latents")
+    return tensors["gpt_cond_latent"], tensors["speaker_embedding"]
+
 @app.post("/store_latents")
-async def store_latents(request: StoreLatentsRequest):
+async def store_latents(request: Request, speaker_name: Optional[str] = None, language: Optional[str] = None):
     try:
+        if request.headers.get("content-type", "").startswith("application/octet-stream"):
+            # Binary upload, the speaker and language come in the query string
+            if not speaker_name or not language:
+                raise HTTPException(status_code=400, detail="speaker_name and language query parameters are required for binary latents")
+            # Read as it arrives, latents are small and anything much bigger is not latents
+            content = bytearray()
+            async for chunk in request.stream():
+                content += chunk
+                if len(content) > MAX_LATENTS_UPLOAD:
+                    raise HTTPException(status_code=413, detail="Latents upload is too large")
+            gpt_cond_latent, speaker_embedding = read_binary_latents(bytes(content))
+        else:
+            try:
+                store_req = StoreLatentsRequest(**await request.json())
+            except (ValidationError, TypeError, ValueError) as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            speaker_name, language = store_req.speaker_name, store_req.language
+
+            # Validate latents structure
+            if not isinstance(store_req.latents, dict):
+                raise HTTPException(status_code=400, detail="Latents must be a dictionary")
+
+            required_keys = ["gpt_cond_latent", "speaker_embedding"]
+            for key in required_keys:
+                if key not in store_req.latents:
+                    raise HTTPException(status_code=400, 
+                                      detail=f"Missing required key '{key}' in latents")
+            gpt_cond_latent = torch.tensor(store_req.latents["gpt_cond_latent"])
+            speaker_embedding = torch.tensor(store_req.latents["speaker_embedding"])
+
         # Validate language code
-        if request.language.lower() not in supported_languages:
+        if language.lower() not in supported_languages:
             raise HTTPException(status_code=400, 
                               detail="Language code sent is either unsupported or misspelled.")
-        
-        # Validate latents structure
-        if not isinstance(request.latents, dict):
-            raise HTTPException(status_code=400, detail="Latents must be a dictionary")
-        
-        required_keys = ["gpt_cond_latent", "speaker_embedding"]
-        for key in required_keys:
-            if key not in request.latents:
-                raise HTTPException(status_code=400, 
-                                  detail=f"Missing required key '{key}' in latents")
-        
-        # Create language folder if it doesn't exist
-        language_folder = os.path.join(XTTS.latent_speaker_folder, request.language.lower())
-        os.makedirs(language_folder, exist_ok=True)
-        
-        # Save latents to JSON file (will replace if exists)
-        json_file_path = os.path.join(language_folder, f"{request.speaker_name.lower()}.json")
-        with open(json_file_path, 'w') as json_file:
-            json.dump(request.latents, json_file)
 
-        # Hot-load latents into cache so they are immediately usable
-        try:
-            gpt_cond_latent, speaker_embedding = XTTS.load_latents_from_json(json_file_path)
-            cache_key = f"{request.speaker_name.lower()}_{request.language.lower()}"
-            XTTS.latents_cache[cache_key] = (gpt_cond_latent, speaker_embedding)
-            logger.info(f"Latents hot-loaded into cache for {cache_key}")
-        except Exception as e:
-            logger.error(f"Failed to hot-load latents into cache: {e}")
-        
-        logger.info(f"Latents stored for {request.speaker_name} in {request.language} at {json_file_path}")
+        # Save latents in the binary format (will replace if exists) and hot-load them into the cache, off the event loop
+        latent_file_path = await run_in_threadpool(XTTS.store_latents, speaker_name.lower(), language.lower(), gpt_cond_latent, speaker_embedding)
+
+        logger.info(f"Latents stored for {speaker_name} in {language} at {latent_file_path}")
         
         return {
-            "message": f"Latents stored for speaker '{request.speaker_name}' in language '{request.language}'",
-            "file_path": json_file_path
+            "message": f"Latents stored for speaker '{speaker_name}' in language '{language}'",
+            "file_path": latent_file_path
         }
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error storing latents: {e}")
         raise HTTPException(status_code=500, detail=f"Error storing latents: {str(e)}")
 
 @app.post("/create_and_store_latents")
 async def create_and_store_latents(
+    request: Request,
     speaker_name: str = Form(...),
     language: str = Form(...),
-    wav_file: UploadFile = File(...)
+    wav_file: list[UploadFile] = File(...)
 ):
     try:
         # Validate language code
@@ -464,59 +766,78 @@ async def create_and_store_latents(
             raise HTTPException(status_code=400,
                                 detail="Language code sent is either unsupported or misspelled.")
 
-        # Create temporary file for the uploaded wav
-        temp_audio_name = next(tempfile._get_candidate_names()) + ".wav"
-        temp_audio_path = os.path.join(tempfile.gettempdir(), temp_audio_name)
-
-        # Write uploaded file to temporary location
-        with open(temp_audio_path, "wb") as temp_file:
-            content = await wav_file.read()
-            temp_file.write(content)
-
-        # Generate latents using XTTS model
-        gpt_cond_latent, speaker_embedding = XTTS.model.get_conditioning_latents(temp_audio_path)
-
-        # Convert to lists for JSON serialization in canonical (no-squeeze) shape
-        latents_data = {
-            "gpt_cond_latent": gpt_cond_latent.cpu().half().tolist(),
-            "speaker_embedding": speaker_embedding.cpu().half().tolist()
-        }
-
-        # Ensure language folder exists in the latents directory
-        language_folder = os.path.join(XTTS.latent_speaker_folder, language.lower())
-        os.makedirs(language_folder, exist_ok=True)
-
-        # Save latents to JSON file (will replace if exists)
-        json_file_path = os.path.join(language_folder, f"{speaker_name.lower()}.json")
-        with open(json_file_path, 'w') as json_file:
-            json.dump(latents_data, json_file)
-
-        # Hot-load latents into cache so they are immediately usable
-        try:
-            loaded_gpt_cond_latent, loaded_speaker_embedding = XTTS.load_latents_from_json(json_file_path)
-            cache_key = f"{speaker_name.lower()}_{language.lower()}"
-            XTTS.latents_cache[cache_key] = (loaded_gpt_cond_latent, loaded_speaker_embedding)
-            logger.info(f"Latents hot-loaded into cache for {cache_key}")
-        except Exception as e:
-            logger.error(f"Failed to hot-load latents into cache: {e}")
+        # Generate latents using XTTS model, several files make one voice
+        gpt_cond_latent, speaker_embedding = await create_latents_from_uploads(wav_file, client_id(request))
 
-        # Clean up temporary file
-        os.unlink(temp_audio_path)
+        # Save latents in the binary format (will replace if exists) and hot-load them into the cache, off the event loop
+        latent_file_path = await run_in_threadpool(XTTS.store_latents, speaker_name.lower(), language.lower(), gpt_cond_latent, speaker_embedding)
 
-        logger.info(f"Latents created and stored for {speaker_name} in {language} at {json_file_path}")
+        logger.info(f"Latents created and stored for {speaker_name} in {language} at {latent_file_path}")
 
         return {
             "message": f"Latents stored for speaker '{speaker_name}' in language '{language}'",
-            "file_path": json_file_path
+            "file_path": latent_file_path
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up temporary file if it exists
-        if 'temp_audio_path' in locals() and os.path.exists(temp_audio_path):
-            os.unlink(temp_audio_path)
         logger.error(f"Error creating and storing latents: {e}")
         raise HTTPException(status_code=500, detail=f"Error creating and storing latents: {str(e)}")
 
+@app.post("/latents/jobs", status_code=202)
+async def submit_latent_job(
+    speaker_name: str = Form(...),
+    language: str = Form(...),
+    wav_file: list[UploadFile] = File(...)
+):
+    # Same form as /create_and_store_latents, but returns a job id right away
+    # Poll /latents/jobs/{job_id} or follow /latents/jobs/{job_id}/events until the job is done
+    if XTTS.model_source == "api" or XTTS.model_source == "apiManual":
+        raise HTTPException(status_code=400, detail="Latents can only be created with a local model")
+    if language.lower() not in supported_languages:
+        raise HTTPException(status_code=400,
+                            detail="Language code sent is either unsupported or misspelled.")
+
+    buffers = await read_reference_uploads(wav_file)
+    try:
+        return LATENT_JOBS.submit(speaker_name.lower(), language.lower(), buffers)
+    except QueueFullError as e:
+        raise queue_full(e, LATENT_JOBS)
+
+@app.get("/latents/jobs")
+def list_latent_jobs():
+    # Queue depth, average wait and run times, and the queued, running and recently finished jobs
+    return {**LATENT_JOBS.stats(), "jobs": LATENT_JOBS.list_jobs()}
+
+@app.get("/latents/jobs/{job_id}")
+def get_latent_job(job_id: str):
+    job = LATENT_JOBS.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Latent job {job_id} not found")
+    return job
+
+@app.get("/latents/jobs/{job_id}/events")
+async def latent_job_events(job_id: str, request: Request):
+    # Server-sent events, one with the job status on every change until it is done or failed
+    if LATENT_JOBS.status(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Latent job {job_id} not found")
+
+    async def generator():
+        last_seen = None
+        while not await request.is_disconnected():
+            job = LATENT_JOBS.status(job_id)
+            if job is None:
+                break
+            if (job["version"], job.get("position")) != last_seen:
+                last_seen = (job["version"], job.get("position"))
+                yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+            if job["status"] in ("done", "failed"):
+                break
+            await asyncio.sleep(0.25)
+
+    return StreamingResponse(generator(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.on_event("startup")
 async def show_disclaimer():
     disclaimer_message = """
@@ -0,0 +1,138 @@
+import asyncio
+
+class SingleFlight:
+    """
+    Identical requests in flight share one generation: the first one starts it, the ones that
+    arrive before it finishes wait for the same result, or receive the same stream from its
+    first chunk. Runs on the event loop, needs no locks.
+
+    The generation is cancelled only when every request waiting for it went away.
+    """
+
+    def __init__(self):
+        self.calls = {} # key -> {"task": asyncio.Task, "waiters": int}
+        self.streams = {} # key -> {"chunks": [...], "done": bool, "error": exception, "changed": asyncio.Event, "task": asyncio.Task, "waiters": int}
+        self.started = 0 # Generations run
+        self.coalesced = 0 # Requests that joined one in flight instead of running their own
+
+    async def run(self, key, start):
+        """ Result of `start()`, a coroutine function, shared with the identical requests in flight. """
+        call = self.calls.get(key)
+        if call is None:
+            call = {"task": asyncio.ensure_future(start()), "waiters": 0}
+            self.calls[key] = call
+            self.started += 1
+            call["task"].add_done_callback(lambda _: self._forget(self.calls, key, call))
+        else:
+            self.coalesced += 1
+
+        call["waiters"] += 1
+        try:
+            # Shielded, one client going away must not cancel the generation of the others
+            return await asyncio.shield(call["task"])
+        finally:
+            call["waiters"] -= 1
+            if call["waiters"] == 0 and not call["task"].done():
+                call["task"].cancel()
+
+    def stream(self, key, start):
+        """
+        Async iterator of the chunks of `start()`, which returns an async iterator, shared with
+        the identical streams in flight. Chunks are kept until the stream ends, so a request
+        that joins late gets them all.
+        """
+        shared = self.streams.get(key)
+        if shared is None:
+            # Started right away, errors of the start (such as a full queue) are raised here
+            source = start()
+            shared = {"chunks": [], "done": False, "error": None, "changed": asyncio.Event(), "waiters": 0}
+            shared["task"] = asyncio.ensure_future(self._pump(source, shared))
+            self.streams[key] = shared
+            self.started += 1
+            shared["task"].add_done_callback(lambda _: self._forget(self.streams, key, shared))
+        else:
+            self.coalesced += 1
+        return _Follower(self._follow(shared), shared)
+
+    def stats(self):
+        return {
+            "in_flight": len(self.calls) + len(self.streams),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+    async def _pump(self, source, shared):
+        try:
+            async for chunk in source:
+                shared["chunks"].append(chunk)
+                shared["changed"].set()
+        except Exception as e:
+            shared["error"] = e
+        finally:
+            await source.aclose()
+            shared["done"] = True
+            shared["changed"].set()
+
+    async def _follow(self, shared):
+        position = 0
+        while True:
+            while position < len(shared["chunks"]):
+                yield shared["chunks"][position]
+                position += 1
+            if shared["done"]:
+                if shared["error"] is not None:
+                    raise shared["error"]
+                return
+            shared["changed"].clear()
+            await shared["changed"].wait()
+
+    def _forget(self, calls, key, call):
+        # A newer call may have taken the key
+        if calls.get(key) is call:
+            del calls[key]
+
+class _Follower:
+    """
+    One request's place on a shared stream, an async iterator of its chunks. The place is
+    given up when the stream ends, fails or is closed, and also when the follower is dropped
+    without ever being iterated, which an async generator would not notice.
+    """
+
+    def __init__(self, chunks, shared):
+        self.chunks = chunks
+        self.shared = shared
+        self.released = False
+        shared["waiters"] += 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.chunks.__anext__()
+        except BaseException:
+            # The end of the stream, its error, or the request being cancelled
+            self.release()
+            raise
+
+    async def aclose(self):
+        try:
+            await self.chunks.aclose()
+        finally:
+            self.release()
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        self.shared["waiters"] -= 1
+        if self.shared["waiters"] == 0 and not self.shared["task"].done():
+            # Nobody listens any more, stops the generation on the worker
+            self.shared["task"].cancel()
+
+    def __del__(self):
+        try:
+            self.release()
+        except RuntimeError:
+            # The event loop is closed already, so is the generation
+            pass
@@ -0,0 +1,232 @@
+import os
+import threading
+import time
+
+from loguru import logger
+
+from xtts_api_server.latent_funcs import LATENT_EXTENSION
+
+class SpeakerRegistry:
+    """
+    In-memory index of the speaker, latent and model folders, so resolving a speaker is a
+    dict lookup and the speaker lists are ready-made snapshots.
+
+    Every directory listing is kept with the mtime it was taken at. A refresh stats the known
+    directories and lists again only the ones that changed, then rebuilds the views when
+    anything did. A watcher thread refreshes every `poll_interval` seconds; latents written by
+    the server itself are added right away with add_latent.
+
+    Speakers and latents are keyed by their lowercased name, lookups ignore case like the
+    filesystems of most players do. The entries keep the names as they are on disk.
+
+    Layouts, as the rest of the server reads them:
+      speaker_folder/<language>/<speaker>.wav or speaker_folder/<language>/<speaker>/*.wav
+      latent_speaker_folder/<language>/<speaker>.safetensors (or legacy .json)
+      model_folder/<model>/ (with reference.wav for models that are used as a speaker)
+    """
+
+    def __init__(self, speaker_folder, latent_speaker_folder, model_folder):
+        self.speaker_folder = speaker_folder
+        self.latent_speaker_folder = latent_speaker_folder
+        self.model_folder = model_folder
+        self.lock = threading.RLock()
+        self.listings = {} # directory -> (mtime_ns, {name: is_dir})
+        self.version = 0 # Bumped whenever the views change, snapshots can be compared by it
+
+        # Views, replaced as a whole and never changed in place, readers need no lock
+        self.speakers = {} # language code -> {lowercased speaker_name: {speaker_name, speaker_wav, preview}}
+        self.root_speakers = [] # Speakers right in the speaker folder, see TTSWrapper.get_speakers_special
+        self.latents = {} # language code -> {lowercased speaker_name: latent file path}
+        self.models = {} # model folder name -> path of its reference.wav or None
+        self.speaker_lists = {} # language code -> {"speakers": [...]}, the /speakers_list snapshot
+
+        self.watcher = None
+        self.refresh()
+
+    # LOOKUPS
+    def latent_path(self, speaker_name, language_code):
+        """ Path of the stored latents of a speaker, or None. """
+        return self.latents.get(language_code, {}).get(speaker_name.lower())
+
+    def speaker(self, speaker_name, language_code):
+        """ {speaker_name, speaker_wav, preview} of a speaker with reference files, or None. """
+        if speaker_name.endswith('.wav'):
+            speaker_name = speaker_name[:-len('.wav')]
+        return self.speakers.get(language_code, {}).get(speaker_name.lower())
+
+    # UPDATES
+    def add_latent(self, language_code, speaker_name, file_path):
+        """ Records latents the server just wrote, without waiting for the watcher. """
+        with self.lock:
+            latents = dict(self.latents.get(language_code, {}))
+            # The binary file wins over a legacy JSON of the same speaker
+            if latents.get(speaker_name.lower(), "").endswith(LATENT_EXTENSION) and not file_path.endswith(LATENT_EXTENSION):
+                return
+            latents[speaker_name.lower()] = file_path
+            self._publish_latents(language_code, latents)
+
+    def remove_latent(self, language_code, speaker_name):
+        with self.lock:
+            latents = dict(self.latents.get(language_code, {}))
+            if latents.pop(speaker_name.lower(), None) is not None:
+                self._publish_latents(language_code, latents)
+
+    def set_speaker_folder(self, speaker_folder):
+        with self.lock:
+            self.speaker_folder = speaker_folder
+            self.refresh()
+
+    def refresh(self):
+        """ Brings the views in line with the folders, returns whether anything changed. """
+        with self.lock:
+            seen = set()
+            changed = False
+            # Speaker folder, two levels deep: language folders (or speakers of the old flat layout) and the speaker folders in them
+            root_entries, root_changed = self._listing(self.speaker_folder, seen)
+            changed |= root_changed
+            for name, is_dir in root_entries.items():
+                if is_dir:
+                    language_path = os.path.join(self.speaker_folder, name)
+                    entries, entries_changed = self._listing(language_path, seen)
+                    changed |= entries_changed
+                    for speaker_name, speaker_is_dir in entries.items():
+                        if speaker_is_dir:
+                            changed |= self._listing(os.path.join(language_path, speaker_name), seen)[1]
+
+            latent_entries, latents_changed = self._listing(self.latent_speaker_folder, seen)
+            changed |= latents_changed
+            for name, is_dir in latent_entries.items():
+                # Dot folders are imports being staged
+                if is_dir and not name.startswith("."):
+                    changed |= self._listing(os.path.join(self.latent_speaker_folder, name), seen)[1]
+
+            model_entries, models_changed = self._listing(self.model_folder, seen)
+            changed |= models_changed
+            for name, is_dir in model_entries.items():
+                if is_dir:
+                    changed |= self._listing(os.path.join(self.model_folder, name), seen)[1]
+
+            # Folders that are gone, or no longer under a watched folder
+            for directory in set(self.listings) - seen:
+                del self.listings[directory]
+                changed = True
+
+            if changed or not self.version:
+                self._rebuild()
+            return changed
+
+    # WATCHER
+    def start(self, poll_interval):
+        """ Refreshes every `poll_interval` seconds in a daemon thread, 0 disables it. """
+        if poll_interval <= 0 or self.watcher is not None:
+            return
+        self.watcher = threading.Thread(target=self._watch, args=(poll_interval,), name="speaker-registry", daemon=True)
+        self.watcher.start()
+
+    def _watch(self, poll_interval):
+        while True:
+            time.sleep(poll_interval)
+            try:
+                if self.refresh():
+                    logger.info(f"Speakers changed on disk, {sum(map(len, self.speakers.values()))} speakers and {sum(map(len, self.latents.values()))} latents known")
+            except Exception as e:
+                logger.error(f"Failed to refresh the speaker registry: {e}")
+
+    # INTERNALS
+    def _listing(self, directory, seen):
+        """ ({name: is_dir}, changed) of a directory, listed again only when its mtime changed. """
+        seen.add(directory)
+        cached = self.listings.get(directory)
+        try:
+            # Taken before listing, a change during the listing shows up in the next refresh
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            seen.discard(directory)
+            return {}, cached is not None
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1], False
+
+        entries = {}
+        try:
+            with os.scandir(directory) as scanned:
+                for entry in scanned:
+                    try:
+                        entries[entry.name] = entry.is_dir()
+                    except OSError:
+                        continue
+        except OSError:
+            seen.discard(directory)
+            return {}, cached is not None
+        self.listings[directory] = (mtime_ns, entries)
+        return entries, True
+
+    def _entries(self, directory):
+        cached = self.listings.get(directory)
+        return cached[1] if cached is not None else {}
+
+    def _scan_speakers(self, path):
+        """ Speakers in a folder, same as TTSWrapper._get_speakers but from the listings. """
+        speakers = {}
+        for name, is_dir in sorted(self._entries(path).items()):
+            full_path = os.path.join(path, name)
+            if is_dir:
+                # Multi-sample voice, folders without WAV files are no speakers
+                wav_files = sorted(f for f in self._entries(full_path) if f.endswith('.wav'))
+                if wav_files:
+                    speakers[name.lower()] = {
+                        'speaker_name': name,
+                        'speaker_wav': [os.path.join(path, name, f) for f in wav_files],
+                        # Use the first file as the preview
+                        'preview': os.path.join(name, wav_files[0])
+                    }
+            elif name.endswith('.wav'):
+                speaker_name = os.path.splitext(name)[0]
+                speakers.setdefault(speaker_name.lower(), {
+                    'speaker_name': speaker_name,
+                    'speaker_wav': full_path,
+                    'preview': name
+                })
+        return speakers
+
+    def _scan_latents(self, path):
+        latents = {}
+        for name, is_dir in self._entries(path).items():
+            speaker_name, extension = os.path.splitext(name)
+            if is_dir or extension not in (LATENT_EXTENSION, '.json'):
+                continue
+            # The binary format wins over legacy JSON
+            if extension == LATENT_EXTENSION or speaker_name.lower() not in latents:
+                latents[speaker_name.lower()] = os.path.join(path, name)
+        return latents
+
+    def _rebuild(self):
+        language_codes = sorted(name for name, is_dir in self._entries(self.speaker_folder).items() if is_dir)
+        self.speakers = {language_code: self._scan_speakers(os.path.join(self.speaker_folder, language_code)) for language_code in language_codes}
+        self.root_speakers = list(self._scan_speakers(self.speaker_folder).values())
+
+        self.latents = {name: self._scan_latents(os.path.join(self.latent_speaker_folder, name))
+                        for name, is_dir in self._entries(self.latent_speaker_folder).items() if is_dir and not name.startswith(".")}
+
+        models = {}
+        for name, is_dir in self._entries(self.model_folder).items():
+            if is_dir:
+                has_reference = self._entries(os.path.join(self.model_folder, name)).get("reference.wav") is False
+                models[name] = os.path.join(self.model_folder, name, "reference.wav") if has_reference else None
+        self.models = models
+
+        self._publish_speaker_lists()
+
+    def _publish_latents(self, language_code, latents):
+        self.latents = {**self.latents, language_code: latents}
+        self._publish_speaker_lists()
+
+    def _publish_speaker_lists(self):
+        # Per language folder of the speakers: stored latents, plus folder speakers without latents.
+        # A speaker with both is listed once, by the name of its folder.
+        speaker_lists = {}
+        for language_code, speakers in self.speakers.items():
+            names = {key: os.path.splitext(os.path.basename(file_path))[0] for key, file_path in self.latents.get(language_code, {}).items()}
+            names.update({key: speaker['speaker_name'] for key, speaker in speakers.items() if isinstance(speaker['speaker_wav'], list)})
+            speaker_lists[language_code] = {'speakers': sorted(names.values())}
+        self.speaker_lists = speaker_lists
+        self.version += 1
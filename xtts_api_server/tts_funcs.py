@@ -2,13 +2,20 @@
 
 import torch
 import torchaudio
+import librosa
 from TTS.api import TTS
 
 from TTS.tts.configs.xtts_config import XttsConfig
-from TTS.tts.models.xtts import Xtts
+from TTS.tts.models.xtts import Xtts, load_audio, wav_to_mel_cloning
 from pathlib import Path
 
 from xtts_api_server.modeldownloader import download_model
+from xtts_api_server.cache_funcs import AudioCache, HotCache, ReferenceAudioCache, make_cache_key
+from xtts_api_server.latent_jobs import PriorityGate
+from xtts_api_server.speaker_registry import SpeakerRegistry
+from xtts_api_server.scheduler import RealtimeFactor
+from xtts_api_server.batch_inference import generate_batch, split_text
+from xtts_api_server.latent_funcs import LATENT_EXTENSION, LatentCache, LatentPack, save_latents, load_latents, load_latents_json, load_latents_metadata, reference_fingerprint, link_latents, read_latents_archive, quantize_latents, dequantize_latents
 
 from loguru import logger
 from datetime import datetime
@@ -21,6 +28,12 @@ import io
 import wave
 import numpy as np
 import sys
+import shutil
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
 
 # Remove the default logger to avoid conflicts
 logger.remove()
@@ -63,18 +76,96 @@ default_tts_settings = {
     "enable_text_splitting": True
 }
 
+def validate_tts_settings(temperature, speed, length_penalty, repetition_penalty, top_p, top_k, enable_text_splitting, stream_chunk_size):
+    """ Rules of /set_tts_settings, the per-request overrides are checked with them as well. """
+    # Check temperature
+    if not (0.01 <= temperature <= 1):
+        raise InvalidSettingsError("Temperature must be between 0.01 and 1.")
+    
+    # Check speed
+    if not (0.2 <= speed <= 2):
+        raise InvalidSettingsError("Speed must be between 0.2 and 2.")
+    
+    # Check length_penalty (no explicit range specified)
+    if not isinstance(length_penalty, float):
+        raise InvalidSettingsError("Length penalty must be a floating point number.")
+    
+    # Check repetition_penalty
+    if not (0.1 <= repetition_penalty <= 10.0):
+        raise InvalidSettingsError("Repetition penalty must be between 0.1 and 10.0.")
+    
+    # Check top_p
+    if not (0.01 <= top_p <= 1):
+        raise InvalidSettingsError("Top_p must be between 0.01 and 1 and must be a float.")
+    
+    # Check top_k
+    if not (1 <= top_k <= 100):
+        raise InvalidSettingsError("Top_k must be an integer between 1 and 100.")
+
+    # Check stream_chunk_size
+    if not (20 <= stream_chunk_size <= 400):
+        raise InvalidSettingsError("Stream chunk size must be an integer between 20 and 400.")
+    
+    # Check enable_text_splitting
+    if not isinstance(enable_text_splitting, bool):
+        raise InvalidSettingsError("Enable text splitting must be either True or False.")
+
+class SynthesisParams(NamedTuple):
+    """
+    Settings of one synthesis, fixed when the request is accepted: changes of the defaults
+    through /set_tts_settings do not affect requests that are already queued.
+    """
+    temperature: float
+    speed: float
+    length_penalty: float
+    repetition_penalty: float
+    top_p: float
+    top_k: int
+    enable_text_splitting: bool
+    stream_chunk_size: int
+
+    @property
+    def tts_settings(self):
+        """ Keyword arguments of Xtts.inference, and what goes into the cache keys. """
+        settings = self._asdict()
+        del settings["stream_chunk_size"]
+        return settings
+
 official_model_list = ["v2.0.0","v2.0.1","v2.0.2","v2.0.3","main"]
 official_model_list_v2 = ["2.0.0","2.0.1","2.0.2","2.0.3"]
 
+# Same settings as the defaults of Xtts.get_conditioning_latents, batched latents must match them.
+# Reference length, gpt conditioning length and silence trimming can be changed per server.
+REFERENCE_SAMPLE_RATE = 22050
+MAX_REF_LENGTH = 30 # Seconds of each reference file
+GPT_COND_LEN = 6 # Seconds of audio used for the gpt latents
+GPT_COND_CHUNK_LEN = 6 # Seconds per gpt conditioning chunk, capped at gpt_cond_len
+MIN_CHUNK_SECONDS = 0.33
+LATENT_BATCH_SIZE = 16 # Speakers per batch in create_latents_for_all
+
 reversed_supported_languages = {name: code for code, name in supported_languages.items()}
 
 class TTSWrapper:
-    def __init__(self,output_folder = "./output", speaker_folder="./speakers",latent_speaker_folder = "./latent_speakers",model_folder="./xtts_folder",lowvram = False,model_source = "local",model_version = "2.0.2",device = "cuda",deepspeed = False,enable_cache_results = True):
+    def __init__(self,output_folder = "./output", speaker_folder="./speakers",latent_speaker_folder = "./latent_speakers",model_folder="./xtts_folder",lowvram = False,model_source = "local",model_version = "2.0.2",device = "cuda",deepspeed = False,enable_cache_results = True,cache_max_bytes = 2 * 1024 ** 3,cache_policy = "lru",cache_memory_bytes = 256 * 1024 ** 2,enable_sentence_cache = False,latent_cache_bytes = 512 * 1024 ** 2,latent_precision = "fp16",gpt_cond_len = GPT_COND_LEN,max_ref_length = MAX_REF_LENGTH,reference_trim_db = None,speaker_poll_interval = 2.0):
         self.cuda = device # If the user has chosen what to use, we rewrite the value to the value we want to use
         self.device = 'cpu' if lowvram else (self.cuda if torch.cuda.is_available() else "cpu")
         self.lowvram = lowvram  # Store whether we want to run in low VRAM mode.
 
-        self.latents_cache = {} 
+        self.latent_precision = latent_precision # fp32, fp16 or int8, for latent files and resident latents
+        self.latents_cache = LatentCache(latent_cache_bytes, latent_precision) # Resident latents, loaded on demand
+        self.gpt_cond_len = gpt_cond_len
+        self.max_ref_length = max_ref_length
+        self.reference_trim_db = reference_trim_db # Silence quieter than this many dB below the peak is trimmed, None keeps it
+        self.latent_packs = {} # language code -> LatentPack
+        self.latent_packs_lock = threading.Lock() # One pack per language, request threads and latent jobs open them
+        self.import_lock = threading.Lock()
+        self.priority_gate = PriorityGate() # Synthesis goes before background latent jobs
+        # Held while the model generates. Generation keeps per-call state on the model (the GPT
+        # prefix), and lowvram moves it between devices, so inference workers take turns. Reentrant,
+        # work run at a preemption point generates on the thread that already holds it.
+        self.model_lock = threading.RLock()
+        self.realtime_factor = RealtimeFactor() # Measured synthesis speed, for the queue estimates
+        self.preemption_point = None # Called between sentences so more urgent work can run first, see InferenceScheduler
 
         self.model_source = model_source
         self.model_version = model_version
@@ -89,17 +180,36 @@ class TTSWrapper:
         self.latent_speaker_folder = latent_speaker_folder
 
         self.create_directories()
+        # Speakers, latents and models on disk, kept up to date by polling the folders
+        self.speaker_registry = SpeakerRegistry(speaker_folder, latent_speaker_folder, model_folder)
+        self.speaker_registry.start(speaker_poll_interval)
         self.enable_cache_results = enable_cache_results
-        self.cache_file_path = os.path.join(output_folder, "cache.json")
+        self.cache_folder = os.path.join(output_folder, "cache")
+        self.audio_cache = None
+        self.hot_cache = None
+        self.enable_sentence_cache = enable_sentence_cache
+        self.fragment_cache = None
+        self.fragment_seconds = 0.0 # Audio seconds served from cached sentences
+        self.generated_seconds = 0.0 # Audio seconds produced with the sentence cache on
 
         self.is_official_model = True
         
         self.current_model = None
         
         if self.enable_cache_results:
-            # Reset the contents of the cache file at each initialization.
-            with open(self.cache_file_path, 'w') as cache_file:
-                json.dump({}, cache_file)
+            # The cache index is persistent, results from previous runs are still served.
+            self.audio_cache = AudioCache(self.cache_folder, cache_max_bytes, cache_policy)
+            self.hot_cache = HotCache(cache_memory_bytes)
+
+        if self.enable_sentence_cache:
+            self.fragment_cache = AudioCache(os.path.join(output_folder, "fragment_cache"), cache_max_bytes, cache_policy)
+
+        # Reference files are decoded once, conditioning reads them from here
+        self.reference_audio = ReferenceAudioCache(os.path.join(output_folder, "reference_cache"), {
+            "sample_rate": REFERENCE_SAMPLE_RATE,
+            "max_ref_length": max_ref_length,
+            "trim_db": reference_trim_db
+        })
     # HELP FUNC
     def isModelOfficial(self,model_version):
         if model_version in official_model_list:
@@ -113,11 +223,8 @@ class TTSWrapper:
         return model_version
 
     def get_models_list(self):
-        # Fetch all entries in the directory given by self.model_folder
-        entries = os.listdir(self.model_folder)
-        
-        # Filter out and return only directories, converted to lowercase without spaces
-        return [name.lower().replace(' ', '') for name in entries if os.path.isdir(os.path.join(self.model_folder, name))]
+        # Folders in the models folder, converted to lowercase without spaces
+        return [name.lower().replace(' ', '') for name in self.speaker_registry.models]
         
 
     def get_wav_header(self, channels:int=1, sample_rate:int=24000, width:int=2) -> bytes:
@@ -131,45 +238,73 @@ class TTSWrapper:
         return wav_buf.read()
 
     # CACHE FUNCS
-    def check_cache(self, text_params):
+    def get_cache_params(self, clear_text, speaker_name, language, accent, params=None):
+        """ Canonical form of a request, everything that changes the generated audio goes in here. """
+        params = params or self.synthesis_params()
+        return {
+            'text': clear_text,
+            'speaker': speaker_name.lower(),
+            'language': language,
+            'accent': accent,
+            'tts_settings': params.tts_settings,
+            'model_version': self.model_version
+        }
+
+    def get_request_key(self, text, speaker_name_or_path, language, accent=None, params=None):
+        """ Key of everything that changes the audio of a request, the cache key of its result. """
+        accent = language if accent is None else accent
+        return make_cache_key(self.get_cache_params(self.prepare_text(text), speaker_name_or_path, language, accent, params))
+
+    def get_cached_audio(self, text, speaker_name_or_path, language, accent=None, params=None):
+        """ Returns the cached WAV bytes for a request, from memory when possible, or None. """
         if not self.enable_cache_results:
             return None
 
-        try:
-            with open(self.cache_file_path) as cache_file:
-                cache_data = json.load(cache_file)
-
-            for entry in cache_data.values():
-                if all(entry[key] == value for key, value in text_params.items()):
-                    return entry['file_name']
+        key = self.get_request_key(text, speaker_name_or_path, language, accent, params)
+        audio = self.hot_cache.get(key)
+        if audio is not None:
+            return audio
 
+        # A miss here is followed by the lookup in process_tts_to_file, count it only there
+        cached_path = self.audio_cache.get(key, record_miss=False)
+        if cached_path is None:
             return None
-
+        try:
+            with open(cached_path, 'rb') as cached_file:
+                audio = cached_file.read()
         except FileNotFoundError:
+            # Evicted between the lookup and the read
             return None
+        self.hot_cache.put(key, audio)
+        return audio
+
+    def get_fragment_stats(self):
+        return {
+            **self.fragment_cache.stats(),
+            'fragment_seconds': self.fragment_seconds,
+            'generated_seconds': self.generated_seconds,
+            'fragment_fraction': self.fragment_seconds / self.generated_seconds if self.generated_seconds else 0.0
+        }
 
-    def update_cache(self, text_params, file_name):
+    def check_cache(self, text_params):
         if not self.enable_cache_results:
             return None
-        try:
-            # Check if the file exists and its contents before downloading.
-            if os.path.exists(self.cache_file_path) and os.path.getsize(self.cache_file_path) > 0:
-                with open(self.cache_file_path, 'r') as cache_file:
-                    cache_data = json.load(cache_file)
-            else:
-                cache_data = {}  # Initialization of an empty dictionary if the file does not exist or is empty.
 
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            cache_data[timestamp] = {**text_params, 'file_name': file_name}
-
-            with open(self.cache_file_path, 'w') as cache_file:
-                json.dump(cache_data, cache_file)
+        return self.audio_cache.get(make_cache_key(text_params))
 
+    def update_cache(self, text_params, file_name):
+        """ Stores the result in the cache, returns the path the caller should hand out. """
+        if not self.enable_cache_results:
+            return file_name
+        try:
+            # Files generated inside the cache folder are moved into place, user paths are copied
+            in_cache = os.path.abspath(file_name).startswith(os.path.abspath(self.cache_folder) + os.sep)
+            cached_path = self.audio_cache.put(make_cache_key(text_params), text_params, file_name, move=in_cache)
             logger.info("Cache updated successfully.")
+            return cached_path if in_cache else file_name
         except IOError as e:
             print("I/O error occurred while updating the cache: ", str(e))
-        except json.JSONDecodeError as e:
-            print("JSON decode error occurred while updating the cache: ", str(e))
+            return file_name
             
     # LOAD FUNCS
     def load_model(self,load=True):
@@ -219,6 +354,8 @@ class TTSWrapper:
     def switch_model(self,model_name):
 
         self.current_model = model_name
+        # A model that was just copied in may not have been picked up by the watcher yet
+        self.speaker_registry.refresh()
         model_list = self.get_models_list()
         # Check to see if the same name is selected
         if(model_name == self.model_version):
@@ -263,104 +400,591 @@ class TTSWrapper:
 
     # SPEAKER FUNCS
     def get_or_create_latents(self, speaker_name, speaker_wav, language_code):
+        """
+        The single way to get the latents of a speaker. Resident latents are served from the
+        bounded cache, anything else is loaded on demand from the pack or the latent files, or
+        created from the reference audio and stored.
+        """
         speaker_name = speaker_name.lower()
         speaker_key = f"{speaker_name}_{language_code}"
-        if speaker_key not in self.latents_cache:
-            # Try loading from JSON first (hot path for /store_latents and pre-existing JSONs)
-            json_path = os.path.join(self.latent_speaker_folder, language_code, f"{speaker_name}.json")
-            if os.path.exists(json_path):
-                logger.info(f"Loading latents from JSON for {speaker_name} in {language_code}")
-                gpt_cond_latent, speaker_embedding = self.load_latents_from_json(json_path)
-                # Ensure tensors are on the current device
-                gpt_cond_latent = gpt_cond_latent.to(self.device)
-                speaker_embedding = speaker_embedding.to(self.device)
-                self.latents_cache[speaker_key] = (gpt_cond_latent, speaker_embedding)
+        # Resident latents come back on the current device, copied only when the device changed
+        cached = self.latents_cache.get(speaker_key, self.device)
+        if cached is not None:
+            return cached
+
+        # Try the memory-mapped pack first, then the latent files (hot path for /store_latents and pre-existing latents)
+        packed = self.get_latent_pack(language_code).get(speaker_name)
+        latent_path = None if packed is not None else self.get_latent_path(speaker_name, language_code)
+        if packed is not None:
+            # Latents are packed as fp16 or int8, the model runs in fp32
+            tensors = dequantize_latents(packed[0])
+            gpt_cond_latent = tensors['gpt_cond_latent'].to(self.device)
+            speaker_embedding = tensors['speaker_embedding'].to(self.device)
+        elif latent_path is not None:
+            logger.info(f"Loading latents from {latent_path} for {speaker_name} in {language_code}")
+            gpt_cond_latent, speaker_embedding = self.load_latents_from_file(latent_path)
+        else:
+            # Only latents of the speaker folder carry a fingerprint, see create_latents_for_all
+            fingerprint, sources = None, None
+            if self.is_folder_speaker(speaker_name, language_code):
+                fingerprint, sources = reference_fingerprint(speaker_wav if isinstance(speaker_wav, list) else [speaker_wav], self.model_version,
+                                                             self.reference_audio.hashes, self.conditioning_settings())
+            shared = self.latent_fingerprints().get(fingerprint) if fingerprint is not None else None
+
+            if shared is not None:
+                # The same reference files were already used in another language
+                self.link_shared_latents(speaker_name, language_code, *shared)
+                tensors = dequantize_latents(self.get_latent_pack(language_code).get(speaker_name)[0])
+                gpt_cond_latent = tensors['gpt_cond_latent'].to(self.device)
+                speaker_embedding = tensors['speaker_embedding'].to(self.device)
             else:
                 logger.info(f"Creating latents for {speaker_name} in {language_code}: {speaker_wav}")
-                gpt_cond_latent, speaker_embedding = self.model.get_conditioning_latents(speaker_wav)
-                # Move latents to the current device
-                gpt_cond_latent = gpt_cond_latent.to(self.device)
-                speaker_embedding = speaker_embedding.to(self.device)
-                self.latents_cache[speaker_key] = (gpt_cond_latent, speaker_embedding)
-                self.save_latents_to_json(speaker_name, language_code)
-        else:
-            # Ensure cached latents are on the current device
-            gpt_cond_latent, speaker_embedding = self.latents_cache[speaker_key]
-            gpt_cond_latent = gpt_cond_latent.to(self.device)
-            speaker_embedding = speaker_embedding.to(self.device)
+                [(gpt_cond_latent, speaker_embedding)] = self.get_conditioning_latents_batch([self.prepare_reference_audio(speaker_wav)])
+                # Stored before caching, an evicted entry is always found on disk again
+                file_path = self.write_latents(speaker_name, language_code, gpt_cond_latent, speaker_embedding, fingerprint, sources)
+                logger.info(f"Latents for {speaker_name} in {language_code} saved to {file_path}")
+
+        self.latents_cache[speaker_key] = (gpt_cond_latent, speaker_embedding)
         return gpt_cond_latent, speaker_embedding
 
+    def get_or_create_latents_batch(self, speakers):
+        """
+        Latents of several speakers ([(speaker_name, speaker_wav, language_code)]) stacked into one
+        batch, (gpt_cond_latents, speaker_embeddings). Resident latents are gathered from the
+        cache arena with one indexed read, the others are loaded or created first.
+        """
+        keys = [f"{speaker_name.lower()}_{language_code}" for speaker_name, _, language_code in speakers]
+        gathered = self.latents_cache.gather(keys, self.device)
+        if gathered is not None:
+            return gathered
+
+        latents = [self.get_or_create_latents(*speaker) for speaker in speakers]
+        gathered = self.latents_cache.gather(keys, self.device)
+        if gathered is not None:
+            return gathered
+        # More speakers than the cache holds, or latents of different shapes
+        return tuple(torch.cat(tensors, dim=0) for tensors in zip(*latents))
+
     def create_latents_for_all(self):
-        # Iterate over each language subdirectory in the speaker folder
-        total_new_latents = 0
-        total_existing_latents = 0
+        """
+        Brings the latents in line with the speaker folder, returns the counts per action.
 
-        for language_code in os.listdir(self.speaker_folder):
-            language_path = os.path.join(self.speaker_folder, language_code)
-            if os.path.isdir(language_path):
-                speakers_list = self._get_speakers(language_path)
-                
-                new_latents_count = 0
-                existing_latents_count = 0
-
-                for speaker in speakers_list:
-                    speaker_key = f"{speaker['speaker_name'].lower()}_{language_code}"
-                    # Check if the latent JSON already exists
-                    latent_json_path = os.path.join(self.latent_speaker_folder, language_code, f"{speaker['speaker_name']}.json")
-                    if os.path.exists(latent_json_path):
-                        # Increment existing latents counter if the file exists
-                        existing_latents_count += 1
+        Latents made from the speaker folder record the fingerprint of their reference files.
+        Speakers whose fingerprint changed are rebuilt, unchanged ones are skipped, and latents
+        whose reference files are gone are removed. Latents without a fingerprint, stored
+        through the API or by older versions, are never rebuilt; when their speaker has
+        reference files the current fingerprint is recorded with them.
+
+        The same reference files in several languages are only computed once, the other
+        languages link to those latents (counted as shared).
+        """
+        totals = {"created": 0, "rebuilt": 0, "shared": 0, "skipped": 0, "adopted": 0, "removed": 0}
+        language_counts = {}
+        known_hashes = self.load_reference_hashes()
+        seen_hashes = {}
+        # Changes on disk since the last poll count as well
+        self.speaker_registry.refresh()
+        speakers_by_language = self.speaker_registry.speakers
+        stored = self.latent_fingerprints()
+        pending = {} # fingerprint -> speakers that need those latents
+        pack_entries = {} # Written to the packs once, at the end of the run
+
+        try:
+            # Iterate over each language subdirectory in the speaker folder
+            for language_code, language_speakers in speakers_by_language.items():
+                counts = language_counts[language_code] = dict.fromkeys(totals, 0)
+                for speaker in language_speakers.values():
+                    speaker_name = speaker['speaker_name'].lower()
+                    audio_paths = speaker['speaker_wav'] if isinstance(speaker['speaker_wav'], list) else [speaker['speaker_wav']]
+                    latent_path = self.get_latent_path(speaker_name, language_code)
+                    try:
+                        metadata = load_latents_metadata(latent_path) if latent_path is not None and latent_path.endswith(LATENT_EXTENSION) else {}
+                        fingerprint, sources = reference_fingerprint(audio_paths, self.model_version, known_hashes, self.conditioning_settings())
+                    except (OSError, ValueError) as e:
+                        logger.error(f"Failed to fingerprint {speaker_name} in {language_code}: {e}")
+                        continue
+                    for audio_path in audio_paths:
+                        key = os.path.abspath(audio_path)
+                        seen_hashes[key] = known_hashes[key]
+
+                    speaker = {**speaker, 'language_code': language_code, 'fingerprint': fingerprint, 'sources': sources}
+                    if latent_path is not None and "fingerprint" not in metadata:
+                        self.write_latents(speaker_name, language_code, *self.load_latents_from_file(latent_path), fingerprint, sources, pack_entries)
+                        counts["adopted"] += 1
+                    elif latent_path is not None and metadata["fingerprint"] == fingerprint:
+                        counts["skipped"] += 1
                     else:
-                        # Otherwise, create the latent and increment new latents counter
-                        self.get_or_create_latents(speaker['speaker_name'], speaker['speaker_wav'], language_code)
-                        new_latents_count += 1
-                
-                total_new_latents += new_latents_count
-                total_existing_latents += existing_latents_count
-
-                # Report based on whether new latent JSON files were created
-                if new_latents_count > 0:
-                    logger.info(f"Latents created for all {new_latents_count} new speakers in {language_code}.")
-                if existing_latents_count > 0:
-                    logger.info(f"Latent JSON already existing for {existing_latents_count} speakers in {language_code}.")
-
-        # Optionally, provide a summary of actions taken across all languages
-        logger.info(f"Total new latents created across all languages: {total_new_latents}")
-        logger.info(f"Total existing latents found across all languages: {total_existing_latents}")
-
-    def save_latents_to_json(self, speaker_name, language_code):
+                        # Latents are stored as soon as they are made, an interrupted run picks up where it stopped
+                        counts["created" if latent_path is None else "rebuilt"] += 1
+                        pending.setdefault(fingerprint, []).append(speaker)
+
+            # The reference audio cache finds the files by their content, without hashing them again
+            self.reference_audio.hashes.update(known_hashes)
+
+            # One speaker per fingerprint is computed, unless another language already has the latents
+            to_compute = [speakers[0] for fingerprint, speakers in pending.items() if fingerprint not in stored]
+            for speaker in self.create_latents_batched(to_compute, pack_entries):
+                stored[speaker['fingerprint']] = (speaker['language_code'], speaker['speaker_name'].lower())
+            failed = 0
+            for fingerprint, speakers in pending.items():
+                if fingerprint not in stored:
+                    # Speakers that failed stay missing or stale, they are tried again next time
+                    failed += len(speakers)
+                    continue
+                for speaker in speakers:
+                    speaker_key = (speaker['language_code'], speaker['speaker_name'].lower())
+                    if stored[fingerprint] != speaker_key:
+                        self.link_shared_latents(speaker_key[1], speaker_key[0], *stored[fingerprint], pack_entries)
+                        language_counts[speaker['language_code']]["shared"] += 1
+        finally:
+            self.write_pack_entries(pack_entries)
+
+        self.save_reference_hashes(seen_hashes)
+        # Decoded audio of reference files that are gone is not needed any more
+        self.reference_audio.prune({self.reference_audio.key_for(known["sha256"]) for known in seen_hashes.values()})
+
+        for language_code, counts in language_counts.items():
+            speaker_names = {speaker_name.lower() for speaker_name in speakers_by_language[language_code]}
+            counts["removed"] = self.remove_orphaned_latents(language_code, speaker_names)
+            if any(counts.values()):
+                logger.info(f"Latents for {language_code}: {counts['created']} created, {counts['rebuilt']} rebuilt ({counts['shared']} shared with other languages), "
+                            f"{counts['skipped']} skipped, {counts['adopted']} adopted, {counts['removed']} removed.")
+            for action, count in counts.items():
+                totals[action] += count
+
+        logger.info(f"Latents across all languages: {totals['created']} created, {totals['rebuilt']} rebuilt ({totals['shared']} shared), "
+                    f"{totals['skipped']} skipped, {totals['adopted']} adopted, {totals['removed']} removed" + (f", {failed} failed." if failed else "."))
+        return totals
+
+    def is_folder_speaker(self, speaker_name, language_code):
+        """ Whether the speaker has reference files in the speaker folder of the language. """
+        return self.speaker_registry.speaker(speaker_name, language_code) is not None
+
+    def latent_fingerprints(self):
+        """ {fingerprint: (language_code, speaker_name)} of the stored latents made from reference audio. """
+        fingerprints = {}
+        for language_code in self.speaker_registry.latents:
+            for fingerprint, speaker_name in self.get_latent_pack(language_code).fingerprints().items():
+                fingerprints.setdefault(fingerprint, (language_code, speaker_name))
+        return fingerprints
+
+    def link_shared_latents(self, speaker_name, language_code, source_language, source_speaker, pack_entries=None):
+        """ Stores the latents of another speaker/language, made from the same reference files, for this speaker. """
+        language_folder = os.path.join(self.latent_speaker_folder, language_code)
+        os.makedirs(language_folder, exist_ok=True)
+        file_path = os.path.join(language_folder, f"{speaker_name}{LATENT_EXTENSION}")
+        link_latents(self.get_latent_path(source_speaker, source_language), file_path)
+
+        # Latents created in the same run may not be in the pack yet
+        pending = (pack_entries or {}).get(source_language, {}).get(source_speaker)
+        tensors, metadata = (pending[0], pending[2]) if pending is not None else self.get_latent_pack(source_language).get(source_speaker)
+        self.register_latents(speaker_name, language_code, file_path, tensors, metadata, pack_entries)
+        logger.info(f"Latents for {speaker_name} in {language_code} shared with {source_speaker} in {source_language}")
+        return file_path
+
+    def load_reference_hashes(self):
+        hashes_path = os.path.join(self.latent_speaker_folder, ".reference_hashes")
+        try:
+            with open(hashes_path, "r") as hashes_file:
+                return json.load(hashes_file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_reference_hashes(self, known_hashes):
+        """ Keeps the content hashes of the reference files, only changed files are hashed again. """
+        hashes_path = os.path.join(self.latent_speaker_folder, ".reference_hashes")
+        with open(hashes_path + ".tmp", "w") as hashes_file:
+            json.dump(known_hashes, hashes_file)
+        os.replace(hashes_path + ".tmp", hashes_path)
+
+    def remove_orphaned_latents(self, language_code, speaker_names):
+        """ Removes fingerprinted latents whose speaker no longer has reference files. """
+        language_folder = os.path.join(self.latent_speaker_folder, language_code)
+        if not os.path.isdir(language_folder):
+            return 0
+
+        orphans = []
+        for file_name in os.listdir(language_folder):
+            speaker_name, extension = os.path.splitext(file_name)
+            if extension != LATENT_EXTENSION or speaker_name.lower() in speaker_names:
+                continue
+            file_path = os.path.join(language_folder, file_name)
+            try:
+                fingerprinted = "fingerprint" in load_latents_metadata(file_path)
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to read latents from {file_path}: {e}")
+                continue
+            # Only latents made from the speaker folder, uploaded ones never had reference files there
+            if fingerprinted:
+                os.unlink(file_path)
+                self.speaker_registry.remove_latent(language_code, speaker_name)
+                orphans.append(speaker_name.lower())
+                self.latents_cache.pop(f"{speaker_name.lower()}_{language_code}")
+
+        if orphans:
+            self.get_latent_pack(language_code).update({}, removed=orphans)
+            logger.info(f"Removed latents of {len(orphans)} speakers in {language_code} whose reference audio is gone: {', '.join(orphans)}")
+        return len(orphans)
+
+    def create_latents_batched(self, speakers, pack_entries):
+        """
+        Creates and stores the latents of the given speakers ({speaker_name, speaker_wav,
+        language_code, fingerprint, sources} dicts), returns the ones that were created. The
+        pack updates are collected in `pack_entries`, see register_latents.
+
+        Reference audio is decoded, resampled and turned into mel chunks in a thread pool,
+        ahead of the model, which computes the gpt latents of a whole batch in one call.
+        """
+        if not speakers:
+            return []
+
+        workers = min(8, os.cpu_count() or 1)
+        created = []
+        start = last_report = time.time()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Keep two batches decoding, a large voice pack is not held in memory at once
+            remaining = iter(speakers)
+            queued = deque()
+            for speaker in remaining:
+                queued.append((speaker, pool.submit(self.prepare_reference_audio, speaker['speaker_wav'])))
+                if len(queued) >= 2 * LATENT_BATCH_SIZE:
+                    break
+
+            while queued:
+                batch = []
+                while queued and len(batch) < LATENT_BATCH_SIZE:
+                    speaker, future = queued.popleft()
+                    try:
+                        batch.append((speaker, future.result()))
+                    except Exception as e:
+                        logger.error(f"Failed to read reference audio of {speaker['speaker_name']} in {speaker['language_code']}: {e}")
+                    next_speaker = next(remaining, None)
+                    if next_speaker is not None:
+                        queued.append((next_speaker, pool.submit(self.prepare_reference_audio, next_speaker['speaker_wav'])))
+                if not batch:
+                    continue
+
+                try:
+                    latents = self.get_conditioning_latents_batch([prepared for _, prepared in batch])
+                except Exception as e:
+                    logger.error(f"Failed to create latents for a batch of {len(batch)} speakers: {e}")
+                    continue
+
+                for (speaker, _), (gpt_cond_latent, speaker_embedding) in zip(batch, latents):
+                    self.write_latents(speaker['speaker_name'].lower(), speaker['language_code'], gpt_cond_latent, speaker_embedding,
+                                       speaker.get('fingerprint'), speaker.get('sources'), pack_entries)
+                    created.append(speaker)
+
+                now = time.time()
+                if now - last_report > 5 or not queued:
+                    last_report = now
+                    logger.info(f"Latents: {len(created)}/{len(speakers)} speakers, {len(created) / max(now - start, 1e-6):.1f} speakers/sec, "
+                                f"{self.reference_audio.seconds_saved:.1f}s of decoding saved by the reference audio cache")
+        return created
+
+    def prepare_reference_audio(self, speaker_wav):
+        """
+        Decodes the reference audio of a speaker on the cpu, the part of
+        Xtts.get_conditioning_latents that does not need the model. Safe to run in worker threads.
+        `speaker_wav` is a path, a list of paths, or a list of file objects such as uploads.
+
+        Returns the 16 kHz audio of every file for the speaker encoder, and the mel chunks for the gpt latents.
+        """
+        if not isinstance(speaker_wav, list):
+            audio_files = [speaker_wav]
+        elif all(isinstance(audio_file, str) for audio_file in speaker_wav):
+            # Sorted like the fingerprint, the order decides which audio makes up the gpt latents
+            audio_files = sorted(speaker_wav)
+        else:
+            # Uploads keep the order they were sent in
+            audio_files = speaker_wav
+        audios = [self.load_reference_audio(audio_file) for audio_file in audio_files]
+        audios_16k = [torchaudio.functional.resample(audio, REFERENCE_SAMPLE_RATE, 16000) for audio in audios]
+
+        full_audio = torch.cat(audios, dim=-1)[:, : REFERENCE_SAMPLE_RATE * self.gpt_cond_len]
+        mel_stats = self.model.mel_stats.cpu()
+        if not self.model.args.gpt_use_perceiver_resampler:
+            mel = wav_to_mel_cloning(full_audio, mel_norms=mel_stats, n_fft=4096, hop_length=1024, win_length=4096,
+                                     power=2, normalized=False, sample_rate=22050, f_min=0, f_max=8000, n_mels=80)
+            return audios_16k, [mel]
+
+        chunk_size = REFERENCE_SAMPLE_RATE * min(GPT_COND_CHUNK_LEN, self.gpt_cond_len)
+        mel_chunks = []
+        for i in range(0, full_audio.shape[1], chunk_size):
+            audio_chunk = full_audio[:, i : i + chunk_size]
+            # if the chunk is too short ignore it
+            if audio_chunk.size(-1) < REFERENCE_SAMPLE_RATE * MIN_CHUNK_SECONDS:
+                continue
+            mel_chunks.append(wav_to_mel_cloning(audio_chunk, mel_norms=mel_stats, n_fft=2048, hop_length=256, win_length=1024,
+                                                 power=2, normalized=False, sample_rate=22050, f_min=0, f_max=8000, n_mels=80))
+        if not mel_chunks:
+            raise RuntimeError(f"Provided reference audio too short (minimum length: {MIN_CHUNK_SECONDS:.2f} seconds).")
+        return audios_16k, mel_chunks
+
+    def load_reference_audio(self, audio_file):
+        """ Samples of a reference file at the model rate, (1, samples). Files on disk are decoded once and cached by content. """
+        if isinstance(audio_file, str):
+            return torch.from_numpy(self.reference_audio.get(audio_file, self.preprocess_reference_audio)).unsqueeze(0)
+        return torch.from_numpy(self.preprocess_reference_audio(audio_file)).unsqueeze(0)
+
+    def preprocess_reference_audio(self, audio_file):
+        # Same steps as Xtts.get_conditioning_latents: decode and resample, cut, trim
+        audio = load_audio(audio_file, REFERENCE_SAMPLE_RATE)[0, : REFERENCE_SAMPLE_RATE * self.max_ref_length].numpy()
+        if self.reference_trim_db is not None:
+            audio = librosa.effects.trim(audio, top_db=self.reference_trim_db)[0]
+        return np.ascontiguousarray(audio, dtype=np.float32)
+
+    def conditioning_settings(self):
+        """ Conditioning settings that differ from the model defaults, part of the latent fingerprints. """
+        settings = {}
+        if self.gpt_cond_len != GPT_COND_LEN:
+            settings["gpt_cond_len"] = self.gpt_cond_len
+        if self.max_ref_length != MAX_REF_LENGTH:
+            settings["max_ref_length"] = self.max_ref_length
+        if self.reference_trim_db is not None:
+            settings["trim_db"] = self.reference_trim_db
+        return settings or None
+
+    @torch.inference_mode()
+    def get_conditioning_latents_batch(self, prepared):
+        """
+        Computes (gpt_cond_latent, speaker_embedding) for every output of prepare_reference_audio.
+
+        Inputs of the same length are stacked into a single forward pass, reference files for the
+        speaker encoder and mel chunks for the gpt conditioning encoder. Different lengths are
+        never padded, that would change the latents.
+        """
+        # Not while another worker generates, in lowvram mode that moves the model
+        with self.model_lock:
+            return self._get_conditioning_latents_batch(prepared)
+
+    def _get_conditioning_latents_batch(self, prepared):
+        model = self.model
+
+        # Group inputs by shape, run each group as one batch, then scatter the outputs back to their speakers
+        def run_grouped(inputs_per_speaker, forward):
+            groups = {}
+            for speaker_index, inputs in enumerate(inputs_per_speaker):
+                for tensor in inputs:
+                    groups.setdefault(tuple(tensor.shape), []).append((speaker_index, tensor))
+            outputs = [[] for _ in inputs_per_speaker]
+            for items in groups.values():
+                batch_output = forward(torch.cat([tensor for _, tensor in items]).to(model.device))
+                for (speaker_index, _), output in zip(items, batch_output):
+                    outputs[speaker_index].append(output.unsqueeze(0))
+            return outputs
+
+        speaker_embeddings = run_grouped([audios_16k for audios_16k, _ in prepared],
+                                         lambda audio: model.hifigan_decoder.speaker_encoder.forward(audio, l2_norm=True).unsqueeze(-1))
+        if model.args.gpt_use_perceiver_resampler:
+            style_embs = run_grouped([mel_chunks for _, mel_chunks in prepared], lambda mels: model.gpt.get_style_emb(mels, None))
+        else:
+            style_embs = run_grouped([mel_chunks for _, mel_chunks in prepared], model.gpt.get_style_emb)
+
+        latents = []
+        for embs, speaker_embs in zip(style_embs, speaker_embeddings):
+            gpt_cond_latent = torch.stack(embs).mean(dim=0).transpose(1, 2)
+            speaker_embedding = torch.stack(speaker_embs).mean(dim=0)
+            latents.append((gpt_cond_latent.to(self.device), speaker_embedding.to(self.device)))
+        return latents
+
+    def get_latent_path(self, speaker_name, language_code):
+        """ Path of the stored latents of a speaker, the binary format wins over legacy JSON. """
+        return self.speaker_registry.latent_path(speaker_name, language_code)
+
+    def write_latents(self, speaker_name, language_code, gpt_cond_latent, speaker_embedding, fingerprint=None, sources=None, pack_entries=None):
+        """
+        Writes latents in the binary format, replacing any previous file of the speaker.
+        `fingerprint` and `sources` describe the reference files, see reference_fingerprint.
+        `pack_entries` collects the pack update instead of writing it, see register_latents.
+        """
+        # Create a subdirectory for the language if it doesn't exist
+        language_folder = os.path.join(self.latent_speaker_folder, language_code)
+        os.makedirs(language_folder, exist_ok=True)
+
+        file_path = os.path.join(language_folder, f"{speaker_name}{LATENT_EXTENSION}")
+        tensors = quantize_latents({
+            "gpt_cond_latent": gpt_cond_latent,
+            "speaker_embedding": speaker_embedding
+        }, self.latent_precision)
+        metadata = {"model_version": str(self.model_version), "precision": self.latent_precision}
+        if fingerprint is not None:
+            metadata["fingerprint"] = fingerprint
+            metadata["sources"] = json.dumps(sources, separators=(",", ":"))
+        save_latents(file_path, tensors, metadata, dtype=None)
+        self.register_latents(speaker_name, language_code, file_path, tensors, metadata, pack_entries)
+        return file_path
+
+    def store_latents(self, speaker_name, language_code, gpt_cond_latent, speaker_embedding):
+        """ Writes latents received or created through the API and loads them into the cache, so they are usable right away. """
+        file_path = self.write_latents(speaker_name, language_code, gpt_cond_latent, speaker_embedding)
+        try:
+            cache_key = f"{speaker_name}_{language_code}"
+            self.latents_cache[cache_key] = self.load_latents_from_file(file_path)
+            logger.info(f"Latents hot-loaded into cache for {cache_key}")
+        except Exception as e:
+            logger.error(f"Failed to hot-load latents into cache: {e}")
+        return file_path
+
+    def register_latents(self, speaker_name, language_code, file_path, tensors, metadata, pack_entries=None):
+        """
+        Brings the pack and the resident cache in step with a newly written latent file.
+
+        Every pack update appends a new index, so work that writes many speakers passes a dict as
+        `pack_entries`: the entry is collected there ({language_code: {speaker_name: entry}}) and
+        written with the others by write_pack_entries.
+        """
+        # Resident latents of the speaker are stale now
+        self.latents_cache.pop(f"{speaker_name}_{language_code}")
+
+        # Keep the pack in step with the file, so it does not need a rescan
+        stat = os.stat(file_path)
+        source = {"file": os.path.basename(file_path), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        if pack_entries is None:
+            self.get_latent_pack(language_code).put(speaker_name, tensors, source, metadata)
+        else:
+            pack_entries.setdefault(language_code, {})[speaker_name] = (tensors, source, metadata)
+        self.speaker_registry.add_latent(language_code, speaker_name, file_path)
+
+        # A legacy JSON of the same speaker is superseded now
+        json_path = os.path.join(os.path.dirname(file_path), f"{speaker_name}.json")
+        if os.path.exists(json_path):
+            os.unlink(json_path)
+
+    def write_pack_entries(self, pack_entries):
+        """ Writes the entries collected by register_latents, one pack update per language. """
+        for language_code, entries in pack_entries.items():
+            self.get_latent_pack(language_code).update(entries)
+            # Read from the pack before the update, the resident copies may be the old latents
+            for speaker_name in entries:
+                self.latents_cache.pop(f"{speaker_name}_{language_code}")
+        pack_entries.clear()
+
+    def save_latents_to_file(self, speaker_name, language_code):
         # Generate the combined key as used in get_or_create_latents
         speaker_key = f"{speaker_name}_{language_code}"
         
         # Ensure accessing the correct key in latents_cache
         if speaker_key in self.latents_cache:
-            # Create a subdirectory for the language if it doesn't exist
-            language_folder = os.path.join(self.latent_speaker_folder, language_code)
-            if not os.path.exists(language_folder):
-                os.makedirs(language_folder)
-            
-            # Define the file path within the language-specific folder
-            file_path = os.path.join(language_folder, f"{speaker_name}.json")
-            
-            # Access the latents using the combined speaker_key
-            data_to_save = {
-                "gpt_cond_latent": self.latents_cache[speaker_key][0].tolist(),
-                "speaker_embedding": self.latents_cache[speaker_key][1].tolist()
-            }
-            with open(file_path, 'w') as json_file:
-                json.dump(data_to_save, json_file)
+            file_path = self.write_latents(speaker_name, language_code, *self.latents_cache[speaker_key])
             logger.info(f"Latents for {speaker_name} in {language_code} saved to {file_path}")
         else:
             logger.error(f"Latents for {speaker_key} not found in cache.")
-      
+
+    def load_latents_from_file(self, file_path):
+        if file_path.endswith(".json"):
+            return self.load_latents_from_json(file_path)
+
+        tensors, metadata = load_latents(file_path)
+        if metadata.get("model_version", str(self.model_version)) != str(self.model_version):
+            logger.warning(f"Latents in {file_path} were made with model {metadata['model_version']}, the loaded model is {self.model_version}")
+        # Latents are stored as fp16 or int8, the model runs in fp32
+        tensors = dequantize_latents(tensors)
+        gpt_cond_latent = tensors['gpt_cond_latent'].to(self.device)
+        speaker_embedding = tensors['speaker_embedding'].to(self.device)
+        return gpt_cond_latent, speaker_embedding
+
     def load_latents_from_json(self, file_path):
-        with open(file_path, 'r') as json_file:
-            data = json.load(json_file)
+        tensors, _ = load_latents_json(file_path)
         # Use the class's device setting for tensor allocation
-        gpt_cond_latent = torch.tensor(data['gpt_cond_latent'], device=self.device)
-        speaker_embedding = torch.tensor(data['speaker_embedding'], device=self.device)
+        gpt_cond_latent = tensors['gpt_cond_latent'].to(self.device)
+        speaker_embedding = tensors['speaker_embedding'].to(self.device)
         return gpt_cond_latent, speaker_embedding
     
+    def list_latent_files(self, languages=None, since=None):
+        """
+        Lists the stored latents as [(archive_name, file_path)], `<language>/<speaker>.<ext>`,
+        optionally only of some languages or written after `since` (unix time).
+        """
+        files = []
+        for language_code in sorted(os.listdir(self.latent_speaker_folder)):
+            language_folder = os.path.join(self.latent_speaker_folder, language_code)
+            if not os.path.isdir(language_folder) or language_code.startswith(".") or (languages and language_code not in languages):
+                continue
+            for file_name in sorted(os.listdir(language_folder)):
+                speaker_name, extension = os.path.splitext(file_name)
+                if extension not in (LATENT_EXTENSION, ".json"):
+                    continue
+                # The binary file wins when a legacy JSON of the same speaker is still around
+                if extension == ".json" and os.path.exists(os.path.join(language_folder, speaker_name + LATENT_EXTENSION)):
+                    continue
+                file_path = os.path.join(language_folder, file_name)
+                if since is not None and os.path.getmtime(file_path) <= since:
+                    continue
+                files.append((f"{language_code}/{file_name}", file_path))
+        return files
+
+    def import_latents(self, archive_file):
+        """
+        Applies a latents archive as one batch and hot-loads it, returns the imported
+        (language_code, speaker_name) pairs.
+
+        Every file is validated and staged next to the latent folder first, nothing is replaced
+        unless all of them are valid. The staged files are then moved in place, and a failure
+        halfway puts the previous files back.
+        """
+        with self.import_lock:
+            staging_folder = os.path.join(self.latent_speaker_folder, f".import-{uuid.uuid4().hex}")
+            os.makedirs(staging_folder)
+            try:
+                staged = {}
+                for language_code, speaker_name, tensors, metadata in read_latents_archive(archive_file):
+                    if language_code not in supported_languages:
+                        raise ValueError(f"Unsupported language '{language_code}' for {speaker_name}")
+                    if metadata.get("model_version", str(self.model_version)) != str(self.model_version):
+                        logger.warning(f"Imported latents of {speaker_name} in {language_code} were made with model {metadata['model_version']}, the loaded model is {self.model_version}")
+                    # The reference files are on another node, imported latents are handled like the ones stored through the API
+                    metadata = {key: value for key, value in metadata.items() if key not in ("fingerprint", "sources", "format_version")}
+                    staged_path = os.path.join(staging_folder, f"{len(staged)}{LATENT_EXTENSION}")
+                    # Kept in the precision they were exported in
+                    save_latents(staged_path, tensors, metadata, dtype=None)
+                    staged[(language_code, speaker_name)] = (staged_path, tensors, metadata)
+
+                replaced = [] # (backup_path, file_path)
+                applied = []
+                try:
+                    for index, ((language_code, speaker_name), (staged_path, _, _)) in enumerate(staged.items()):
+                        language_folder = os.path.join(self.latent_speaker_folder, language_code)
+                        os.makedirs(language_folder, exist_ok=True)
+                        file_path = os.path.join(language_folder, f"{speaker_name}{LATENT_EXTENSION}")
+                        if os.path.exists(file_path):
+                            backup_path = os.path.join(staging_folder, f"{index}.backup")
+                            os.replace(file_path, backup_path)
+                            replaced.append((backup_path, file_path))
+                        os.replace(staged_path, file_path)
+                        applied.append(file_path)
+                except OSError:
+                    for file_path in applied:
+                        os.unlink(file_path)
+                    for backup_path, file_path in replaced:
+                        os.replace(backup_path, file_path)
+                    raise
+            finally:
+                shutil.rmtree(staging_folder, ignore_errors=True)
+
+        pack_entries = {}
+        for (language_code, speaker_name), (_, tensors, metadata) in staged.items():
+            file_path = os.path.join(self.latent_speaker_folder, language_code, f"{speaker_name}{LATENT_EXTENSION}")
+            self.register_latents(speaker_name, language_code, file_path, tensors, metadata, pack_entries)
+        self.write_pack_entries(pack_entries)
+
+        for (language_code, speaker_name), (_, tensors, metadata) in staged.items():
+            # Hot-load, so the speakers are usable right away
+            latents = dequantize_latents(tensors)
+            gpt_cond_latent = latents['gpt_cond_latent'].to(self.device)
+            speaker_embedding = latents['speaker_embedding'].to(self.device)
+            self.latents_cache[f"{speaker_name}_{language_code}"] = (gpt_cond_latent, speaker_embedding)
+
+        logger.info(f"Imported latents of {len(staged)} speakers")
+        return list(staged)
+
+    def get_latent_pack(self, language_code):
+        with self.latent_packs_lock:
+            if language_code not in self.latent_packs:
+                pack_path = os.path.join(self.latent_speaker_folder, f"{language_code}.pack")
+                self.latent_packs[language_code] = LatentPack(pack_path)
+            return self.latent_packs[language_code]
+
     def load_all_latents(self):
         # Total count for logging purposes
         total_latents_loaded = 0
@@ -368,23 +992,18 @@ class TTSWrapper:
         # Iterate over all language subdirectories in the latent speaker folder
         for language_code in os.listdir(self.latent_speaker_folder):
             language_path = os.path.join(self.latent_speaker_folder, language_code)
+            if language_code.startswith(".import-"):
+                # Staging folder of an import that was interrupted
+                shutil.rmtree(language_path, ignore_errors=True)
+                continue
             if os.path.isdir(language_path):
-                # Initialize counter for the current language
-                current_language_latents_count = 0
-
-                # Load all json files within this language subfolder
-                for file_name in os.listdir(language_path):
-                    if file_name.endswith('.json'):
-                        speaker_name = file_name[:-5]  # Remove '.json' to get the speaker name
-                        speaker_key = f"{speaker_name}_{language_code}"
-                        file_path = os.path.join(language_path, file_name)
-                        gpt_cond_latent, speaker_embedding = self.load_latents_from_json(file_path)
-                        self.latents_cache[speaker_key] = (gpt_cond_latent, speaker_embedding)
-                        current_language_latents_count += 1
+                # Only latent files that changed since the last start are read, the rest is mapped on first use
+                pack = self.get_latent_pack(language_code)
+                updated, removed, unchanged = pack.sync(language_path)
 
                 # Log the count of loaded latents for the current language
-                logger.info(f"Loaded latents for {current_language_latents_count} speakers in '{language_code}' subfolder.")
-                total_latents_loaded += current_language_latents_count
+                logger.info(f"Latent pack for '{language_code}': {len(pack)} speakers, {updated} updated, {removed} removed, {unchanged} unchanged.")
+                total_latents_loaded += len(pack)
 
         # Optionally, log the total count of latents loaded across all languages
         logger.info(f"Total latents loaded across all languages: {total_latents_loaded}")
@@ -413,6 +1032,7 @@ class TTSWrapper:
         if os.path.exists(folder) and os.path.isdir(folder):
             self.speaker_folder = folder
             self.create_directories()
+            self.speaker_registry.set_speaker_folder(folder)
             logger.info(f"Speaker folder is set to {folder}")
         else:
             raise ValueError("Provided path is not a valid directory")
@@ -428,39 +1048,8 @@ class TTSWrapper:
     def set_tts_settings(self, temperature, speed, length_penalty,
                          repetition_penalty, top_p, top_k, enable_text_splitting, stream_chunk_size):
         # Validate each parameter and raise an exception if any checks fail.
-        
-        # Check temperature
-        if not (0.01 <= temperature <= 1):
-            raise InvalidSettingsError("Temperature must be between 0.01 and 1.")
-        
-        # Check speed
-        if not (0.2 <= speed <= 2):
-            raise InvalidSettingsError("Speed must be between 0.2 and 2.")
-        
-        # Check length_penalty (no explicit range specified)
-        if not isinstance(length_penalty, float):
-            raise InvalidSettingsError("Length penalty must be a floating point number.")
-        
-        # Check repetition_penalty
-        if not (0.1 <= repetition_penalty <= 10.0):
-            raise InvalidSettingsError("Repetition penalty must be between 0.1 and 10.0.")
-        
-        # Check top_p
-        if not (0.01 <= top_p <= 1):
-            raise InvalidSettingsError("Top_p must be between 0.01 and 1 and must be a float.")
-        
-        # Check top_k
-        if not (1 <= top_k <= 100):
-            raise InvalidSettingsError("Top_k must be an integer between 1 and 100.")
+        validate_tts_settings(temperature, speed, length_penalty, repetition_penalty, top_p, top_k, enable_text_splitting, stream_chunk_size)
 
-        # Check stream_chunk_size
-        if not (20 <= stream_chunk_size <= 400):
-            raise InvalidSettingsError("Stream chunk size must be an integer between 20 and 400.")
-        
-        # Check enable_text_splitting
-        if not isinstance(enable_text_splitting, bool):
-            raise InvalidSettingsError("Enable text splitting must be either True or False.")
-        
         # All validations passed - proceed to apply settings.
         self.tts_settings = {
             "temperature": temperature,
@@ -476,6 +1065,13 @@ class TTSWrapper:
 
         print("Successfully updated TTS settings.")
 
+    def synthesis_params(self, **overrides):
+        """ Settings of one request: the current defaults with the overrides that are not None, checked like set_tts_settings. """
+        settings = {**self.tts_settings, "stream_chunk_size": self.stream_chunk_size}
+        settings.update({name: value for name, value in overrides.items() if value is not None})
+        validate_tts_settings(**settings)
+        return SynthesisParams(**settings)
+
     # GET FUNCS
     def get_wav_files(self, directory):
         """ Finds all the wav files in a directory. """
@@ -487,60 +1083,10 @@ class TTSWrapper:
         """Return a list of wav files in the given directory."""
         return [f for f in os.listdir(path) if f.endswith('.wav')]
 
-    def _get_speakers_from_dir(self, path, existing_speakers=None):
-        """Helper function to retrieve speaker information from directories, excluding duplicates."""
-        if existing_speakers is None:
-            existing_speakers = []
-        speakers = []
-        for f in os.listdir(path):
-            full_path = os.path.join(path, f)
-            if os.path.isdir(full_path) and f not in existing_speakers:
-                subdir_files = self.get_wav_files(full_path)
-                if subdir_files:
-                    speaker_wav = [os.path.join(path, f, s) for s in subdir_files]
-                    preview = os.path.join(f, subdir_files[0])
-                    speakers.append({
-                        'speaker_name': f,
-                        'speaker_wav': speaker_wav,
-                        'preview': preview
-                    })
-        return speakers
-
-    def _get_speakers_from_json(self, path):
-        """Helper function to retrieve speaker names from JSON files."""
-        speakers = []
-        for root, dirs, files in os.walk(path):
-            for file in files:
-                if file.endswith('.json'):
-                    speaker_name = os.path.splitext(file)[0]
-                    speaker_wav = os.path.join(root, file)
-                    preview = file
-                    speakers.append({
-                        'speaker_name': speaker_name,
-                        'speaker_wav': speaker_wav,
-                        'preview': preview
-                    })
-        return speakers
-
     def get_speakers(self):
         """Gets available speakers, ensuring uniqueness across both folders."""
-        speaker_info = {}
-        for lang_code in os.listdir(self.speaker_folder):
-            full_path = os.path.join(self.speaker_folder, lang_code)
-            if os.path.isdir(full_path):
-                speaker_path = os.path.join(self.speaker_folder, lang_code)
-                latent_speaker_path = os.path.join(self.latent_speaker_folder, lang_code)
-
-                latent_speaker_names = [s['speaker_name'] for s in self._get_speakers_from_json(latent_speaker_path)]
-                speaker_names = [s['speaker_name'] for s in self._get_speakers_from_dir(speaker_path, existing_speakers=latent_speaker_names)]
-
-                # Combine and ensure unique speaker names
-                combined_speakers = list(set(latent_speaker_names + speaker_names))
-
-                speaker_info[lang_code] = {
-                    'speakers': combined_speakers
-                }
-        return speaker_info
+        # Per language, stored latents plus speaker folders, kept up to date by the registry
+        return self.speaker_registry.speaker_lists
 
         """ Gets available speakers """
         speakers = [ s['speaker_name'] for s in self._get_speakers() ] 
@@ -597,7 +1143,7 @@ class TTSWrapper:
       return IP
 
     # Special format for SillyTavern
-    def get_speakers_special(self):
+    def get_speakers_special(self, language_code=None):
         BASE_URL = os.getenv('BASE_URL', '127.0.0.1:8020')
         BASE_HOST = os.getenv('BASE_HOST', '127.0.0.1')
         BASE_PORT = os.getenv('BASE_PORT', '8020')
@@ -609,7 +1155,12 @@ class TTSWrapper:
             TUNNEL_URL = f"http://{self.get_local_ip()}:{BASE_PORT}"
         speakers_special = []
 
-        speakers = self._get_speakers()
+        if language_code is None:
+            speakers = self.speaker_registry.root_speakers
+        else:
+            # Previews are relative to the speaker folder
+            speakers = [{**speaker, 'preview': f"{language_code}/{speaker['preview']}"}
+                        for speaker in self.speaker_registry.speakers.get(language_code, {}).values()]
 
         for speaker in speakers:
             if TUNNEL_URL == "":
@@ -631,6 +1182,15 @@ class TTSWrapper:
         return reversed_supported_languages
 
     # GENERATION FUNCS
+    def prepare_text(self,text):
+        # Check if 'text' is a valid path to a '.txt' file.
+        if os.path.isfile(text) and text.lower().endswith('.txt'):
+            with open(text, 'r', encoding='utf-8') as f:
+                text = f.read()
+
+        # Replace double quotes with single, asterisks, carriage returns, and line feeds
+        return self.clean_text(text)
+
     def clean_text(self,text):
         # Remove asterisks and line breaks
         text = re.sub(r'[\*\r\n]', '', text)
@@ -638,7 +1198,7 @@ class TTSWrapper:
         text = re.sub(r'"\s?(.*?)\s?"', r"'\1'", text)
         return text
 
-    async def stream_generation(self,text,speaker_name,speaker_wav,language,accent,output_file):
+    def stream_generation(self,text,speaker_name,speaker_wav,language,accent,output_file,params):
         # Log time
         generate_start_time = time.time()  # Record the start time of loading the model
 
@@ -650,8 +1210,8 @@ class TTSWrapper:
             accent,
             speaker_embedding=speaker_embedding,
             gpt_cond_latent=gpt_cond_latent,
-            **self.tts_settings, # Expands the object with the settings and applies them for generation
-            stream_chunk_size=self.stream_chunk_size,
+            **params.tts_settings, # Expands the object with the settings and applies them for generation
+            stream_chunk_size=params.stream_chunk_size,
         )
         
         for chunk in chunks:
@@ -664,38 +1224,183 @@ class TTSWrapper:
             chunk = (chunk * 32767).astype(np.int16)
             yield chunk.tobytes()
 
+        generate_end_time = time.time()  # Record the time to generate TTS
+        generate_elapsed_time = generate_end_time - generate_start_time
+
         if len(file_chunks) > 0:
             wav = torch.cat(file_chunks, dim=0)
+            self.realtime_factor.observe(len(text), wav.shape[0] / 24000, generate_elapsed_time)
             torchaudio.save(output_file, wav.cpu().squeeze().unsqueeze(0), 24000)
         else:
             logger.warning("No audio generated.")
 
+        logger.info(f"Processing time: {generate_elapsed_time:.2f} seconds.")
+
+    def stream_cached_audio(self, file_path, samples_per_chunk=24000):
+        """ Streams a cached result as 16 bit samples like stream_generation does, the WAV header is sent by the caller. """
+        wav, _ = torchaudio.load(file_path)
+        wav = (np.clip(wav[0].numpy(), -1, 1) * 32767).astype(np.int16)
+        for start in range(0, wav.shape[0], samples_per_chunk):
+            yield wav[start:start + samples_per_chunk].tobytes()
+
+    def split_sentences(self,text):
+        sentences = re.split(r'(?<=[.!?。！？])\s+', text.strip())
+        return [sentence for sentence in sentences if sentence]
+
+    def crossfade_concat(self,wavs,crossfade_ms=10,sample_rate=24000):
+        """ Joins the waveforms, blending each boundary over a short linear crossfade. """
+        overlap = int(sample_rate * crossfade_ms / 1000)
+        pieces = [wavs[0]]
+        for wav in wavs[1:]:
+            previous = pieces[-1]
+            n = min(overlap, previous.shape[0], wav.shape[0])
+            if n > 0:
+                fade = torch.linspace(0.0, 1.0, n)
+                pieces[-1] = previous[:-n]
+                pieces.append(previous[-n:] * (1 - fade) + wav[:n] * fade)
+                wav = wav[n:]
+            pieces.append(wav)
+        return torch.cat(pieces, dim=0)
+
+    def fragment_generation(self,text,speaker_name,speaker_wav,language,accent,output_file,params):
+        # Log time
+        generate_start_time = time.time()  # Record the start time of loading the model
+
+        # Every sentence is synthesized on its own, so splitting is done here
+        tts_settings = {**params.tts_settings, "enable_text_splitting": False}
+        latents = None
+        wavs = []
+        cached_samples = 0
+        synthesized_chars = 0
+
+        for index, sentence in enumerate(self.split_sentences(text)):
+            if index > 0:
+                self.yield_to_urgent_work()
+            fragment_params = self.get_cache_params(sentence, speaker_name, language, accent, params)
+            fragment_params['tts_settings'].pop('enable_text_splitting', None)
+            key = make_cache_key(fragment_params)
+
+            fragment_path = self.fragment_cache.get(key)
+            if fragment_path is not None:
+                wav, _ = torchaudio.load(fragment_path)
+                wav = wav.squeeze(0)
+                cached_samples += wav.shape[0]
+            else:
+                # Latents are only needed once something has to be synthesized
+                if latents is None:
+                    latents = self.get_or_create_latents(speaker_name, speaker_wav, language)
+                gpt_cond_latent, speaker_embedding = latents
+
+                out = self.model.inference(
+                    sentence,
+                    accent,
+                    gpt_cond_latent=gpt_cond_latent,
+                    speaker_embedding=speaker_embedding,
+                    **tts_settings,
+                )
+                wav = torch.tensor(out["wav"])
+                synthesized_chars += len(sentence)
+
+                fragment_file = self.fragment_cache.temp_path(key)
+                torchaudio.save(fragment_file, wav.unsqueeze(0), 24000)
+                self.fragment_cache.put(key, fragment_params, fragment_file, move=True)
+            wavs.append(wav)
+
+        wav = self.crossfade_concat(wavs)
+        torchaudio.save(output_file, wav.unsqueeze(0), 24000)
+
+        self.fragment_seconds += cached_samples / 24000
+        self.generated_seconds += wav.shape[0] / 24000
+
         generate_end_time = time.time()  # Record the time to generate TTS
         generate_elapsed_time = generate_end_time - generate_start_time
 
-        logger.info(f"Processing time: {generate_elapsed_time:.2f} seconds.")
+        # Only the synthesized sentences say something about the speed
+        self.realtime_factor.observe(synthesized_chars, (wav.shape[0] - cached_samples) / 24000, generate_elapsed_time)
+
+        logger.info(f"Processing time: {generate_elapsed_time:.2f} seconds, {cached_samples / 24000:.2f}s of audio from cached sentences.")
+
+    def yield_to_urgent_work(self):
+        # In lowvram mode the paused work holds the model on the GPU, the urgent work would move it back
+        if self.preemption_point is not None and not self.lowvram:
+            self.preemption_point()
+
+    def local_generation(self,text,speaker_name,speaker_wav,language,accent,output_file,params):
+        if self.enable_sentence_cache:
+            return self.fragment_generation(text,speaker_name,speaker_wav,language,accent,output_file,params)
 
-    def local_generation(self,text,speaker_name,speaker_wav,language,accent,output_file):
         # Log time
         generate_start_time = time.time()  # Record the start time of loading the model
 
         gpt_cond_latent, speaker_embedding = self.get_or_create_latents(speaker_name, speaker_wav, language)
 
-        out = self.model.inference(
-            text,
-            accent,
-            gpt_cond_latent=gpt_cond_latent,
-            speaker_embedding=speaker_embedding,
-            **self.tts_settings, # Expands the object with the settings and applies them for generation
-        )
-
-        torchaudio.save(output_file, torch.tensor(out["wav"]).unsqueeze(0), 24000)
+        # Sentence by sentence like Xtts.inference does with text splitting, pausing in between for more urgent work
+        tts_settings = params.tts_settings
+        sentences = split_text(self.model, text, accent, tts_settings.pop("enable_text_splitting", False))
+        wavs = []
+        for index, sentence in enumerate(sentences):
+            if index > 0:
+                self.yield_to_urgent_work()
+            out = self.model.inference(
+                sentence,
+                accent,
+                gpt_cond_latent=gpt_cond_latent,
+                speaker_embedding=speaker_embedding,
+                enable_text_splitting=False,
+                **tts_settings, # Expands the object with the settings and applies them for generation
+            )
+            wavs.append(torch.as_tensor(out["wav"]))
+        wav = torch.cat(wavs, dim=0)
+
+        torchaudio.save(output_file, wav.unsqueeze(0), 24000)
 
         generate_end_time = time.time()  # Record the time to generate TTS
         generate_elapsed_time = generate_end_time - generate_start_time
+        self.realtime_factor.observe(len(text), wav.shape[0] / 24000, generate_elapsed_time)
 
         logger.info(f"Processing time: {generate_elapsed_time:.2f} seconds.")
 
+    def local_generation_batch(self, jobs):
+        """
+        local_generation for several requests ([(text, speaker_name, speaker_wav, language, accent,
+        output_file, params)]). Their sentences go through the GPT stage together, sorted by length
+        and taken `len(jobs)` at a time, so a batch holds sentences of similar length (it runs as
+        long as its longest), possibly several of one request. Every sentence is generated with
+        the settings of its own request.
+        """
+        # Log time
+        generate_start_time = time.time()  # Record the start time of loading the model
+
+        gpt_cond_latents, speaker_embeddings = self.get_or_create_latents_batch([(speaker_name, speaker_wav, language) for _, speaker_name, speaker_wav, language, _, _, _ in jobs])
+
+        rows = [] # (job index, sentence index, sentence, accent)
+        for job_index, (text, _, _, _, accent, _, params) in enumerate(jobs):
+            for sentence_index, sentence in enumerate(split_text(self.model, text, accent, params.enable_text_splitting)):
+                rows.append((job_index, sentence_index, sentence, accent))
+        rows.sort(key=lambda row: len(row[2]))
+
+        wavs = [{} for _ in jobs]
+        for start in range(0, len(rows), len(jobs)):
+            if start > 0:
+                self.yield_to_urgent_work()
+            chunk = rows[start:start + len(jobs)]
+            chunk_wavs = generate_batch(self.model, [(sentence, accent, gpt_cond_latents[job_index:job_index + 1], speaker_embeddings[job_index:job_index + 1], jobs[job_index][6].tts_settings)
+                                                     for job_index, _, sentence, accent in chunk])
+            for (job_index, sentence_index, _, _), wav in zip(chunk, chunk_wavs):
+                wavs[job_index][sentence_index] = wav
+
+        total_samples = 0
+        for (_, _, _, _, _, output_file, _), sentence_wavs in zip(jobs, wavs):
+            wav = torch.cat([sentence_wavs[index] for index in sorted(sentence_wavs)], dim=0)
+            torchaudio.save(output_file, wav.unsqueeze(0), 24000)
+            total_samples += wav.shape[0]
+
+        generate_end_time = time.time()  # Record the time to generate TTS
+        generate_elapsed_time = generate_end_time - generate_start_time
+        self.realtime_factor.observe(sum(len(job[0]) for job in jobs), total_samples / 24000, generate_elapsed_time)
+
+        logger.info(f"Processing time: {generate_elapsed_time:.2f} seconds for a batch of {len(jobs)} requests.")
+
     def api_generation(self,text,speaker_wav,language,accent,output_file):
         self.model.tts_to_file(
                 text=text,
@@ -706,120 +1411,175 @@ class TTSWrapper:
 
     def get_speaker_wav(self, speaker_name_or_path, language_code):
         """Gets the speaker_wav(s) for a given speaker name considering the language."""
-        base_path = os.path.join(self.speaker_folder, language_code)  # Adjust the path to include the language code
+        # A file name or a speaker name, both are looked up in the language folder
+        speaker = self.speaker_registry.speaker(speaker_name_or_path, language_code)
+        if speaker is None and self.speaker_registry.refresh():
+            speaker = self.speaker_registry.speaker(speaker_name_or_path, language_code)
+        if speaker is None:
+            raise ValueError(f"Speaker {speaker_name_or_path} not found in language folder '{language_code}'.")
+        speaker_wav = speaker['speaker_wav']
 
-        if speaker_name_or_path.endswith('.wav'):
-            # If it's a file name
-            speaker_wav = os.path.join(base_path, speaker_name_or_path)  # Adjust to look inside the language-specific folder
-        else:
-            # If it's a speaker name
-            full_path = os.path.join(base_path, speaker_name_or_path)
-            wav_files = [os.path.join(full_path, f) for f in os.listdir(full_path) if f.endswith('.wav')]
-            if not wav_files:
-                raise ValueError(f"Speaker {speaker_name_or_path} not found in language folder '{language_code}'.")
-            speaker_wav = wav_files if len(wav_files) > 1 else wav_files[0]
-
-        return speaker_wav
+        return speaker_wav[0] if isinstance(speaker_wav, list) and len(speaker_wav) == 1 else speaker_wav
 
     # MAIN FUNC
-    def process_tts_to_file(self, text, speaker_name_or_path, language, accent=None, file_name_or_path="out.wav", stream=False):
+    def prepare_synthesis(self, text, speaker_name_or_path, language, accent=None, file_name_or_path="out.wav", params=None):
+        """
+        Resolves a request before generation: the reference audio of the speaker, the output
+        file and the cache entry. Returns (clear_text, speaker_wav, accent, output_file,
+        text_params, cached_result), cached_result is None when the audio has to be generated.
+        A cached result is copied to an absolute `file_name_or_path` and returned as that path.
+        `params` are the SynthesisParams of the request, the current defaults when None.
+        """
         if file_name_or_path == '' or file_name_or_path is None:
             file_name_or_path = "out.wav"
-        try:
-            # Normalize speaker name and ensure language code is in lower case for consistency
-            speaker_name = speaker_name_or_path.lower()
-            language_code = language.lower()
+        # Normalize speaker name and ensure language code is in lower case for consistency
+        speaker_name = speaker_name_or_path.lower()
+        language_code = language.lower()
+
+        accent = language if accent is None else accent
+
+        registry = self.speaker_registry
+        if (self.get_latent_path(speaker_name, language_code) is None and registry.speaker(speaker_name, language_code) is None
+                and speaker_name_or_path not in registry.models):
+            # Added since the watcher last looked, a refresh only lists the folders whose mtime changed
+            registry.refresh()
+
+        speaker_wav = None
+        # Check if the speaker's latents exist in the latent speaker folder within the specific language subdirectory
+        if self.get_latent_path(speaker_name, language_code) is not None:
+            # Load latent directly without needing a .wav file
+            speaker_wav = "out.wav"
+            logger.info(f"Using stored latents for {speaker_name} in {language_code}")
+        else:
+            # Check speaker_name_or_path in speakers_folder and models_folder
+            if self.speaker_registry.speaker(speaker_name, language_code) is not None:
+                speaker_wav = self.get_speaker_wav(speaker_name_or_path, language_code)
+            elif speaker_name_or_path in self.speaker_registry.models:
+                reference_wav = self.speaker_registry.models[speaker_name_or_path]
+                if reference_wav is not None:
+                    speaker_wav = reference_wav
+                else:
+                    logger.info(f"No 'reference.wav' found in {Path(self.model_folder) / speaker_name_or_path}")
+            else:
+                raise ValueError(f"Speaker path '{speaker_name_or_path}' not found in speakers or models folder.")
+        # Determine output path based on whether a full path or a file name was provided
+        if os.path.isabs(file_name_or_path):
+            # An absolute path was provided by user; use as is.
+            output_file = file_name_or_path
+        else:
+            # Only a filename was provided; prepend with output folder.
+            output_file = os.path.join(self.output_folder, file_name_or_path)
 
-            accent = language if accent is None else accent
+        clear_text = self.prepare_text(text)
 
-            # Adjusted path for JSON file in the latent speaker folder to include language
-            speaker_json_directory = Path(self.latent_speaker_folder) / language_code
-            speaker_json_path = speaker_json_directory / f"{speaker_name}.json"
+        # Generate a dictionary of the parameters to use for caching.
+        text_params = self.get_cache_params(clear_text, speaker_name_or_path, language, accent, params)
 
-            # Check if the speaker's JSON exists in the latent speaker folder within the specific language subdirectory
-            if speaker_json_path.exists():
-                # Load latent directly without needing a .wav file
-                speaker_wav = "out.wav"
-                logger.info(f"Using latents from JSON for {speaker_name} in {language_code}")
-            else:
-                # Check speaker_name_or_path in models_folder and speakers_folder
-                speaker_path_models_folder = Path(self.model_folder) / speaker_name_or_path
-                speaker_path_speakers_folder = Path(self.speaker_folder) / language_code / speaker_name
-                speaker_path_speakers_file = speaker_path_speakers_folder.with_suffix('.wav')
-            
-                # Check if the .wav file exists or if the directory exists for the speaker
-                if speaker_path_speakers_folder.is_dir() or speaker_path_speakers_file.exists():
-                    speaker_wav = self.get_speaker_wav(speaker_name_or_path, language)
-                elif speaker_path_models_folder.is_dir():
-                    reference_wav = speaker_path_models_folder / "reference.wav"
-                    if reference_wav.exists():
-                        speaker_wav = str(reference_wav)
-                    else:
-                        logger.info(f"No 'reference.wav' found in {speaker_path_models_folder}")
-                else:
-                    raise ValueError(f"Speaker path '{speaker_name_or_path}' not found in speakers or models folder.")
-            # Determine output path based on whether a full path or a file name was provided
-            if os.path.isabs(file_name_or_path):
-                # An absolute path was provided by user; use as is.
-                output_file = file_name_or_path
-            else:
-                # Only a filename was provided; prepend with output folder.
-                output_file = os.path.join(self.output_folder, file_name_or_path)
-
-
-            # Check if 'text' is a valid path to a '.txt' file.
-            if os.path.isfile(text) and text.lower().endswith('.txt'):
-                with open(text, 'r', encoding='utf-8') as f:
-                    text = f.read()
-
-            # Generate unic name for cached result
-            if self.enable_cache_results:
-                timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                file_name_or_path = timestamp + "_cache_" + file_name_or_path
-                output_file = os.path.join(self.output_folder, file_name_or_path)
-
-            # Replace double quotes with single, asterisks, carriage returns, and line feeds
-            clear_text = self.clean_text(text)
-
-            # Generate a dictionary of the parameters to use for caching.
-            text_params = {
-              'text': clear_text,
-              'speaker_name_or_path': speaker_name_or_path,
-              'language': language,
-              'accent': accent,
-              'file_name_or_path': file_name_or_path
-            }
+        # Check if results are already cached.
+        cached_result = self.check_cache(text_params)
+
+        # A path the user asked for gets a copy of the cached result, like update_cache leaves one there
+        if cached_result is not None and os.path.isabs(file_name_or_path):
+            shutil.copyfile(cached_result, output_file)
+            cached_result = output_file
+
+        # Generate straight into the cache unless the user asked for a specific path
+        if cached_result is None and self.enable_cache_results and not os.path.isabs(file_name_or_path):
+            output_file = self.audio_cache.temp_path(make_cache_key(text_params))
 
-            # Check if results are already cached.
-            cached_result = self.check_cache(text_params)
+        return clear_text, speaker_wav, accent, output_file, text_params, cached_result
+
+    def process_tts_to_file(self, text, speaker_name_or_path, language, accent=None, file_name_or_path="out.wav", stream=False, params=None):
+        try:
+            # Settings are taken once, a change of the defaults halfway does not mix into this request
+            params = params or self.synthesis_params()
+            clear_text, speaker_wav, accent, output_file, text_params, cached_result = self.prepare_synthesis(
+                text, speaker_name_or_path, language, accent, file_name_or_path, params)
 
             if cached_result is not None:
                 logger.info("Using cached result.")
+                if stream:
+                    return self.stream_cached_audio(cached_result)
                 return cached_result  # Return the path to the cached result.
 
-            self.switch_model_device() # Load to CUDA if lowram ON
-
             # Define generation if model via api or locally
-            if self.model_source == "local":
-                if stream:
-                    async def stream_fn():
-                        async for chunk in self.stream_generation(clear_text,speaker_name_or_path,speaker_wav,language,accent,output_file):
-                            yield chunk
+            if self.model_source == "local" and stream:
+                def stream_fn():
+                    # Background latent jobs wait until the stream is done
+                    with self.priority_gate.foreground_work(exclusive=self.lowvram), self.model_lock:
+                        self.switch_model_device() # Load to CUDA if lowram ON
+                        yield from self.stream_generation(clear_text,speaker_name_or_path,speaker_wav,language,accent,output_file,params)
                         self.switch_model_device()
-                        # After generation completes successfully...
-                        self.update_cache(text_params,output_file)
-                    return stream_fn()
+                    # After generation completes successfully...
+                    self.update_cache(text_params,output_file)
+                return stream_fn()
+
+            # Background latent jobs wait until the generation is done
+            with self.priority_gate.foreground_work(exclusive=self.lowvram), self.model_lock:
+                self.switch_model_device() # Load to CUDA if lowram ON
+
+                if self.model_source == "local":
+                    self.local_generation(clear_text,speaker_name_or_path,speaker_wav,language,accent,output_file,params)
                 else:
-                    self.local_generation(clear_text,speaker_name_or_path,speaker_wav,language,accent,output_file)
-            else:
-                self.api_generation(clear_text,speaker_wav,language,accent,output_file)
-            
-            self.switch_model_device() # Unload to CPU if lowram ON
+                    self.api_generation(clear_text,speaker_wav,language,accent,output_file)
+
+                self.switch_model_device() # Unload to CPU if lowram ON
 
             # After generation completes successfully...
-            self.update_cache(text_params,output_file)
-            return output_file
+            return self.update_cache(text_params,output_file)
 
         except Exception as e:
             raise e  # Propagate exceptions for endpoint handling.
 
+    def process_tts_to_file_batch(self, requests):
+        """
+        process_tts_to_file for several requests ([{text, speaker_name_or_path, language, accent,
+        file_name_or_path, params}]) whose GPT stage runs as one batch, each with its own settings.
+        Returns one result per request, the output path or the exception it failed with.
+        """
+        results = [None] * len(requests)
+        jobs = [] # (index, text_params, generation args)
+        for index, request in enumerate(requests):
+            try:
+                params = request.get("params") or self.synthesis_params()
+                clear_text, speaker_wav, accent, output_file, text_params, cached_result = self.prepare_synthesis(**{**request, "params": params})
+            except Exception as e:
+                results[index] = e
+                continue
+            if cached_result is not None:
+                logger.info("Using cached result.")
+                results[index] = cached_result
+            else:
+                jobs.append((index, text_params, (clear_text, request["speaker_name_or_path"], speaker_wav, request["language"], accent, output_file, params)))
+
+        if not jobs:
+            return results
+        # Cached sentences are stitched per request, that path is not batched
+        if self.enable_sentence_cache or len(jobs) == 1:
+            for index, text_params, args in jobs:
+                try:
+                    with self.priority_gate.foreground_work(exclusive=self.lowvram), self.model_lock:
+                        self.switch_model_device() # Load to CUDA if lowram ON
+                        self.local_generation(*args)
+                        self.switch_model_device() # Unload to CPU if lowram ON
+                    results[index] = self.update_cache(text_params, args[5])
+                except Exception as e:
+                    results[index] = e
+            return results
+
+        # Background latent jobs wait until the generation is done
+        with self.priority_gate.foreground_work(exclusive=self.lowvram), self.model_lock:
+            self.switch_model_device() # Load to CUDA if lowram ON
+            try:
+                self.local_generation_batch([args for _, _, args in jobs])
+            except Exception as e:
+                for index, _, _ in jobs:
+                    results[index] = e
+                return results
+            finally:
+                self.switch_model_device() # Unload to CPU if lowram ON
+
+        # After generation completes successfully...
+        for index, text_params, args in jobs:
+            results[index] = self.update_cache(text_params, args[5])
+        return results